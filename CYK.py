@@ -6,45 +6,195 @@
 
 import time
 import sys
-from typing import Dict, Set, List, Tuple, Optional
-from collections import defaultdict
-from itertools import combinations
-import copy
+import math
+import heapq
+from bisect import bisect_right
+import os
+import json
+import re
+import argparse
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, Set, List, Tuple, Optional, Iterable, Iterator, Sequence
+from collections import defaultdict, OrderedDict
+from types import MappingProxyType
+from itertools import combinations, islice
+import hashlib
+import io
+
+# NumPy es opcional: solo lo usa el motor 'numpy' de CYKParser
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 # Clase que representa una gramática libre de contexto
+# Los lados derechos se guardan como tuplas de símbolos internados: son inmutables, así que
+# se comparten entre la gramática original, sus copias y la gramática en CNF
 class Grammar:
+    # Marcadores de epsilon y terminales especiales de la heurística de add_production
+    EPSILON_SYMBOLS = frozenset(['e', 'ε', 'EPSILON', ''])
+    SPECIAL_TERMINALS = frozenset(['a', 'the', '(', ')', '+', '*', '-', '/', 'id'])
+
     def __init__(self):
-        self.productions = defaultdict(list)
+        self.productions: Dict[str, List[Tuple[str, ...]]] = defaultdict(list)
         self.terminals = set()
         self.non_terminals = set()
         self.start_symbol = 'S'
+
+        # Pesos (probabilidades) de las producciones: (lhs, tupla rhs) -> peso.
+        # Solo se guardan los pesos explícitos; una producción sin peso vale 1.0
+        self.weights: Dict[Tuple[str, Tuple[str, ...]], float] = {}
+
+        # Terminales declarados explícitamente (%terminals en el archivo). Si hay alguno, son
+        # los únicos terminales; si no, se decide con la heurística de add_production
+        self.declared_terminals: Set[str] = set()
+
+        # No-terminales auxiliares que agregó CNFConverter (X1, X2, ...); no son categorías
+        # de la gramática original
+        self.generated_non_terminals: Set[str] = set()
+
+        # Copy-on-write: listas de producciones y diccionario de pesos que se comparten con
+        # otra copia. add_production los copia antes de su primera escritura
+        self._shared_lists: Set[str] = set()
+        self._shared_weights = False
     
-    # Agrega una producción a la gramática
-    def add_production(self, lhs: str, rhs: List[str]):
+    # Declara terminales: desde ese momento todo símbolo no declarado es no-terminal.
+    # Los símbolos de las producciones ya agregadas se reclasifican (un símbolo que tiene
+    # producciones sigue siendo no-terminal aunque se declare)
+    def declare_terminals(self, symbols: Iterable[str]):
+        self.declared_terminals.update(symbols)
+        seen = self.terminals | self.non_terminals
+        self.terminals = {symbol for symbol in seen
+                          if symbol in self.declared_terminals and symbol not in self.productions}
+        self.non_terminals = seen - self.terminals
+
+    # Agrega una producción a la gramática, opcionalmente con su peso
+    def add_production(self, lhs: str, rhs: Sequence[str], weight: Optional[float] = None):
+        lhs = sys.intern(lhs)
+        rhs = tuple(map(sys.intern, rhs))
+        if lhs in self._shared_lists:
+            self._shared_lists.discard(lhs)
+            self.productions[lhs] = list(self.productions[lhs])
         self.productions[lhs].append(rhs)
         self.non_terminals.add(lhs)
 
+        if weight is not None:
+            if self._shared_weights:
+                self._shared_weights = False
+                self.weights = dict(self.weights)
+            key = (lhs, rhs)
+            self.weights[key] = max(weight, self.weights.get(key, weight))
+
         for symbol in rhs:
-            if symbol in ['e', 'ε', 'EPSILON', '']:
+            if symbol in self.EPSILON_SYMBOLS:
                 continue     
 
-            if symbol.islower() or symbol in ['a', 'the', '(', ')', '+', '*', '-', '/', 'id']:
+            if self.declared_terminals:
+                is_terminal = symbol in self.declared_terminals and symbol not in self.productions
+            else:
+                is_terminal = symbol.islower() or symbol in self.SPECIAL_TERMINALS
+            if is_terminal:
                 self.terminals.add(symbol)
             else:
                 self.non_terminals.add(symbol)
     
+    # Peso de una producción (1.0 si no tiene peso explícito)
+    def weight(self, lhs: str, rhs: Sequence[str]) -> float:
+        return self.weights.get((lhs, tuple(rhs)), 1.0)
+
+    # Copia copy-on-write: los conjuntos de símbolos se copian, pero las listas de
+    # producciones, las tuplas y los pesos se comparten hasta que alguna de las dos
+    # gramáticas agrega una producción con add_production, que copia antes de escribir.
+    # Quien modifique productions o weights directamente debe reemplazarlos, como CNFConverter
+    def copy(self) -> 'Grammar':
+        other = Grammar()
+        other.productions = defaultdict(list, self.productions)
+        self._shared_lists.update(self.productions)
+        other._shared_lists = set(self.productions)
+        other.terminals = set(self.terminals)
+        other.non_terminals = set(self.non_terminals)
+        other.start_symbol = self.start_symbol
+        other.weights = self.weights
+        self._shared_weights = other._shared_weights = True
+        other.declared_terminals = set(self.declared_terminals)
+        other.generated_non_terminals = set(self.generated_non_terminals)
+        return other
+
+    # Datos simples para guardar en JSON (ver save_compiled_grammar)
+    def to_dict(self) -> dict:
+        return {'start_symbol': self.start_symbol,
+                'productions': {lhs: [list(rhs) for rhs in productions]
+                                for lhs, productions in self.productions.items()},
+                'terminals': sorted(self.terminals),
+                'non_terminals': sorted(self.non_terminals),
+                'weights': [[lhs, list(rhs), weight] for (lhs, rhs), weight in self.weights.items()],
+                'declared_terminals': sorted(self.declared_terminals),
+                'generated_non_terminals': sorted(self.generated_non_terminals)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Grammar':
+        intern = sys.intern
+        grammar = cls()
+        grammar.start_symbol = intern(data['start_symbol'])
+        for lhs, productions in data['productions'].items():
+            grammar.productions[intern(lhs)] = [tuple(map(intern, rhs)) for rhs in productions]
+        grammar.terminals = set(map(intern, data['terminals']))
+        grammar.non_terminals = set(map(intern, data['non_terminals']))
+        grammar.weights = {(intern(lhs), tuple(map(intern, rhs))): weight for lhs, rhs, weight in data['weights']}
+        grammar.declared_terminals = set(data['declared_terminals'])
+        grammar.generated_non_terminals = set(data['generated_non_terminals'])
+        return grammar
+
     #Imprime la gramática de forma legible
     def print_grammar(self):
         for lhs in sorted(self.productions.keys()):
             for rhs in self.productions[lhs]:
-                print(f"{lhs} -> {' '.join(rhs)}")
+                if self.weights:
+                    print(f"{lhs} -> {' '.join(rhs)} [{self.weight(lhs, rhs):g}]")
+                else:
+                    print(f"{lhs} -> {' '.join(rhs)}")
+
+# Función que recibe métricas: metrics(evento, datos). CNFConverter emite 'cnf_step' por
+# cada paso y 'cnf' al terminar; CYKParser emite 'parse' por cada frase. Sin receptor no
+# se mide nada: las estadísticas de la tabla solo se calculan si hay alguien escuchando
+MetricsHook = Callable[[str, dict], None]
+
+
+# Receptor de métricas sencillo: guarda los eventos en orden para inspeccionarlos o exportarlos
+class MetricsRecorder:
+    def __init__(self):
+        self.events: List[Tuple[str, dict]] = []
+
+    def __call__(self, event: str, data: dict):
+        self.events.append((event, data))
+
+    # Datos de todos los eventos con ese nombre
+    def by_event(self, event: str) -> List[dict]:
+        return [data for name, data in self.events if name == event]
+
+    def clear(self):
+        self.events.clear()
+
 
 # Convierte una gramatica CFG a Forma Normal de Chomsky
 class CNFConverter:
-    def __init__(self, grammar: Grammar):
-        self.grammar = copy.deepcopy(grammar)
+    # metrics: receptor de métricas (ver MetricsHook) con el tiempo de cada paso
+    # La gramática recibida no se modifica: cada paso construye producciones y pesos nuevos
+    # (reutilizando las tuplas que no cambian), así que basta una copia superficial
+    def __init__(self, grammar: Grammar, metrics: Optional[MetricsHook] = None):
+        self.grammar = grammar.copy()
         self.new_non_terminal_counter = 0
+        self.generated_non_terminals: Set[str] = set()
+        self.verbose = True
+        self.metrics = metrics
+
+        # Con una gramática ponderada cada paso reconstruye también los pesos: las reglas
+        # derivadas reciben el mejor producto (max-product) de las reglas que reemplazan
+        self.weighted = bool(self.grammar.weights)
     
     #Verifica si la gramática ya cumple con las reglas de CNF
     def is_in_cnf(self) -> bool:
@@ -65,283 +215,481 @@ class CNFConverter:
         return True
     
     #Convierte la gramática a CNF ejecutando los 5 pasos
-    def convert_to_cnf(self) -> Grammar:
-        print("\nIniciando conversión a Forma Normal de Chomsky (CNF)...")
-        print("=" * 70)
+    # Con verbose=False no se imprime el detalle de cada paso
+    # Con minimize=True se agrega un paso final que fusiona no-terminales auxiliares equivalentes
+    # Los pesos de las producciones se conservan: ver _eliminate_epsilon_productions y
+    # _eliminate_unit_productions para las reglas derivadas
+    # Con binarize_first=True las producciones largas se rompen ANTES de eliminar epsilon
+    # (BIN antes que DEL): así cada regla tiene a lo sumo 2 símbolos anulables y la
+    # eliminación de epsilon genera a lo sumo 3 variantes por regla, en lugar de 2^k
+    def convert_to_cnf(self, verbose: bool = True, minimize: bool = True,
+                       binarize_first: bool = True) -> Grammar:
+        self.verbose = verbose
+        start_ns = time.perf_counter_ns()
+        self._log("\nIniciando conversión a Forma Normal de Chomsky (CNF)...")
+        self._log("=" * 70)
+
+        if binarize_first:
+            steps = [self._useless_step, self._break_long_step, self._epsilon_step,
+                     self._unit_step, self._replace_terminals_step]
+        else:
+            steps = [self._useless_step, self._epsilon_step, self._unit_step,
+                     self._replace_terminals_step, self._break_long_step]
+
+        for number, step in enumerate(steps, 1):
+            self._run_step(step.__name__[1:-len('_step')], number, step, number)
+            self._log(f"\n   Gramática después del Paso {number}:")
+            self._print_grammar_compact()
+
+        # Paso adicional: fusionar no-terminales auxiliares con las mismas producciones
+        if minimize:
+            self._log("\nMINIMIZACIÓN: Fusionando no-terminales equivalentes...")
+            self._log("-" * 70)
+
+            merged = self._run_step('minimize', len(steps) + 1, self._merge_equivalent_non_terminals)
+
+            if merged == 0:
+                self._log("   ✓ No se encontraron no-terminales equivalentes")
+            else:
+                self._log(f"   ✓ Se fusionaron {merged} no-terminales")
+                self._log("\n   Gramática después de la minimización:")
+                self._print_grammar_compact()
         
-        # Paso 1: Eliminar símbolos inútiles
-        print("\nPASO 1: Eliminando símbolos inútiles (Useless)...")
-        print("-" * 70)
+        self._log("\n" + "=" * 70)
+        self._log("Conversión a CNF completada exitosamente")
+        self._log("=" * 70)
+
+        self.grammar.generated_non_terminals |= self.generated_non_terminals
+
+        if self.metrics is not None:
+            self.metrics('cnf', {'ns': time.perf_counter_ns() - start_ns,
+                                 'productions': self._production_count(),
+                                 'non_terminals': len(self.grammar.non_terminals)})
+        
+        return self.grammar
+
+    # Ejecuta un paso de la conversión; con receptor de métricas mide su tiempo y cuántas
+    # producciones y no-terminales había antes y después
+    def _run_step(self, name: str, number: int, function, *args):
+        if self.metrics is None:
+            return function(*args)
+
+        productions_before = self._production_count()
+        non_terminals_before = len(self.grammar.non_terminals)
+        start_ns = time.perf_counter_ns()
+        result = function(*args)
+        elapsed_ns = time.perf_counter_ns() - start_ns
+        self.metrics('cnf_step', {'step': number, 'name': name, 'ns': elapsed_ns,
+                                  'productions_before': productions_before,
+                                  'productions_after': self._production_count(),
+                                  'non_terminals_before': non_terminals_before,
+                                  'non_terminals_after': len(self.grammar.non_terminals)})
+        return result
+
+    # Cantidad total de producciones de la gramática en conversión
+    def _production_count(self) -> int:
+        return sum(len(prods) for prods in self.grammar.productions.values())
+
+    # Paso: eliminar símbolos inútiles
+    def _useless_step(self, number: int):
+        self._log(f"\nPASO {number}: Eliminando símbolos inútiles (Useless)...")
+        self._log("-" * 70)
         initial_non_terminals = len(self.grammar.non_terminals)
-        initial_productions = sum(len(prods) for prods in self.grammar.productions.values())
+        initial_productions = self._production_count()
         
         self._eliminate_useless_symbols()
         
         final_non_terminals = len(self.grammar.non_terminals)
-        final_productions = sum(len(prods) for prods in self.grammar.productions.values())
+        final_productions = self._production_count()
         
-        print(f"   No-terminales: {initial_non_terminals} → {final_non_terminals}")
-        print(f"   Producciones: {initial_productions} → {final_productions}")
+        self._log(f"   No-terminales: {initial_non_terminals} → {final_non_terminals}")
+        self._log(f"   Producciones: {initial_productions} → {final_productions}")
         
         if initial_non_terminals == final_non_terminals:
-            print("   ✓ No se encontraron símbolos inútiles")
+            self._log("   ✓ No se encontraron símbolos inútiles")
         else:
-            print(f"   ✓ Se eliminaron {initial_non_terminals - final_non_terminals} símbolos")
-        
-        print("\n   Gramática después del Paso 1:")
-        self._print_grammar_compact()
-        
-        # Paso 2: Eliminar producciones epsilon (anulables)
-        print("\nPASO 2: Eliminando producciones epsilon/anulables (ε)...")
-        print("-" * 70)
-        initial_productions = sum(len(prods) for prods in self.grammar.productions.values())
+            self._log(f"   ✓ Se eliminaron {initial_non_terminals - final_non_terminals} símbolos")
+
+    # Paso: eliminar producciones epsilon (anulables)
+    def _epsilon_step(self, number: int):
+        self._log(f"\nPASO {number}: Eliminando producciones epsilon/anulables (ε)...")
+        self._log("-" * 70)
+        initial_productions = self._production_count()
         
         epsilon_found = self._eliminate_epsilon_productions()
         
-        final_productions = sum(len(prods) for prods in self.grammar.productions.values())
+        final_productions = self._production_count()
         
         if not epsilon_found:
-            print("   ✓ No se encontraron producciones epsilon")
+            self._log("   ✓ No se encontraron producciones epsilon")
         else:
-            print(f"   ✓ Producciones epsilon eliminadas")
-            print(f"   Producciones: {initial_productions} → {final_productions}")
-        
-        print("\n   Gramática después del Paso 2:")
-        self._print_grammar_compact()
-        
-        # Paso 3: Eliminar producciones unitarias
-        print("\nPASO 3: Eliminando producciones unitarias (A -> B)...")
-        print("-" * 70)
-        initial_productions = sum(len(prods) for prods in self.grammar.productions.values())
+            self._log(f"   ✓ Producciones epsilon eliminadas")
+            self._log(f"   Producciones: {initial_productions} → {final_productions}")
+
+    # Paso: eliminar producciones unitarias
+    def _unit_step(self, number: int):
+        self._log(f"\nPASO {number}: Eliminando producciones unitarias (A -> B)...")
+        self._log("-" * 70)
+        initial_productions = self._production_count()
         
         unit_count = self._eliminate_unit_productions()
         
-        final_productions = sum(len(prods) for prods in self.grammar.productions.values())
+        final_productions = self._production_count()
         
         if unit_count == 0:
-            print("   ✓ No se encontraron producciones unitarias")
+            self._log("   ✓ No se encontraron producciones unitarias")
         else:
-            print(f"   ✓ Se eliminaron {unit_count} producciones unitarias")
-            print(f"   Producciones: {initial_productions} → {final_productions}")
-        
-        print("\n   Gramática después del Paso 3:")
-        self._print_grammar_compact()
-        
-        # Paso 4: Reemplazar terminales en producciones binarias
-        print("\nPASO 4: Reemplazando terminales en producciones binarias...")
-        print("-" * 70)
+            self._log(f"   ✓ Se eliminaron {unit_count} producciones unitarias")
+            self._log(f"   Producciones: {initial_productions} → {final_productions}")
+
+    # Paso: reemplazar terminales en producciones binarias
+    def _replace_terminals_step(self, number: int):
+        self._log(f"\nPASO {number}: Reemplazando terminales en producciones binarias...")
+        self._log("-" * 70)
         
         terminals_replaced = self._replace_terminals_in_long_productions()
         
         if terminals_replaced == 0:
-            print("   ✓ No se requirieron reemplazos de terminales")
+            self._log("   ✓ No se requirieron reemplazos de terminales")
         else:
-            print(f"   ✓ Se crearon {terminals_replaced} nuevos no-terminales para terminales")
-        
-        print("\n   Gramática después del Paso 4:")
-        self._print_grammar_compact()
-        
-        # Paso 5: Romper producciones largas
-        print("\nPASO 5: Rompiendo producciones largas (A -> BCD)...")
-        print("-" * 70)
+            self._log(f"   ✓ Se reemplazaron {terminals_replaced} terminales por no-terminales")
+
+    # Paso: romper producciones largas
+    def _break_long_step(self, number: int):
+        self._log(f"\nPASO {number}: Rompiendo producciones largas (A -> BCD)...")
+        self._log("-" * 70)
         
         long_broken = self._break_long_productions()
         
         if long_broken == 0:
-            print("   ✓ No se encontraron producciones largas")
+            self._log("   ✓ No se encontraron producciones largas")
         else:
-            print(f"   ✓ Se rompieron {long_broken} producciones largas")
-        
-        print("\n   Gramática después del Paso 5:")
-        self._print_grammar_compact()
-        
-        print("\n" + "=" * 70)
-        print("Conversión a CNF completada exitosamente")
-        print("=" * 70)
-        
-        return self.grammar
+            self._log(f"   ✓ Se rompieron {long_broken} producciones largas")
     
+    # Imprime un mensaje de progreso solo en modo detallado
+    def _log(self, *args):
+        if self.verbose:
+            print(*args)
+
     #Imprime la gramática de forma compacta
     def _print_grammar_compact(self):
+        if not self.verbose:
+            return
         for lhs in sorted(self.grammar.productions.keys()):
             alternatives = []
             for rhs in self.grammar.productions[lhs]:
                 alternatives.append(' '.join(rhs) if rhs else 'ε')
             print(f"   {lhs} -> {' | '.join(alternatives)}")
     
-    #Genera un nuevo no-terminal único
+    #Genera un nuevo no-terminal único (sin chocar con los de la gramática original)
     def _get_new_non_terminal(self) -> str:
         self.new_non_terminal_counter += 1
-        return f"X{self.new_non_terminal_counter}"
+        name = f"X{self.new_non_terminal_counter}"
+        while name in self.grammar.non_terminals or name in self.grammar.productions:
+            self.new_non_terminal_counter += 1
+            name = f"X{self.new_non_terminal_counter}"
+        self.generated_non_terminals.add(name)
+        return name
     
+    # Indica si una producción es epsilon (vacía o con el marcador e/ε/EPSILON)
+    @staticmethod
+    def _is_epsilon_production(rhs: List[str]) -> bool:
+        return len(rhs) == 0 or (len(rhs) == 1 and rhs[0] in ['e', 'ε', 'EPSILON', ''])
+
+    # Calcula el menor punto fijo de "lhs cumple la propiedad si todos los símbolos
+    # pendientes de alguna de sus producciones la cumplen" con una lista de trabajo.
+    # pending(rhs) devuelve los símbolos de rhs que aún deben cumplirla (o None si la
+    # producción nunca sirve). Cada regla guarda cuántas apariciones le faltan y un índice
+    # símbolo -> reglas permite actualizar solo las afectadas: tiempo lineal en la gramática
+    def _worklist_fixed_point(self, pending) -> Set[str]:
+        result = set()
+        worklist = []
+        missing = []
+        rule_lhs = []
+        occurrences = defaultdict(list)
+
+        for lhs, productions in self.grammar.productions.items():
+            for rhs in productions:
+                symbols = pending(rhs)
+                if symbols is None:
+                    continue
+                rule = len(rule_lhs)
+                rule_lhs.append(lhs)
+                missing.append(len(symbols))
+                for symbol in symbols:
+                    occurrences[symbol].append(rule)
+                if not symbols and lhs not in result:
+                    result.add(lhs)
+                    worklist.append(lhs)
+
+        while worklist:
+            symbol = worklist.pop()
+            for rule in occurrences.get(symbol, ()):
+                missing[rule] -= 1
+                if missing[rule] == 0:
+                    lhs = rule_lhs[rule]
+                    if lhs not in result:
+                        result.add(lhs)
+                        worklist.append(lhs)
+
+        return result
+
     # Elimina símbolos inútiles en dos pasos:
     def _eliminate_useless_symbols(self):
+        terminals = self.grammar.terminals
+
         # Paso 1: Encontrar símbolos productivos (que generan terminales)
-        generating = set()
-        changed = True
-        
-        while changed:
-            changed = False
-            for lhs, productions in list(self.grammar.productions.items()):
-                if lhs in generating:
-                    continue
-                    
-                for rhs in productions:
-                    # Reconoce epsilon como productivo
-                    if len(rhs) == 0 or (len(rhs) == 1 and rhs[0] in ['e', 'ε', 'EPSILON', '']):
-                        # Producción epsilon: el símbolo es productivo
-                        generating.add(lhs)
-                        changed = True
-                        break
+        # Una producción epsilon o solo con terminales hace productivo a su LHS
+        def pending_generating(rhs):
+            if self._is_epsilon_production(rhs):
+                return []
+            return [s for s in rhs if s not in terminals]
 
-                    # Verifica símbolos normales
-                    elif all(s in self.grammar.terminals or s in generating for s in rhs):
-                        generating.add(lhs)
-                        changed = True
-                        break
+        generating = self._worklist_fixed_point(pending_generating)
         
         # Eliminar producciones con símbolos no productivos
         new_productions = defaultdict(list)
-        for lhs in generating:
-            if lhs in self.grammar.productions:
-                for rhs in self.grammar.productions[lhs]:
-                    # Mantener producciones epsilon
-                    if len(rhs) == 1 and rhs[0] in ['e', 'ε', 'EPSILON', '']:
-                        new_productions[lhs].append(rhs)
-                    # Mantener producciones normales productivas
-                    elif all(s in self.grammar.terminals or s in generating for s in rhs):
-                        new_productions[lhs].append(rhs)
+        for lhs, productions in self.grammar.productions.items():
+            if lhs not in generating:
+                continue
+            for rhs in productions:
+                # Mantener producciones epsilon
+                if len(rhs) == 1 and rhs[0] in ['e', 'ε', 'EPSILON', '']:
+                    new_productions[lhs].append(rhs)
+                # Mantener producciones normales productivas
+                elif all(s in terminals or s in generating for s in rhs):
+                    new_productions[lhs].append(rhs)
         
         self.grammar.productions = new_productions
         
-        # Paso 2: Encontrar símbolos alcanzables desde S
+        # Paso 2: Encontrar símbolos alcanzables desde S (recorrido en anchura)
         reachable = {self.grammar.start_symbol}
-        changed = True
+        worklist = [self.grammar.start_symbol]
         
-        while changed:
-            changed = False
-            for lhs in list(reachable):
-                if lhs in self.grammar.productions:
-                    for rhs in self.grammar.productions[lhs]:
-                        for symbol in rhs:
-                            if symbol in self.grammar.non_terminals and symbol not in reachable:
-                                reachable.add(symbol)
-                                changed = True
+        while worklist:
+            lhs = worklist.pop()
+            for rhs in self.grammar.productions.get(lhs, ()):
+                for symbol in rhs:
+                    if symbol in self.grammar.non_terminals and symbol not in reachable:
+                        reachable.add(symbol)
+                        worklist.append(symbol)
         
         # Mantener solo símbolos alcanzables
         final_productions = defaultdict(list)
-        for lhs in reachable:
-            if lhs in self.grammar.productions:
-                final_productions[lhs] = self.grammar.productions[lhs]
+        for lhs, productions in self.grammar.productions.items():
+            if lhs in reachable:
+                final_productions[lhs] = productions
         
         self.grammar.productions = final_productions
         self.grammar.non_terminals = reachable & self.grammar.non_terminals
+        if self.weighted:
+            self.grammar.weights = {(lhs, tuple(rhs)): self.grammar.weight(lhs, rhs)
+                                    for lhs, productions in final_productions.items()
+                                    for rhs in productions}
     
     #Elimina producciones anulables (A -> ε)
     def _eliminate_epsilon_productions(self):
-        # Encontrar símbolos anulables (que pueden derivar a epsilon)
-        nullable = set()
-        changed = True
-        
-        while changed:
-            changed = False
-            for lhs, productions in self.grammar.productions.items():
-                if lhs in nullable:
-                    continue
-                    
-                for rhs in productions:
-                    # Producción epsilon directa (vacía o 'e' o 'EPSILON')
-                    if len(rhs) == 0 or (len(rhs) == 1 and rhs[0] in ['e', 'ε', 'EPSILON', '']):
-                        nullable.add(lhs)
-                        changed = True
-                        break
-                    # Todos los símbolos son no-terminales y todos son anulables
-                    elif len(rhs) > 0 and all(s in self.grammar.non_terminals for s in rhs) and all(s in nullable for s in rhs):
-                        nullable.add(lhs)
-                        changed = True
-                        break
+        non_terminals = self.grammar.non_terminals
+
+        # Encontrar símbolos anulables (que pueden derivar a epsilon): producción epsilon
+        # directa, o producción cuyos símbolos son todos no-terminales anulables
+        def pending_nullable(rhs):
+            if self._is_epsilon_production(rhs):
+                return []
+            if all(s in non_terminals for s in rhs):
+                return rhs
+            return None
+
+        nullable = self._worklist_fixed_point(pending_nullable)
         
         # Si no hay símbolos anulables, no hay nada que hacer
         if not nullable:
             return False
+
+        # Con pesos: mejor probabilidad de derivar epsilon desde cada anulable
+        empty_weights = self._empty_weights(nullable) if self.weighted else None
+        new_weights = {} if self.weighted else None
+        weight = 1.0
         
         # Generar nuevas producciones sin epsilon
         new_productions = defaultdict(list)
+        seen = defaultdict(set)
         
         for lhs, productions in self.grammar.productions.items():
             for rhs in productions:
                 # Ignorar producciones epsilon
-                if len(rhs) == 0 or (len(rhs) == 1 and rhs[0] in ['e', 'ε', 'EPSILON', '']):
+                if self._is_epsilon_production(rhs):
                     continue
+                if self.weighted:
+                    weight = self.grammar.weight(lhs, rhs)
                 
                 # Generar todas las combinaciones eliminando símbolos anulables
                 nullable_positions = [i for i, s in enumerate(rhs) if s in nullable]
                 
                 # Si no hay símbolos anulables, agregamos la producción tal cual
                 if not nullable_positions:
-                    new_productions[lhs].append(rhs)
+                    self._add_unique(new_productions, seen, lhs, rhs, new_weights, weight)
                 else:
-                    # Generar todas las combinaciones (2^n)
+                    # Generar todas las combinaciones (2^n); quitar un símbolo multiplica
+                    # el peso por su mejor probabilidad de derivar epsilon
                     for r in range(len(nullable_positions) + 1):
                         for positions_to_remove in combinations(nullable_positions, r):
-                            new_rhs = [rhs[i] for i in range(len(rhs)) if i not in positions_to_remove]
-                            if new_rhs and new_rhs not in new_productions[lhs]:
-                                new_productions[lhs].append(new_rhs)
+                            removed = set(positions_to_remove)
+                            new_rhs = tuple(rhs[i] for i in range(len(rhs)) if i not in removed)
+                            if new_rhs:
+                                variant_weight = weight
+                                if self.weighted:
+                                    for i in removed:
+                                        variant_weight *= empty_weights[rhs[i]]
+                                self._add_unique(new_productions, seen, lhs, new_rhs,
+                                                 new_weights, variant_weight)
         
         self.grammar.productions = new_productions
+        if self.weighted:
+            self.grammar.weights = new_weights
+        return True
+
+    # Mejor probabilidad (max-product) con la que cada anulable deriva epsilon. Se relaja
+    # hasta un punto fijo; con pesos <= 1 basta una ronda por anulable
+    def _empty_weights(self, nullable: Set[str]) -> Dict[str, float]:
+        candidates = [(lhs, rhs) for lhs, productions in self.grammar.productions.items()
+                      if lhs in nullable for rhs in productions
+                      if self._is_epsilon_production(rhs) or all(s in nullable for s in rhs)]
+        best: Dict[str, float] = {}
+
+        for _ in range(len(nullable) + 1):
+            changed = False
+            for lhs, rhs in candidates:
+                value = self.grammar.weight(lhs, rhs)
+                if not self._is_epsilon_production(rhs):
+                    if not all(s in best for s in rhs):
+                        continue
+                    for symbol in rhs:
+                        value *= best[symbol]
+                if value > best.get(lhs, -1.0):
+                    best[lhs] = value
+                    changed = True
+            if not changed:
+                break
+
+        return best
+
+    # Agrega una producción si no existía ya, usando un conjunto de tuplas por LHS (O(1)).
+    # Si se pasa weights, la producción se queda con el mayor peso con el que se agregó
+    @staticmethod
+    def _add_unique(productions: Dict[str, List[Tuple[str, ...]]], seen: Dict[str, Set[tuple]],
+                    lhs: str, rhs: Sequence[str], weights: Optional[dict] = None,
+                    weight: float = 1.0) -> bool:
+        key = tuple(rhs)
+        if weights is not None:
+            CNFConverter._keep_best_weight(weights, lhs, key, weight)
+        if key in seen[lhs]:
+            return False
+        seen[lhs].add(key)
+        productions[lhs].append(key)
         return True
 
+    # Guarda el peso de una producción quedándose con el mayor si ya estaba
+    @staticmethod
+    def _keep_best_weight(weights: dict, lhs: str, rhs: Sequence[str], weight: float):
+        key = (lhs, tuple(rhs))
+        if weight > weights.get(key, -1.0):
+            weights[key] = weight
+
     # Elimina producciones unitarias (A -> B donde B es no-terminal)
     def _eliminate_unit_productions(self):
-        # Contar producciones unitarias iniciales
+        non_terminals = self.grammar.non_terminals
+
+        # Grafo de producciones unitarias: A -> [B, ...]
+        unit_graph = defaultdict(list)
         unit_count = 0
         for lhs, productions in self.grammar.productions.items():
             for rhs in productions:
-                if len(rhs) == 1 and rhs[0] in self.grammar.non_terminals:
+                if len(rhs) == 1 and rhs[0] in non_terminals:
+                    unit_graph[lhs].append(rhs[0])
                     unit_count += 1
         
         if unit_count == 0:
             return 0
         
-        # Encontrar clausura transitiva de producciones unitarias
-        unit_pairs = defaultdict(set)
-        
-        # Inicializar con pares reflexivos
-        for nt in self.grammar.non_terminals:
-            unit_pairs[nt].add(nt)
-        
-        # Encontrar clausura transitiva
-        changed = True
-        while changed:
-            changed = False
-            for lhs, productions in self.grammar.productions.items():
-                for rhs in productions:
-                    if len(rhs) == 1 and rhs[0] in self.grammar.non_terminals:
-                        B = rhs[0]
-                        for C in unit_pairs[B]:
-                            if C not in unit_pairs[lhs]:
-                                unit_pairs[lhs].add(C)
-                                changed = True
-        
-        # Generar nuevas producciones sin unitarias
+        # Orden estable: primero los LHS existentes, luego el resto de no-terminales
+        order = list(self.grammar.productions.keys())
+        order += sorted(non_terminals - set(order))
+
+        # Generar nuevas producciones sin unitarias: para cada A se recorre en anchura
+        # su clausura unitaria (A incluido) y se copian las producciones no unitarias
         new_productions = defaultdict(list)
+        seen = defaultdict(set)
+        new_weights = {} if self.weighted else None
+        chain_weight = 1.0
         
-        for A in self.grammar.non_terminals:
-            for B in unit_pairs[A]:
-                if B in self.grammar.productions:
-                    for rhs in self.grammar.productions[B]:
-                        # Solo agregar si NO es producción unitaria
-                        if not (len(rhs) == 1 and rhs[0] in self.grammar.non_terminals):
-                            if rhs not in new_productions[A]:
-                                new_productions[A].append(rhs)
+        for A in order:
+            if A not in non_terminals:
+                continue
+
+            closure = [A]
+            visited = {A}
+            for B in closure:
+                for C in unit_graph.get(B, ()):
+                    if C not in visited:
+                        visited.add(C)
+                        closure.append(C)
+
+            # Con pesos: mejor producto de una cadena unitaria A =>* B
+            chain_weights = self._unit_chain_weights(A, unit_graph) if self.weighted else None
+
+            for B in closure:
+                if self.weighted:
+                    chain_weight = chain_weights[B]
+                for rhs in self.grammar.productions.get(B, ()):
+                    # Solo agregar si NO es producción unitaria
+                    if not (len(rhs) == 1 and rhs[0] in non_terminals):
+                        weight = chain_weight * self.grammar.weight(B, rhs) if self.weighted else 1.0
+                        self._add_unique(new_productions, seen, A, rhs, new_weights, weight)
         
         self.grammar.productions = new_productions
+        if self.weighted:
+            self.grammar.weights = new_weights
         return unit_count
+
+    # Mejor producto de pesos de las cadenas unitarias desde A (Dijkstra con max-product:
+    # con pesos <= 1 el producto nunca crece al alargar la cadena)
+    def _unit_chain_weights(self, A: str, unit_graph: Dict[str, List[str]]) -> Dict[str, float]:
+        best = {A: 1.0}
+        heap = [(-1.0, A)]
+        done = set()
+        while heap:
+            negative, B = heapq.heappop(heap)
+            if B in done:
+                continue
+            done.add(B)
+            for C in unit_graph.get(B, ()):
+                value = -negative * self.grammar.weight(B, [C])
+                if value > best.get(C, -1.0):
+                    best[C] = value
+                    heapq.heappush(heap, (-value, C))
+        return best
     
-    # Reemplaza terminales en producciones binarias
+    # Reemplaza terminales en producciones binarias. Si ya existe un no-terminal auxiliar
+    # cuya única producción es A -> terminal, se reutiliza en lugar de crear uno nuevo.
+    # Los no-terminales de la gramática original no se reutilizan aunque tengan esa
+    # forma: el árbol mostraría su categoría (por ejemplo Det) donde el usuario escribió
+    # el terminal suelto
     def _replace_terminals_in_long_productions(self):
         terminal_to_nt = {}
+        for lhs, productions in self.grammar.productions.items():
+            if lhs not in self.generated_non_terminals:
+                continue
+            if len(productions) == 1 and len(productions[0]) == 1:
+                symbol = productions[0][0]
+                # Con pesos solo sirve si la regla vale 1.0: si no, cambiaría la probabilidad
+                if self.weighted and self.grammar.weight(lhs, productions[0]) != 1.0:
+                    continue
+                if symbol in self.grammar.terminals and symbol not in terminal_to_nt:
+                    terminal_to_nt[symbol] = lhs
+
         new_productions = defaultdict(list)
+        new_weights = {} if self.weighted else None
         terminals_replaced = 0
 
         for lhs, productions in self.grammar.productions.items():
@@ -349,6 +697,8 @@ class CNFConverter:
                 if len(rhs) == 1:
                     # Producción A -> a (ya está en CNF)
                     new_productions[lhs].append(rhs)
+                    if self.weighted:
+                        self._keep_best_weight(new_weights, lhs, rhs, self.grammar.weight(lhs, rhs))
                 
                 else:
                     # Revisamos si hay terminales que necesiten reemplazo
@@ -359,246 +709,2984 @@ class CNFConverter:
                             if symbol not in terminal_to_nt:
                                 new_nt = self._get_new_non_terminal()
                                 terminal_to_nt[symbol] = new_nt
-                                new_productions[new_nt].append([symbol])
+                                new_productions[new_nt].append((symbol,))
                                 self.grammar.non_terminals.add(new_nt)
                                 terminals_replaced += 1
                             new_rhs.append(terminal_to_nt[symbol])
                         else:
                             new_rhs.append(symbol)
+                    new_rhs = tuple(new_rhs)
                     new_productions[lhs].append(new_rhs)
+                    if self.weighted:
+                        self._keep_best_weight(new_weights, lhs, new_rhs, self.grammar.weight(lhs, rhs))
 
         self.grammar.productions = new_productions
+        if self.weighted:
+            self.grammar.weights = new_weights
         return terminals_replaced
     
-    # Rompe producciones largas en producciones binarias
+    # Rompe producciones largas en producciones binarias. Los sufijos se comparten:
+    # A -> B C D y E -> F C D usan el mismo no-terminal auxiliar para "C D".
+    # Con pesos, la primera regla conserva el peso original y las auxiliares valen 1.0
+    # (cada auxiliar tiene una sola producción)
     def _break_long_productions(self):
         new_productions = defaultdict(list)
+        new_weights = {} if self.weighted else None
+        suffix_to_nt: Dict[Tuple[str, ...], str] = {}
         long_count = 0
 
         for lhs, productions in self.grammar.productions.items():
             for rhs in productions:
                 if len(rhs) <= 2:
                     new_productions[lhs].append(rhs)
+                    if self.weighted:
+                        self._keep_best_weight(new_weights, lhs, rhs, self.grammar.weight(lhs, rhs))
                 else:
                     # Romper producción larga
                     long_count += 1
                     current_lhs = lhs
+                    weight = self.grammar.weight(lhs, rhs) if self.weighted else 1.0
                     for i in range(len(rhs) - 2):
+                        suffix = tuple(rhs[i + 1:])
+                        existing = suffix_to_nt.get(suffix)
+                        if existing is not None:
+                            # El resto de la cadena ya existe: se enlaza y termina
+                            new_productions[current_lhs].append((rhs[i], existing))
+                            if self.weighted:
+                                self._keep_best_weight(new_weights, current_lhs, (rhs[i], existing), weight)
+                            break
+
                         new_nt = self._get_new_non_terminal()
-                        new_productions[current_lhs].append([rhs[i], new_nt])
+                        suffix_to_nt[suffix] = new_nt
+                        new_productions[current_lhs].append((rhs[i], new_nt))
                         self.grammar.non_terminals.add(new_nt)
+                        if self.weighted:
+                            self._keep_best_weight(new_weights, current_lhs, (rhs[i], new_nt), weight)
                         current_lhs = new_nt
-                    
-                    # Última producción
-                    new_productions[current_lhs].append([rhs[-2], rhs[-1]])
+                        weight = 1.0
+                    else:
+                        # Última producción
+                        new_productions[current_lhs].append((rhs[-2], rhs[-1]))
+                        if self.weighted:
+                            self._keep_best_weight(new_weights, current_lhs, (rhs[-2], rhs[-1]), weight)
         
         self.grammar.productions = new_productions
+        if self.weighted:
+            self.grammar.weights = new_weights
         return long_count
 
+    # Fusiona no-terminales auxiliares (X1, X2, ...) cuyo conjunto de producciones es
+    # idéntico al de otro auxiliar. Se repite hasta un punto fijo, porque cada fusión
+    # puede volver idénticas otras producciones. Los no-terminales de la gramática
+    # original nunca desaparecen ni absorben auxiliares: un auxiliar fusionado con una
+    # categoría original haría que el árbol la mostrara donde el usuario no la escribió
+    def _merge_equivalent_non_terminals(self) -> int:
+        merged_total = 0
+
+        while True:
+            # Con pesos, dos no-terminales solo son equivalentes si sus reglas pesan lo mismo
+            by_signature: Dict[frozenset, List[str]] = defaultdict(list)
+            for lhs, productions in self.grammar.productions.items():
+                if self.weighted:
+                    signature = frozenset((tuple(rhs), self.grammar.weight(lhs, rhs)) for rhs in productions)
+                else:
+                    signature = frozenset(tuple(rhs) for rhs in productions)
+                by_signature[signature].append(lhs)
+
+            replacement = {}
+            for group in by_signature.values():
+                helpers = [nt for nt in group if nt in self.generated_non_terminals]
+                for nt in helpers[1:]:
+                    replacement[nt] = helpers[0]
+
+            if not replacement:
+                return merged_total
+
+            merged_total += len(replacement)
+            new_productions = defaultdict(list)
+            new_weights = {} if self.weighted else None
+            seen = defaultdict(set)
+            for lhs, productions in self.grammar.productions.items():
+                if lhs in replacement:
+                    continue
+                for rhs in productions:
+                    # Solo se reconstruyen las reglas que mencionan un no-terminal fusionado
+                    if any(symbol in replacement for symbol in rhs):
+                        new_rhs = tuple(replacement.get(symbol, symbol) for symbol in rhs)
+                    else:
+                        new_rhs = rhs
+                    weight = self.grammar.weight(lhs, rhs) if self.weighted else 1.0
+                    self._add_unique(new_productions, seen, lhs, new_rhs, new_weights, weight)
+
+            self.grammar.productions = new_productions
+            if self.weighted:
+                self.grammar.weights = new_weights
+            self.grammar.non_terminals -= set(replacement)
+            self.generated_non_terminals -= set(replacement)
 
 
-# Clase que representa un nodo en el árbol de parsing
+# Clase que representa un nodo en el árbol de parsing.
+# Todos los recorridos usan una pila explícita, así que funcionan con árboles más
+# profundos que el límite de recursión de Python (expresiones largas de 1.txt)
 class ParseTreeNode:
+    __slots__ = ('symbol', 'children')
+
+    # Cantidad de fragmentos que juntan los escritores antes de escribir en el archivo
+    WRITE_CHUNK = 4096
+
+    # Palabras que cambian en el formato con paréntesis (convención del Penn Treebank)
+    BRACKET_ESCAPES = {'(': '-LRB-', ')': '-RRB-'}
+
     def __init__(self, symbol: str, children: List['ParseTreeNode'] = None):
         self.symbol = symbol
         self.children = children or []
 
+    # Recorrido en preorden: (nodo, nivel, es el último hijo de su padre)
+    def _preorder(self, level: int = 0) -> Iterator[Tuple['ParseTreeNode', int, bool]]:
+        stack = [(self, level, True)]
+        while stack:
+            node, depth, is_last = stack.pop()
+            yield node, depth, is_last
+            children = node.children
+            for i in range(len(children) - 1, -1, -1):
+                stack.append((children[i], depth + 1, i == len(children) - 1))
+
     # Imprime el árbol de forma visual
     def print_tree(self, level=0, prefix=""):
-        indent = "  " * level
-        print(f"{indent}{prefix}{self.symbol}")
-        for i, child in enumerate(self.children):
-            is_last = i == len(self.children) - 1
-            child_prefix = "└─ " if is_last else "├─ "
-            child.print_tree(level + 1, child_prefix)
+        for node, depth, is_last in self._preorder(level):
+            if node is not self:
+                prefix = "└─ " if is_last else "├─ "
+            print(f"{'  ' * depth}{prefix}{node.symbol}")
     
     #Convierte el árbol a string
     def to_string_tree(self, level=0) -> str:
-        indent = "  " * level
-        result = f"{indent}{self.symbol}\n"
-        for child in self.children:
-            result += child.to_string_tree(level + 1)
-        return result
+        return ''.join(f"{'  ' * depth}{node.symbol}\n" for node, depth, _ in self._preorder(level))
 
+    # Convierte el árbol a diccionarios anidados (serializable a JSON; para árboles muy
+    # profundos conviene write_json, porque json.dumps también es recursivo)
+    def to_dict(self) -> dict:
+        root = {'symbol': self.symbol, 'children': []}
+        stack = [(self, root)]
+        while stack:
+            node, data = stack.pop()
+            for child in node.children:
+                child_data = {'symbol': child.symbol, 'children': []}
+                data['children'].append(child_data)
+                stack.append((child, child_data))
+        return root
 
-# Implementa el algoritmo CYK con programación dinámica
-class CYKParser:
-    def __init__(self, grammar: Grammar):
-        self.grammar = grammar
-        self.table = None
-        self.back_pointer = None
-    
-    # Ejecuta el algoritmo CYK usando programación dinámica
-    def parse(self, sentence: str) -> Tuple[bool, Optional[ParseTreeNode], float]:
-        start_time = time.time()
-        words = sentence.lower().split()
-        n = len(words)
+    # Escribe el árbol entre paréntesis, como (S (NP (PRP she)) (VP ...)), directo en el
+    # archivo y sin armar la cadena completa en memoria
+    def write_bracketed(self, file):
+        escapes = self.BRACKET_ESCAPES
+        pieces = []
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                pieces.append(item)
+            elif not item.children:
+                pieces.append(escapes.get(item.symbol, item.symbol))
+            else:
+                pieces.append('(' + escapes.get(item.symbol, item.symbol))
+                stack.append(')')
+                for child in reversed(item.children):
+                    stack.append(child)
+                    stack.append(' ')
+            if len(pieces) >= self.WRITE_CHUNK:
+                file.write(''.join(pieces))
+                pieces.clear()
+        file.write(''.join(pieces))
 
-        # Si no hay palabras, no hay nada que analizar
-        if n == 0:
-            return False, None, 0.0
-        
-        # Tabla de programación dinámica
-        # table[i][j] guarda los símbolos que pueden generar la subcadena
-        self.table = [[set() for _ in range(n)] for _ in range(n)]
-        
-        # Back pointers para reconstruir el árbol
-        self.back_pointer = [[defaultdict(list) for _ in range(n)] for _ in range(n)]
+    # Escribe el árbol como JSON (el mismo texto que json.dumps(to_dict(), ensure_ascii=False))
+    # directo en el archivo y sin armar la cadena completa en memoria
+    def write_json(self, file):
+        pieces = []
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                pieces.append(item)
+            else:
+                pieces.append('{"symbol": ' + json.dumps(item.symbol, ensure_ascii=False) + ', "children": [')
+                stack.append(']}')
+                for index in range(len(item.children) - 1, -1, -1):
+                    stack.append(item.children[index])
+                    if index:
+                        stack.append(', ')
+            if len(pieces) >= self.WRITE_CHUNK:
+                file.write(''.join(pieces))
+                pieces.clear()
+        file.write(''.join(pieces))
 
-        # Paso 1: Llenar la diagonal (palabras individuales)
-        for i in range(n):
-            word = words[i]
-            for lhs, productions in self.grammar.productions.items():
-                for rhs in productions:
-                    if len(rhs) == 1 and rhs[0] == word:
-                        self.table[i][0].add(lhs)
-                        self.back_pointer[i][0][lhs].append(('terminal', word, None))
-        
-        # Paso 2: Llenar la tabla para subcadenas más largas
-        for length in range(2, n + 1):
-            for i in range(n - length + 1):
-                j = length - 1
+    def to_bracketed(self) -> str:
+        buffer = io.StringIO()
+        self.write_bracketed(buffer)
+        return buffer.getvalue()
 
-                # Probar todas las divisiones posibles
-                for k in range(length - 1):
-                    left_symbols = self.table[i][k]
-                    right_symbols = self.table[i + k + 1][j - k - 1]
-
-                    # Buscar reglas que combinen estas partes
-                    for lhs, productions in self.grammar.productions.items():
-                        for rhs in productions:
-                            if len(rhs) == 2:
-                                B, C = rhs
-                                if B in left_symbols and C in right_symbols:
-                                    self.table[i][j].add(lhs)
-                                    self.back_pointer[i][j][lhs].append((k, B, C))
-        
-        # Verificar si se puede formar el símbolo inicial
-        accepted = self.grammar.start_symbol in self.table[0][n - 1]
+    def to_json(self) -> str:
+        buffer = io.StringIO()
+        self.write_json(buffer)
+        return buffer.getvalue()
 
-        end_time = time.time()
-        execution_time = end_time - start_time
+    # pickle también es recursivo: el árbol se envía como lista plana en preorden
+    # de (símbolo, cantidad de hijos) y se reconstruye con una pila
+    def __reduce__(self):
+        return _tree_from_preorder, ([(node.symbol, len(node.children)) for node, _, _ in self._preorder()],)
 
-        # Construir el árbol si fue aceptada
-        parse_tree = None
-        if accepted:
-            parse_tree = self._build_parse_tree(0, n - 1, self.grammar.start_symbol, words)
-        
-        return accepted, parse_tree, execution_time
+    # Copia independiente del árbol (sin recursión, los árboles pueden ser muy profundos)
+    def copy(self) -> 'ParseTreeNode':
+        return _tree_from_preorder([(node.symbol, len(node.children)) for node, _, _ in self._preorder()])
 
-    # Construye el árbol recursivamente
-    def _build_parse_tree(self, i: int, j: int, symbol: str, words: List[str]) -> ParseTreeNode:
-        node = ParseTreeNode(symbol)
 
-        # Caso base: llegamos a una palabra
-        if j == 0:
-            pointers = self.back_pointer[i][j].get(symbol, [])
-            if pointers:
-                pointer = pointers[0]
-                if pointer[0] == 'terminal':
-                    terminal_node = ParseTreeNode(pointer[1])
-                    node.children.append(terminal_node)
+# Reconstruye un árbol a partir de su lista en preorden de (símbolo, cantidad de hijos)
+def _tree_from_preorder(items: List[Tuple[str, int]]) -> ParseTreeNode:
+    root = None
+    # Pila de (nodo, hijos que le faltan)
+    pending = []
+    for symbol, child_count in items:
+        node = ParseTreeNode(symbol)
+        if pending:
+            parent = pending[-1]
+            parent[0].children.append(node)
+            parent[1] -= 1
+            if not parent[1]:
+                pending.pop()
         else:
-            # Caso recursivo: construir subárboles
-            pointers = self.back_pointer[i][j].get(symbol, [])
-            if pointers:
-                k, B, C = pointers[0]
+            root = node
+        if child_count:
+            pending.append([node, child_count])
+    return root
 
-                left_child = self._build_parse_tree(i, k, B, words)
-                node.children.append(left_child)
 
-                right_child = self._build_parse_tree(i + k + 1, j - k - 1, C, words)
-                node.children.append(right_child)
-        
-        return node
+# Ejecuta una función recursiva escrita como generador sin usar la pila de Python:
+# cada `yield argumentos` pide el resultado de un subproblema, que spawn(*argumentos)
+# convierte en otro generador; el valor de retorno de ese generador se envía de vuelta
+def _trampoline(generator, spawn):
+    stack = [generator]
+    value = None
+    while stack:
+        try:
+            request = stack[-1].send(value)
+        except StopIteration as stop:
+            stack.pop()
+            value = stop.value
+            continue
+        stack.append(spawn(*request))
+        value = None
+    return value
 
-# Lee una gramática desde un archivo de texto
-def load_grammar_from_file(filename: str) -> Grammar:
 
-    g = Grammar()
-    first_non_terminal = None
-    
-    try:
-        with open(filename, 'r', encoding='utf-8') as file:
-            for line_num, line in enumerate(file, 1):
-                line = line.strip()
-                
-                # Ignorar comentarios y líneas vacías
-                if not line or line.startswith('#'):
-                    continue
-                
-                # Debe tener formato: LHS -> RHS
-                if '->' not in line:
-                    print(f"⚠ Línea {line_num} ignorada (formato inválido): {line}")
-                    continue
-                
-                parts = line.split('->')
-                if len(parts) != 2:
-                    print(f"⚠ Línea {line_num} ignorada (formato inválido): {line}")
-                    continue
-                
-                lhs = parts[0].strip()
-                rhs_full = parts[1].strip()
-                
-                # Guardar el primer no-terminal como símbolo inicial
-                if first_non_terminal is None:
-                    first_non_terminal = lhs
-                
-                # Separar alternativas (|)
-                alternatives = [alt.strip() for alt in rhs_full.split('|')]
-                
-                for alt in alternatives:
-                    if alt and alt not in ['e', 'ε', 'EPSILON']:  # Ignorar epsilon explícito
-                        symbols = alt.split()
-                        g.add_production(lhs, symbols)
-                    elif alt in ['e', 'ε', 'EPSILON']:
-                        # Producción epsilon
-                        g.add_production(lhs, [alt])
-        
-        # Establecer el símbolo inicial
-        if first_non_terminal:
-            g.start_symbol = first_non_terminal
-        
-        print(f"✓ Gramática cargada desde '{filename}'")
-        print(f"  Símbolo inicial: {g.start_symbol}")
-        print(f"  No-terminales: {len(g.non_terminals)}")
-        print(f"  Terminales: {len(g.terminals)}")
-        print(f"  Producciones: {sum(len(prods) for prods in g.productions.values())}")
-        
-        return g
-        
-    except FileNotFoundError:
-        print(f"Error: No se encontró el archivo '{filename}'")
-        sys.exit(1)
-    
-    except Exception as e:
-        print(f"Error al leer el archivo: {e}")
-        sys.exit(1)
+# Tabla triangular compacta: guarda solo las n(n+1)/2 celdas (i, j) con i + j < n
+# en una lista plana, donde j es la longitud de la subcadena menos uno. Las celdas
+# vacías comparten un mismo valor inmutable y solo se materializan al llenarse
+class TriangularChart:
+    __slots__ = ('n', 'empty', 'cells', 'row_offsets')
 
-# Modo interactivo para ingresar frases
-def interactive_mode(parser: CYKParser):
-    print("\n" + "=" * 70)
-    print("MODO INTERACTIVO - INGRESO DE FRASES")
-    print("=" * 70)
-    print("\nInstrucciones:")
-    print("  • Ingrese frases para analizar")
-    print("  • Escriba 'salir' para terminar")
-    print("  • Escriba 'ayuda' para ver comandos")
+    def __init__(self, n: int, empty=None):
+        self.n = n
+        self.empty = empty
+        self.cells = [empty] * (n * (n + 1) // 2)
 
-    while True:
-        print("\n" + "-" * 70)
-        user_input = input("Ingrese una frase: ").strip()
+        # La fila j (subcadenas de longitud j + 1) tiene n - j celdas
+        self.row_offsets = [j * n - j * (j - 1) // 2 for j in range(n)]
 
-        if user_input.lower() in ['salir', 'exit', 'quit', 'q']:
-            print("\n¡Gracias por usar el parser CYK!")
-            break
+    # Posición en la lista plana de la celda (i, j)
+    def index(self, i: int, j: int) -> int:
+        return self.row_offsets[j] + i
 
-        if user_input.lower() in ['ayuda', 'help', 'h']:
-            print("\nCOMANDOS DISPONIBLES:")
-            print("-" * 70)
-            print("  salir   - Terminar el programa")
-            print("  ayuda   - Mostrar esta ayuda")
-            continue
+    def get(self, i: int, j: int):
+        return self.cells[self.row_offsets[j] + i]
+
+    def set(self, i: int, j: int, value):
+        self.cells[self.row_offsets[j] + i] = value
+
+    # Cantidad de celdas que contienen algo
+    def filled_cells(self) -> int:
+        return sum(1 for cell in self.cells if cell is not self.empty and cell)
+
+
+# Back pointer de una regla binaria: LHS -> left right, dividiendo en split
+class BackPointer:
+    __slots__ = ('split', 'left', 'right')
+
+    def __init__(self, split: int, left: str, right: str):
+        self.split = split
+        self.left = left
+        self.right = right
+
+
+# Back pointer de una regla terminal: A -> word
+class TerminalPointer:
+    __slots__ = ('word',)
+
+    def __init__(self, word: str):
+        self.word = word
+
+
+# Celda vacía compartida por todas las celdas sin símbolos del motor de conjuntos
+EMPTY_CELL = frozenset()
+
+
+# Índices precalculados sobre una gramática en CNF (se construyen una sola vez)
+class CompiledGrammar:
+    def __init__(self, grammar: Grammar):
+        self.start_symbol = grammar.start_symbol
+
+        # (B, C) -> conjunto de LHS tales que LHS -> B C
+        self.binary_index: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+
+        # B -> lista de (C, LHS) para todas las reglas LHS -> B C
+        self.left_index: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+
+        # Terminal -> conjunto de pre-terminales A tales que A -> terminal
+        self.lexicon: Dict[str, Set[str]] = defaultdict(set)
+
+        for lhs, productions in grammar.productions.items():
+            for rhs in productions:
+                if len(rhs) == 1:
+                    self.lexicon[rhs[0]].add(lhs)
+                elif len(rhs) == 2:
+                    B, C = rhs
+                    if lhs not in self.binary_index[(B, C)]:
+                        self.binary_index[(B, C)].add(lhs)
+                        self.left_index[B].append((C, lhs))
+
+        # Se congelan como diccionarios normales para evitar entradas vacías al consultar
+        self.binary_index = dict(self.binary_index)
+        self.left_index = dict(self.left_index)
+        self.lexicon = dict(self.lexicon)
+
+        # Log-probabilidades para el motor de Viterbi:
+        # terminal -> {A: log p(A -> terminal)} y B -> lista de (C, LHS, log p(LHS -> B C))
+        self.lexicon_scores: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self.left_scores: Dict[str, List[Tuple[str, str, float]]] = defaultdict(list)
+        for lhs, productions in grammar.productions.items():
+            for rhs in productions:
+                score = self.log_weight(grammar.weight(lhs, rhs))
+                if len(rhs) == 1:
+                    previous = self.lexicon_scores[rhs[0]].get(lhs, -math.inf)
+                    self.lexicon_scores[rhs[0]][lhs] = max(previous, score)
+                elif len(rhs) == 2:
+                    self.left_scores[rhs[0]].append((rhs[1], lhs, score))
+        self.lexicon_scores = dict(self.lexicon_scores)
+        self.left_scores = dict(self.left_scores)
+
+        self._build_bit_tables(grammar)
+        self._numpy_tables = None
+        self._context_masks = None
+
+    # Logaritmo de un peso (un peso 0 da -inf: la regla nunca gana)
+    @staticmethod
+    def log_weight(weight: float) -> float:
+        return math.log(weight) if weight > 0 else -math.inf
+
+    # Interna los no-terminales como enteros y precalcula las máscaras del motor de bits
+    def _build_bit_tables(self, grammar: Grammar):
+        symbols = set(grammar.productions.keys())
+        for B, C in self.binary_index:
+            symbols.add(B)
+            symbols.add(C)
+
+        # El símbolo inicial siempre recibe el id 0; el resto en orden alfabético
+        symbols.discard(self.start_symbol)
+        self.symbols: List[str] = [self.start_symbol] + sorted(symbols)
+        self._build_masks()
+
+    # Máscaras de bits a partir de self.symbols, self.lexicon y self.left_index
+    def _build_masks(self):
+        self.symbol_ids: Dict[str, int] = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+        # Terminal -> máscara con los bits de sus pre-terminales
+        self.lexicon_masks: Dict[str, int] = {}
+        for terminal, preterminals in self.lexicon.items():
+            mask = 0
+            for lhs in preterminals:
+                mask |= 1 << self.symbol_ids[lhs]
+            self.lexicon_masks[terminal] = mask
+
+        # Por cada hijo izquierdo B: máscara de hijos derechos posibles y,
+        # para cada hijo derecho C, la máscara de los LHS que produce B C
+        self.right_masks: List[int] = [0] * len(self.symbols)
+        self.pair_masks: List[Dict[int, int]] = [dict() for _ in self.symbols]
+
+        # Por cada LHS: lista de (B, C) en ids, usada para reconstruir árboles
+        self.rules_by_lhs: List[List[Tuple[int, int]]] = [[] for _ in self.symbols]
+
+        for B, rules in self.left_index.items():
+            b = self.symbol_ids[B]
+            for C, lhs in rules:
+                c = self.symbol_ids[C]
+                a = self.symbol_ids[lhs]
+                self.right_masks[b] |= 1 << c
+                self.pair_masks[b][c] = self.pair_masks[b].get(c, 0) | (1 << a)
+                self.rules_by_lhs[a].append((b, c))
+
+    # Datos simples (listas, diccionarios con claves de texto, cadenas y números) para
+    # guardar en JSON; las máscaras y las tablas perezosas se reconstruyen en from_dict.
+    # El orden de left_index se conserva porque decide qué árbol se construye
+    def to_dict(self) -> dict:
+        return {'start_symbol': self.start_symbol,
+                'symbols': self.symbols,
+                'lexicon': {terminal: sorted(lhs) for terminal, lhs in self.lexicon.items()},
+                'left_index': {B: [list(rule) for rule in rules] for B, rules in self.left_index.items()},
+                'lexicon_scores': self.lexicon_scores,
+                'left_scores': {B: [list(rule) for rule in rules] for B, rules in self.left_scores.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'CompiledGrammar':
+        intern = sys.intern
+        compiled = cls.__new__(cls)
+        compiled.start_symbol = intern(data['start_symbol'])
+        compiled.symbols = [intern(symbol) for symbol in data['symbols']]
+        compiled.lexicon = {intern(terminal): set(map(intern, lhs)) for terminal, lhs in data['lexicon'].items()}
+        compiled.left_index = {intern(B): [(intern(C), intern(lhs)) for C, lhs in rules]
+                               for B, rules in data['left_index'].items()}
+        compiled.binary_index = {}
+        for B, rules in compiled.left_index.items():
+            for C, lhs in rules:
+                compiled.binary_index.setdefault((B, C), set()).add(lhs)
+        compiled.lexicon_scores = {intern(terminal): {intern(A): score for A, score in scores.items()}
+                                   for terminal, scores in data['lexicon_scores'].items()}
+        compiled.left_scores = {intern(B): [(intern(C), intern(lhs), score) for C, lhs, score in rules]
+                                for B, rules in data['left_scores'].items()}
+        compiled._build_masks()
+        compiled._numpy_tables = None
+        compiled._context_masks = None
+        return compiled
+
+    # Construye (una sola vez) las tablas booleanas que usa el motor de NumPy
+    def numpy_tables(self):
+        if self._numpy_tables is None:
+            N = len(self.symbols)
+
+            # Cada par (B, C) distinto con su vector de LHS, para contraer solo pares existentes.
+            # Se arma directo desde el índice de reglas: una tabla densa N x N x N no cabría
+            # en memoria con miles de no-terminales
+            pairs = sorted((self.symbol_ids[B], self.symbol_ids[C], (B, C)) for B, C in self.binary_index)
+            pair_left = np.array([b for b, _, _ in pairs], dtype=np.intp)
+            pair_right = np.array([c for _, c, _ in pairs], dtype=np.intp)
+            pair_to_lhs = np.zeros((len(pairs), N), dtype=np.float32)
+            for row, (_, _, key) in enumerate(pairs):
+                for lhs in self.binary_index[key]:
+                    pair_to_lhs[row, self.symbol_ids[lhs]] = 1.0
+
+            lexicon_vectors = {}
+            for terminal, mask in self.lexicon_masks.items():
+                vector = np.zeros(N, dtype=bool)
+                for symbol in self.symbols_in(mask):
+                    vector[self.symbol_ids[symbol]] = True
+                lexicon_vectors[terminal] = vector
+
+            self._numpy_tables = (pair_left, pair_right, pair_to_lhs, lexicon_vectors)
+        return self._numpy_tables
+
+    # Máscaras (por id de símbolo) del filtro de contexto, calculadas una sola vez:
+    # begin: símbolos que pueden empezar una frase (esquinas izquierdas del inicial)
+    # end: símbolos que pueden terminarla (esquinas derechas del inicial)
+    # follow[p]: símbolos que pueden aparecer justo a la derecha de p en un árbol
+    # precede[q]: símbolos que pueden aparecer justo a la izquierda de q en un árbol
+    def context_masks(self) -> Tuple[int, int, List[int], List[int]]:
+        if self._context_masks is None:
+            N = len(self.symbols)
+            rules = [(a, b, c) for a in range(N) for b, c in self.rules_by_lhs[a]]
+
+            # first[x]: esquinas izquierdas de x (x incluido); last[x]: esquinas derechas
+            first = [1 << x for x in range(N)]
+            last = [1 << x for x in range(N)]
+            left_parents = [[] for _ in range(N)]
+            right_parents = [[] for _ in range(N)]
+            for a, b, c in rules:
+                left_parents[b].append(a)
+                right_parents[c].append(a)
+            self._propagate_masks(first, left_parents)
+            self._propagate_masks(last, right_parents)
+
+            # En A -> B C, lo que empieza C sigue a B y lo que termina B precede a C.
+            # Además, lo que sigue a A sigue a su hijo derecho, y lo que precede a A
+            # precede a su hijo izquierdo
+            follow = [0] * N
+            precede = [0] * N
+            right_children = [[] for _ in range(N)]
+            left_children = [[] for _ in range(N)]
+            for a, b, c in rules:
+                follow[b] |= first[c]
+                precede[c] |= last[b]
+                right_children[a].append(c)
+                left_children[a].append(b)
+            self._propagate_masks(follow, right_children)
+            self._propagate_masks(precede, left_children)
+
+            self._context_masks = (first[0], last[0], follow, precede)
+        return self._context_masks
+
+    # Punto fijo con lista de trabajo: masks[d] incluye masks[x] para todo d en dependents[x]
+    @staticmethod
+    def _propagate_masks(masks: List[int], dependents: List[List[int]]):
+        worklist = list(range(len(masks)))
+        while worklist:
+            x = worklist.pop()
+            mask = masks[x]
+            for d in dependents[x]:
+                combined = masks[d] | mask
+                if combined != masks[d]:
+                    masks[d] = combined
+                    worklist.append(d)
+
+    # Convierte una máscara de bits en el conjunto de símbolos que representa
+    def symbols_in(self, mask: int) -> Set[str]:
+        result = set()
+        while mask:
+            low = mask & -mask
+            result.add(self.symbols[low.bit_length() - 1])
+            mask ^= low
+        return result
+
+
+# Bosque de análisis compartido y empaquetado (SPPF) de una frase aceptada.
+# Cada nodo de símbolo (i, j, s) aparece una sola vez aunque lo compartan muchas
+# derivaciones, y guarda sus alternativas empaquetadas (k, b, c): s -> b c dividiendo
+# en k. Solo se incluyen los nodos alcanzables desde la raíz, así que el tamaño es
+# polinomial aunque la cantidad de árboles crezca exponencialmente
+class ParseForest:
+    # contains(i, j, s) indica si el símbolo con id s genera la subcadena (i, j)
+    def __init__(self, compiled: CompiledGrammar, words: List[str], contains):
+        self.compiled = compiled
+        self.words = words
+        self.root = (0, len(words) - 1, 0)
+        self.nodes: Dict[Tuple[int, int, int], List[Tuple[int, int, int]]] = {}
+        self._counts: Optional[Dict[Tuple[int, int, int], int]] = None
+
+        rules_by_lhs = compiled.rules_by_lhs
+        stack = [self.root]
+        while stack:
+            key = stack.pop()
+            if key in self.nodes:
+                continue
+            i, j, s = key
+            packed = []
+
+            # Las hojas (j = 0) no tienen alternativas: cubren una sola palabra
+            for k in range(j):
+                for b, c in rules_by_lhs[s]:
+                    if contains(i, k, b) and contains(i + k + 1, j - k - 1, c):
+                        packed.append((k, b, c))
+                        stack.append((i, k, b))
+                        stack.append((i + k + 1, j - k - 1, c))
+            self.nodes[key] = packed
+
+    # Cantidad de alternativas empaquetadas (aristas del bosque)
+    def packed_count(self) -> int:
+        return sum(len(packed) for packed in self.nodes.values())
+
+    # Cantidad de árboles distintos. Se calcula de abajo hacia arriba con enteros de
+    # precisión arbitraria: cada alternativa cuesta una multiplicación
+    def count(self) -> int:
+        if self._counts is None:
+            counts = {}
+            for key in sorted(self.nodes, key=lambda key: key[1]):
+                i, j, _ = key
+                if j == 0:
+                    counts[key] = 1
+                    continue
+                total = 0
+                for k, b, c in self.nodes[key]:
+                    total += counts[(i, k, b)] * counts[(i + k + 1, j - k - 1, c)]
+                counts[key] = total
+            self._counts = counts
+        return self._counts[self.root]
+
+    # La frase es ambigua si algún nodo alcanzable tiene más de una alternativa
+    # (todo nodo del bosque genera su subcadena, así que cada alternativa da un árbol)
+    def is_ambiguous(self) -> bool:
+        return any(len(packed) > 1 for packed in self.nodes.values())
+
+    # Genera los árboles de forma perezosa, a lo sumo limit si se indica
+    def trees(self, limit: Optional[int] = None) -> Iterator[ParseTreeNode]:
+        total = self.count()
+        return (self.tree(rank) for rank in range(total if limit is None else min(limit, total)))
+
+    # Árbol número rank (0 <= rank < count()). Las alternativas de cada nodo se recorren en
+    # orden y, dentro de una alternativa, el árbol izquierdo cambia más lento que el
+    # derecho: con los conteos de count() se baja directo al árbol pedido, con una pila
+    def tree(self, rank: int) -> ParseTreeNode:
+        if self._counts is None:
+            self.count()
+        counts = self._counts
+        symbols = self.compiled.symbols
+        root = ParseTreeNode(symbols[self.root[2]])
+        stack = [(self.root, rank, root)]
+        while stack:
+            key, rank, node = stack.pop()
+            i, j, _ = key
+            if j == 0:
+                node.children.append(ParseTreeNode(self.words[i]))
+                continue
+
+            for k, b, c in self.nodes[key]:
+                left = (i, k, b)
+                right = (i + k + 1, j - k - 1, c)
+                right_count = counts[right]
+                block = counts[left] * right_count
+                if rank < block:
+                    left_node = ParseTreeNode(symbols[b])
+                    right_node = ParseTreeNode(symbols[c])
+                    node.children.extend((left_node, right_node))
+                    stack.append((right, rank % right_count, right_node))
+                    stack.append((left, rank // right_count, left_node))
+                    break
+                rank -= block
+            else:
+                raise IndexError("El bosque no tiene tantos árboles")
+        return root
+
+
+# Caché LRU acotada de celdas CYK compartida entre frases. El contenido de una celda
+# depende solo de las palabras que cubre, así que se guarda con la tupla de palabras
+# (internadas) como clave y se reutiliza en cualquier posición de cualquier frase.
+# También guarda el resultado de frases completas. Cada clave incluye además el tipo de
+# llenado (kind, ver CYKParser._cache_kind), porque cada motor guarda celdas distintas. Cuando se supera max_entries o el
+# tamaño estimado max_bytes se descartan las entradas usadas hace más tiempo.
+# Lo guardado se comparte con todos los que lo piden, así que las celdas se guardan congeladas
+# (frozenset o MappingProxyType) y los árboles de frases completas se copian al guardar y al leer
+class SpanCache:
+    # Marca de las claves de frases completas (las de celdas son tuplas de palabras)
+    SENTENCE = '<frase>'
+
+    # min_length: longitud mínima de las subcadenas que se guardan (la diagonal sale
+    # directo del léxico, así que por defecto no se guarda)
+    # spans: con False solo se guardan frases completas. Consultar y guardar cada celda
+    # cuesta más que calcularla con gramáticas pequeñas, así que la caché de celdas solo
+    # conviene cuando las celdas son caras y se repiten subcadenas largas
+    def __init__(self, max_entries: int = 100000, max_bytes: int = 64 << 20, min_length: int = 2,
+                 spans: bool = True):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.min_length = min_length if spans else math.inf
+        self.entries: 'OrderedDict[tuple, Tuple[object, int]]' = OrderedDict()
+        self.bytes = 0
+        self.span_hits = 0
+        self.span_misses = 0
+        self.sentence_hits = 0
+        self.sentence_misses = 0
+        self.evictions = 0
+
+    # Celda guardada para la subcadena (o None si no está)
+    def get_span(self, kind: tuple, tokens: tuple):
+        key = (kind, tokens)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.span_misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.span_hits += 1
+        return entry[0]
+
+    def put_span(self, kind: tuple, tokens: tuple, value, size: int):
+        self._put((kind, tokens), value, size)
+
+    # Resultado guardado para la frase completa (o None si no está)
+    def get_sentence(self, kind: tuple, tokens: tuple):
+        key = (self.SENTENCE, kind, tokens)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.sentence_misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.sentence_hits += 1
+        return entry[0]
+
+    def put_sentence(self, kind: tuple, tokens: tuple, value, size: int):
+        self._put((self.SENTENCE, kind, tokens), value, size)
+
+    def _put(self, key: tuple, value, size: int):
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous[1]
+        self.entries[key] = (value, size)
+        self.bytes += size
+
+        # Desalojar lo menos usado recientemente hasta volver a los límites
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    # Vacía la caché (las estadísticas se conservan)
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    # Estadísticas de aciertos y fallos para dimensionar la caché
+    def stats(self) -> dict:
+        span_lookups = self.span_hits + self.span_misses
+        sentence_lookups = self.sentence_hits + self.sentence_misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'evictions': self.evictions,
+            'span_hits': self.span_hits,
+            'span_misses': self.span_misses,
+            'span_hit_rate': self.span_hits / span_lookups if span_lookups else 0.0,
+            'sentence_hits': self.sentence_hits,
+            'sentence_misses': self.sentence_misses,
+            'sentence_hit_rate': self.sentence_hits / sentence_lookups if sentence_lookups else 0.0,
+        }
+
+
+# Separa el texto de entrada en tokens (terminales) en una sola pasada. Estrategias:
+#   'whitespace': separa por espacios (el comportamiento original)
+#   'regex':      cada coincidencia de pattern es un token
+#   'chars':      cada carácter que no es espacio es un token
+#   'longest':    en cada posición toma el terminal más largo que coincide, así
+#                 "id+id*id" se separa en id + id * id aunque no tenga espacios; los
+#                 caracteres que no inician ningún terminal forman un token desconocido
+#                 hasta el siguiente espacio o inicio de terminal
+# Los tokens que son terminales se devuelven como la misma cadena (internada) de la
+# gramática, y encode() devuelve sus ids enteros (-1 para los desconocidos)
+class Tokenizer:
+    STRATEGIES = ('whitespace', 'regex', 'chars', 'longest')
+
+    # lowercase: pasa el texto a minúsculas antes de separarlo (como el parser original)
+    def __init__(self, strategy: str = 'whitespace', terminals: Iterable[str] = (),
+                 pattern: Optional[str] = None, lowercase: bool = True):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Estrategia de tokenización desconocida '{strategy}'. "
+                             f"Opciones: {', '.join(self.STRATEGIES)}")
+        if strategy == 'regex' and not pattern:
+            raise ValueError("La estrategia 'regex' necesita un patrón")
+        if strategy == 'longest' and not terminals:
+            raise ValueError("La estrategia 'longest' necesita los terminales de la gramática")
+
+        self.strategy = strategy
+        self.lowercase = lowercase
+        self.pattern = re.compile(pattern) if pattern else None
+
+        # Terminal -> id y tabla inversa; los ids siguen el orden alfabético
+        self.terminal_ids: Dict[str, int] = {}
+        for terminal in sorted(set(terminals)):
+            self.terminal_ids[sys.intern(terminal)] = len(self.terminal_ids)
+        self.terminals: List[str] = list(self.terminal_ids)
+
+        # Trie de caracteres para 'longest': cada nodo es un diccionario y la clave
+        # None guarda el terminal que termina ahí
+        self.trie: dict = {}
+        if strategy == 'longest':
+            for terminal in self.terminals:
+                node = self.trie
+                for char in terminal:
+                    node = node.setdefault(char, {})
+                node[None] = terminal
+
+    # Tokenizador para una gramática: usa sus terminales (los declarados y los que aparecen
+    # en las reglas). Solo pasa el texto a minúsculas si todos los terminales lo están
+    @classmethod
+    def for_grammar(cls, grammar: Grammar, strategy: str = 'whitespace', pattern: Optional[str] = None,
+                    lowercase: Optional[bool] = None) -> 'Tokenizer':
+        terminals = grammar.terminals | grammar.declared_terminals
+        if lowercase is None:
+            lowercase = all(terminal == terminal.lower() for terminal in terminals)
+        return cls(strategy, terminals, pattern, lowercase)
+
+    # Lista de tokens del texto
+    def tokenize(self, text: str) -> List[str]:
+        if self.lowercase:
+            text = text.lower()
+        if self.strategy == 'whitespace':
+            pieces = text.split()
+        elif self.strategy == 'regex':
+            pieces = [match.group(0) for match in self.pattern.finditer(text)]
+        elif self.strategy == 'chars':
+            pieces = [char for char in text if not char.isspace()]
+        else:
+            return self._longest_match(text)
+
+        # Los terminales se reemplazan por la cadena de la gramática (comparaciones por identidad)
+        canonical = self.terminal_ids
+        return [token if token not in canonical else self.terminals[canonical[token]] for token in pieces]
+
+    # Ids enteros de los tokens del texto (-1 para los que no son terminales)
+    def encode(self, text: str) -> List[int]:
+        terminal_ids = self.terminal_ids
+        return [terminal_ids.get(token, -1) for token in self.tokenize(text)]
+
+    def _longest_match(self, text: str) -> List[str]:
+        trie = self.trie
+        tokens = []
+        n = len(text)
+        position = 0
+        while position < n:
+            if text[position].isspace():
+                position += 1
+                continue
+
+            # Terminal más largo que empieza en esta posición
+            node = trie
+            end = position
+            match = None
+            while end < n and text[end] in node:
+                node = node[text[end]]
+                end += 1
+                if None in node:
+                    match = node[None]
+                    match_end = end
+
+            if match is not None:
+                tokens.append(match)
+                position = match_end
+                continue
+
+            # Token desconocido: hasta un espacio o hasta donde empieza un terminal
+            end = position + 1
+            while end < n and not text[end].isspace() and text[end] not in trie:
+                end += 1
+            tokens.append(text[position:end])
+            position = end
+        return tokens
+
+
+# Implementa el algoritmo CYK con programación dinámica
+class CYKParser:
+    ENGINES = ('set', 'bitset', 'numpy', 'viterbi')
+
+    # Máximo de elementos del tensor intermedio (inicios × divisiones × pares) del motor NumPy
+    NUMPY_BLOCK_SIZE = 1 << 22
+
+    # unknown_symbol: categoría que se asigna a las palabras que no están en el léxico
+    # engine: 'set' (celdas como conjuntos), 'bitset' (celdas como máscaras de bits)
+    #         o 'numpy' (llenado vectorizado por longitud; requiere NumPy)
+    #         o 'viterbi' (PCFG: solo la mejor log-probabilidad por celda y símbolo)
+    # compiled: índices ya construidos para esta gramática (se reutilizan en vez de recalcularlos)
+    # parallel_workers: procesos para llenar cada longitud en paralelo (motor 'bitset', 0 = desactivado)
+    # parallel_threshold: longitud mínima de la frase para usar el llenado en paralelo
+    # beam_width: máximo de símbolos que conserva cada celda en el llenado de Viterbi
+    # beam_threshold: descarta los símbolos con probabilidad menor a beam_threshold veces
+    #                 la mejor de su celda (por ejemplo 1e-4) en el llenado de Viterbi
+    # context_filter: descarta de cada celda los símbolos que no pueden formar parte de un
+    #                 análisis completo según las palabras vecinas (ver _context_filter)
+    # span_cache: caché de celdas y frases compartida entre análisis (motores 'set',
+    #             'bitset' y 'viterbi'); puede compartirse entre parsers con la misma configuración
+    # metrics: receptor de métricas (ver MetricsHook) con los tiempos y estadísticas de la
+    #          tabla de cada análisis (ver _chart_statistics)
+    # tokenizer: cómo se separa la frase en palabras (por defecto, por espacios; ver Tokenizer)
+    def __init__(self, grammar: Grammar, unknown_symbol: Optional[str] = None, engine: str = 'set',
+                 compiled: Optional['CompiledGrammar'] = None, parallel_workers: int = 0,
+                 parallel_threshold: int = 200, beam_width: Optional[int] = None,
+                 beam_threshold: Optional[float] = None, context_filter: bool = False,
+                 span_cache: Optional[SpanCache] = None, metrics: Optional[MetricsHook] = None,
+                 tokenizer: Optional[Tokenizer] = None):
+        if unknown_symbol is not None and unknown_symbol not in grammar.productions:
+            raise ValueError(f"La categoría para palabras desconocidas '{unknown_symbol}' no existe en la gramática")
+        if engine not in self.ENGINES:
+            raise ValueError(f"Motor desconocido '{engine}'. Opciones: {', '.join(self.ENGINES)}")
+        if engine == 'numpy' and np is None:
+            # Por stderr: en modo --batch stdout lleva solo los resultados en JSON Lines
+            print("⚠ NumPy no está instalado; se usará el motor 'bitset'", file=sys.stderr)
+            engine = 'bitset'
+        if parallel_workers > 1 and engine != 'bitset':
+            raise ValueError("El llenado en paralelo solo está disponible con el motor 'bitset'")
+        if context_filter and parallel_workers > 1:
+            raise ValueError("El filtro de contexto no está disponible con el llenado en paralelo")
+        if span_cache is not None and (engine == 'numpy' or parallel_workers > 1):
+            raise ValueError("La caché de celdas solo está disponible con los motores 'set', 'bitset' y 'viterbi'")
+        if span_cache is not None and context_filter:
+            raise ValueError("La caché de celdas no puede combinarse con el filtro de contexto: "
+                             "las celdas filtradas dependen de las palabras vecinas")
+        if beam_width is not None and beam_width < 1:
+            raise ValueError("beam_width debe ser al menos 1")
+        if beam_threshold is not None and not 0 < beam_threshold <= 1:
+            raise ValueError("beam_threshold debe estar en (0, 1]")
+
+        self.grammar = grammar
+        self.compiled = compiled if compiled is not None else CompiledGrammar(grammar)
+        self.unknown_symbol = unknown_symbol
+        self.engine = engine
+        self.parallel_workers = parallel_workers
+        self.parallel_threshold = parallel_threshold
+        self.beam_width = beam_width
+        self.beam_threshold = beam_threshold
+        self.span_cache = span_cache
+        self.metrics = metrics
+        self.tokenizer = tokenizer if tokenizer is not None else Tokenizer.for_grammar(grammar)
+        self._pool = None
+        self.table = None
+        self.back_pointer = None
+
+        # Resultados del último llenado de Viterbi: log-probabilidad del mejor árbol
+        # y cantidad de símbolos descartados por la poda
+        self.best_log_prob: Optional[float] = None
+        self.pruned_items = 0
+
+        # Contadores del último llenado con filtro de contexto: símbolos que el llenado
+        # produjo y se conservaron, y símbolos descartados por el filtro
+        self.context_filter = context_filter
+        self.filter_kept = 0
+        self.filter_pruned = 0
+
+    # Libera el pool de procesos del llenado en paralelo, si se creó
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+    
+    # Ejecuta el algoritmo CYK usando programación dinámica
+    # Con build_tree=False solo se llena la tabla de símbolos (sin back pointers ni árbol)
+    # y el llenado se detiene en cuanto se sabe que la frase no puede ser aceptada
+    def parse(self, sentence: str, build_tree: bool = True) -> Tuple[bool, Optional[ParseTreeNode], float]:
+        start_ns = time.perf_counter_ns()
+        words = self.tokenizer.tokenize(sentence)
+        n = len(words)
+
+        # Si no hay palabras, no hay nada que analizar
+        if n == 0:
+            return False, None, 0.0
+
+        # Frase completa ya analizada: se devuelve el resultado guardado (sin llenar la tabla).
+        # Si se pide el árbol, solo sirve una entrada guardada con árbol
+        cache = self.span_cache
+        if cache is not None:
+            words = [sys.intern(word) for word in words]
+            cached = cache.get_sentence(self._cache_kind(self.engine), tuple(words))
+            if cached is not None and (not build_tree or not cached[0] or cached[1] is not None):
+                accepted, parse_tree, self.best_log_prob = cached
+                if parse_tree is not None:
+                    parse_tree = parse_tree.copy()
+                total_ns = time.perf_counter_ns() - start_ns
+                if self.metrics is not None:
+                    self.metrics('parse', {'engine': self.engine, 'words': n, 'accepted': accepted,
+                                           'cache_hit': True, 'total_ns': total_ns})
+                return accepted, parse_tree, total_ns / 1e9
+
+        fill_start = time.perf_counter_ns()
+        accepted = self._fill(words, build_tree)
+        fill_ns = time.perf_counter_ns() - fill_start
+
+        total_ns = fill_start + fill_ns - start_ns
+        execution_time = total_ns / 1e9
+
+        # Construir el árbol si fue aceptada
+        parse_tree = None
+        tree_start = time.perf_counter_ns()
+        if accepted and build_tree:
+            if self.engine in ('set', 'viterbi'):
+                parse_tree = self._build_parse_tree(0, n - 1, self.grammar.start_symbol, words)
+            else:
+                parse_tree = self._build_parse_tree_from_chart(0, n - 1, 0, words, self._chart_contains())
+
+        if self.metrics is not None:
+            data = {'engine': self.engine, 'words': n, 'accepted': accepted, 'cache_hit': False,
+                    'fill_ns': fill_ns, 'tree_ns': time.perf_counter_ns() - tree_start,
+                    'total_ns': total_ns}
+            data.update(self._chart_statistics(n, stop_early=not build_tree and self.engine != 'viterbi'))
+            self.metrics('parse', data)
+
+        if cache is not None:
+            # Se guarda una copia: el que llama puede modificar el árbol que recibe
+            cached_tree = parse_tree.copy() if parse_tree is not None else None
+            cache.put_sentence(self._cache_kind(self.engine), tuple(words), (accepted, cached_tree, self.best_log_prob),
+                               sys.getsizeof(words) + 64 * n * (2 if parse_tree is not None else 0))
+        
+        return accepted, parse_tree, execution_time
+
+    # Tipo de llenado que identifica las entradas de la caché: cada motor guarda celdas en
+    # otro formato (k_best usa el llenado de Viterbi aunque el motor sea otro), y las celdas
+    # de Viterbi dependen además de la poda
+    def _cache_kind(self, engine: str) -> tuple:
+        if engine == 'viterbi':
+            return (engine, self.beam_width, self.beam_threshold)
+        return (engine,)
+
+    # Abre una sesión de análisis incremental (ver ParseSession)
+    def session(self, sentence: str = '') -> 'ParseSession':
+        return ParseSession(self, sentence)
+
+    # Tabla completa de la frase para consultas por subcadena (ver SpanChart). Sirve
+    # también para frases rechazadas: no corta el llenado ni aplica el filtro de contexto
+    def chart(self, sentence: str) -> 'SpanChart':
+        session = ParseSession(self, sentence)
+        return SpanChart(self, session.tokens, session.rows)
+
+    # Llena la tabla con el motor configurado y devuelve si la frase fue aceptada
+    def _fill(self, words: List[str], build_tree: bool) -> bool:
+        n = len(words)
+        if self.engine == 'bitset' and self.parallel_workers > 1 and n >= self.parallel_threshold:
+            return self._fill_bitset_parallel(words)
+        if self.engine == 'bitset':
+            return self._fill_bitset(words, stop_early=not build_tree)
+        if self.engine == 'numpy':
+            return self._fill_numpy(words, stop_early=not build_tree)
+        if self.engine == 'viterbi':
+            return self._fill_viterbi(words)
+        return self._fill_sets(words, build_tree)
+
+    # Analiza la frase y devuelve el bosque compartido con todas sus derivaciones
+    # (o None si no es aceptada). No usa back pointers: el bosque se lee de la tabla
+    def parse_forest(self, sentence: str) -> Optional['ParseForest']:
+        words = self.tokenizer.tokenize(sentence)
+        if not words or not self._fill(words, build_tree=False):
+            return None
+        return ParseForest(self.compiled, words, self._chart_contains())
+
+    # Los k árboles más probables como lista de (log-probabilidad, árbol), de mayor a
+    # menor. Usa el llenado de Viterbi (con la poda configurada) y extrae los árboles de
+    # forma perezosa (algoritmo 3 de Huang y Chiang): cada nodo (i, j, A) guarda sus
+    # derivaciones ya ordenadas y un heap de candidatos; al sacar la derivación con
+    # rangos (r1, r2) de sus hijos solo se agregan las vecinas (r1 + 1, r2) y (r1, r2 + 1)
+    def k_best(self, sentence: str, k: int) -> List[Tuple[float, ParseTreeNode]]:
+        words = self.tokenizer.tokenize(sentence)
+        if not words or not self._fill_viterbi(words):
+            return []
+
+        table = self.table
+        left_scores = self.compiled.left_scores
+        derivations: Dict[Tuple[int, int, str], list] = {}
+        candidates: Dict[Tuple[int, int, str], list] = {}
+        pushed: Dict[Tuple[int, int, str], set] = {}
+
+        # Candidatos iniciales: cada regla y división con los mejores hijos (puntaje de la tabla)
+        def start(key):
+            i, j, A = key
+            if j == 0:
+                derivations[key] = [(table.get(i, 0)[A], None)]
+                return
+            heap = []
+            for k_split in range(j):
+                left = table.get(i, k_split)
+                right = table.get(i + k_split + 1, j - k_split - 1)
+                if not left or not right:
+                    continue
+                for B, left_score in left.items():
+                    for C, lhs, rule_score in left_scores.get(B, ()):
+                        if lhs == A and C in right:
+                            score = rule_score + left_score + right[C]
+                            heap.append((-score, k_split, B, C, 0, 0, rule_score))
+            heapq.heapify(heap)
+            derivations[key] = []
+            candidates[key] = heap
+            pushed[key] = {entry[1:6] for entry in heap}
+
+        # Derivación número rank del nodo (0 = la mejor) o None si no hay tantas.
+        # Es un generador para _trampoline: las derivaciones de los hijos se piden con yield
+        def derivation_steps(key, rank):
+            if key not in derivations:
+                start(key)
+            found = derivations[key]
+            heap = candidates.get(key)
+            i, j, _ = key
+            while len(found) <= rank and heap:
+                negative, k_split, B, C, r1, r2, rule_score = heapq.heappop(heap)
+                found.append((-negative, (k_split, B, C, r1, r2)))
+                left_key = (i, k_split, B)
+                right_key = (i + k_split + 1, j - k_split - 1, C)
+                for n1, n2 in ((r1 + 1, r2), (r1, r2 + 1)):
+                    if (k_split, B, C, n1, n2) in pushed[key]:
+                        continue
+                    left = yield left_key, n1
+                    right = yield right_key, n2
+                    if left is None or right is None:
+                        continue
+                    pushed[key].add((k_split, B, C, n1, n2))
+                    heapq.heappush(heap, (-(rule_score + left[0] + right[0]),
+                                          k_split, B, C, n1, n2, rule_score))
+            return found[rank] if rank < len(found) else None
+
+        def derivation(key, rank):
+            return _trampoline(derivation_steps(key, rank), derivation_steps)
+
+        def build(key, rank):
+            root = ParseTreeNode(key[2])
+            stack = [(key, rank, root)]
+            while stack:
+                (i, j, _), rank, node = stack.pop()
+                _, edge = derivations[(i, j, node.symbol)][rank]
+                if edge is None:
+                    node.children.append(ParseTreeNode(words[i]))
+                    continue
+                k_split, B, C, r1, r2 = edge
+                left_child = ParseTreeNode(B)
+                right_child = ParseTreeNode(C)
+                node.children.extend((left_child, right_child))
+                stack.append(((i + k_split + 1, j - k_split - 1, C), r2, right_child))
+                stack.append(((i, k_split, B), r1, left_child))
+            return root
+
+        root = (0, len(words) - 1, self.grammar.start_symbol)
+        result = []
+        for rank in range(k):
+            best = derivation(root, rank)
+            if best is None:
+                break
+            result.append((best[0], build(root, rank)))
+        return result
+
+    # Función contains(i, j, s) sobre la última tabla llenada: indica si el símbolo con
+    # id s genera la subcadena (i, j), sin importar el motor
+    def _chart_contains(self):
+        table = self.table
+        if self.engine == 'numpy':
+            return lambda i, j, s: table[i, j, s]
+        if self.engine == 'bitset':
+            return lambda i, j, s: (table.get(i, j) >> s) & 1
+        symbols = self.compiled.symbols
+        return lambda i, j, s: symbols[s] in table.get(i, j)
+
+    # Estadísticas de la última tabla llenada, calculadas después del llenado para no
+    # agregar trabajo a los ciclos internos cuando no hay receptor de métricas:
+    #   cells_filled: celdas con algún símbolo; items: total de (símbolo, subcadena)
+    #   splits_tried: divisiones en las que las dos mitades tienen símbolos (las demás se
+    #                 descartan sin buscar reglas)
+    #   rule_lookups_estimate: suma de |izquierda| x |derecha| sobre las divisiones probadas,
+    #                 es decir, los pares (B, C) que buscaría un llenado que probara cada par
+    #                 en cada división. Es una cota superior, no un conteo: los motores filtran
+    #                 con el índice de reglas y el de bits prueba cada par una vez por celda
+    #   back_pointers: back pointers guardados (los motores de bits no guardan ninguno)
+    # Con stop_early se repite la misma condición de corte del llenado. Las celdas que
+    # vinieron de la caché cuentan como si se hubieran calculado
+    def _chart_statistics(self, n: int, stop_early: bool) -> dict:
+        table = self.table
+        if self.engine == 'numpy':
+            counts = table.sum(axis=2)
+            sizes = [[int(counts[i, j]) for i in range(n - j)] for j in range(n)]
+        elif self.engine == 'bitset':
+            sizes = [[bin(table.get(i, j)).count('1') for i in range(n - j)] for j in range(n)]
+        else:
+            sizes = [[len(table.get(i, j)) for i in range(n - j)] for j in range(n)]
+
+        splits_tried = 0
+        rule_lookups_estimate = 0
+        if not (stop_early and not all(sizes[0])):
+            first_empty = None
+            for length in range(2, n + 1):
+                j = length - 1
+                for i in range(n - length + 1):
+                    for k in range(j):
+                        left = sizes[k][i]
+                        right = sizes[j - k - 1][i + k + 1]
+                        if left and right:
+                            splits_tried += 1
+                            rule_lookups_estimate += left * right
+                if stop_early:
+                    if any(sizes[j]):
+                        first_empty = None
+                    elif first_empty is None:
+                        first_empty = length
+                    if self._no_longer_spans(first_empty, length):
+                        break
+
+        back_pointers = 0
+        if self.back_pointer is not None:
+            back_pointers = sum(len(pointers) for pointers in self.back_pointer.cells if pointers)
+
+        items = sum(sum(row) for row in sizes)
+        cells_filled = sum(1 for row in sizes for size in row if size)
+        return {'cells': n * (n + 1) // 2, 'cells_filled': cells_filled, 'items': items,
+                'items_per_cell': items / cells_filled if cells_filled else 0.0,
+                'max_items_per_cell': max(max(row) for row in sizes),
+                'splits_tried': splits_tried, 'rule_lookups_estimate': rule_lookups_estimate,
+                'back_pointers': back_pointers}
+
+    # Solo responde si la frase pertenece al lenguaje: no guarda back pointers
+    # ni construye el árbol, y corta el llenado en cuanto el resultado es seguro
+    def recognize(self, sentence: str) -> Tuple[bool, float]:
+        accepted, _, execution_time = self.parse(sentence, build_tree=False)
+        return accepted, execution_time
+
+    # Indica si ya es imposible aceptar: todas las longitudes desde first_empty hasta
+    # length quedaron vacías. Como el hijo más largo de un nodo cubre al menos la mitad
+    # de su subcadena, todo nodo de longitud >= first_empty tiene un descendiente con
+    # longitud en [first_empty, 2 * first_empty - 1], así que nada más largo puede formarse
+    @staticmethod
+    def _no_longer_spans(first_empty: Optional[int], length: int) -> bool:
+        return first_empty is not None and length >= 2 * first_empty - 1
+
+    # Llena la tabla con conjuntos de símbolos y, si build_tree, también con back pointers
+    def _fill_sets(self, words: List[str], build_tree: bool = True) -> bool:
+        n = len(words)
+        stop_early = not build_tree
+
+        # Tabla de programación dinámica: la celda (i, j) guarda los símbolos
+        # que pueden generar la subcadena de longitud j + 1 que empieza en i
+        self.table = table = TriangularChart(n, EMPTY_CELL)
+        cells = table.cells
+        rows = table.row_offsets
+
+        # Back pointers para reconstruir el árbol (no se reservan en modo reconocimiento).
+        # Solo se guarda la primera derivación de cada símbolo: las demás se recuperan
+        # de la tabla con parse_forest, sin listas que crezcan con la ambigüedad
+        self.back_pointer = None
+        if build_tree:
+            self.back_pointer = TriangularChart(n)
+            pointer_cells = self.back_pointer.cells
+
+        context = self._context_filter(words)
+
+        # Paso 1: Llenar la diagonal (palabras individuales) usando el léxico
+        for i in range(n):
+            word = words[i]
+            preterminals = self._preterminals(word)
+            if context is not None:
+                preterminals = self._filter_symbols(preterminals, context[0][i] & context[1][i + 1])
+
+            if not preterminals:
+                # Una palabra sin categoría hace imposible cualquier derivación
+                if stop_early:
+                    return False
+                continue
+
+            cells[i] = set(preterminals)
+            if build_tree:
+                terminal = TerminalPointer(word)
+                pointer_cells[i] = {lhs: terminal for lhs in preterminals}
+        
+        # Paso 2: Llenar la tabla para subcadenas más largas
+        left_index = self.compiled.left_index
+        binary_index = self.compiled.binary_index
+        first_empty = None
+
+        kind = self._cache_kind('set')
+        for length in range(2, n + 1):
+            length_is_empty = True
+            j = length - 1
+            cache = self.span_cache if self.span_cache is not None and length >= self.span_cache.min_length else None
+
+            for i in range(n - length + 1):
+                # Celda guardada de otra frase (con back pointers si se van a necesitar);
+                # los back pointers guardan divisiones relativas, así que sirven en cualquier posición
+                if cache is not None:
+                    key = tuple(words[i:i + length])
+                    cached = cache.get_span(kind, key)
+                    if cached is not None and (not build_tree or cached[1] is not None):
+                        cell, pointers = cached
+                        if cell:
+                            length_is_empty = False
+                            cells[rows[j] + i] = cell
+                            if build_tree:
+                                pointer_cells[rows[j] + i] = pointers
+                        continue
+
+                cell = set()
+                pointers = {} if build_tree else None
+
+                # Probar todas las divisiones posibles
+                for k in range(j):
+                    left_symbols = cells[rows[k] + i]
+                    if not left_symbols:
+                        continue
+                    right_symbols = cells[rows[j - k - 1] + i + k + 1]
+                    if not right_symbols:
+                        continue
+
+                    # Buscar solo las reglas cuyos hijos están presentes en las celdas
+                    for B in left_symbols:
+                        rules = left_index.get(B)
+                        if not rules:
+                            continue
+
+                        if len(rules) <= len(right_symbols):
+                            for C, lhs in rules:
+                                if C in right_symbols:
+                                    if pointers is not None and lhs not in cell:
+                                        pointers[lhs] = BackPointer(k, B, C)
+                                    cell.add(lhs)
+                        else:
+                            for C in right_symbols:
+                                for lhs in binary_index.get((B, C), ()):
+                                    if pointers is not None and lhs not in cell:
+                                        pointers[lhs] = BackPointer(k, B, C)
+                                    cell.add(lhs)
+
+                if context is not None and cell:
+                    cell = self._filter_symbols(cell, context[0][i] & context[1][i + length])
+                    if pointers is not None:
+                        pointers = {lhs: pointers[lhs] for lhs in cell}
+
+                if cache is not None:
+                    # La tabla y la caché comparten la celda: se congela para que nadie la modifique
+                    cell = frozenset(cell)
+                    if pointers is not None:
+                        pointers = MappingProxyType(pointers)
+                    size = sys.getsizeof(key) + sys.getsizeof(cell)
+                    if pointers is not None:
+                        size += sys.getsizeof(pointers) + 64 * len(pointers)
+                    cache.put_span(kind, key, (cell or EMPTY_CELL, pointers), size)
+
+                # Solo se materializan las celdas que tienen símbolos
+                if cell:
+                    length_is_empty = False
+                    cells[rows[j] + i] = cell
+                    if pointers is not None:
+                        pointer_cells[rows[j] + i] = pointers
+
+            if stop_early:
+                if not length_is_empty:
+                    first_empty = None
+                elif first_empty is None:
+                    first_empty = length
+                if self._no_longer_spans(first_empty, length):
+                    return False
+        
+        # Verificar si se puede formar el símbolo inicial
+        return self.grammar.start_symbol in table.get(0, n - 1)
+
+    # Llenado de Viterbi (CKY probabilístico): cada celda es un diccionario símbolo ->
+    # mejor log-probabilidad, con un solo back pointer (el de esa mejor derivación).
+    # Después de llenar cada celda se aplica la poda por haz configurada
+    def _fill_viterbi(self, words: List[str]) -> bool:
+        n = len(words)
+        compiled = self.compiled
+        left_scores = compiled.left_scores
+
+        self.table = table = TriangularChart(n, EMPTY_CELL)
+        self.back_pointer = TriangularChart(n)
+        cells = table.cells
+        rows = table.row_offsets
+        pointer_cells = self.back_pointer.cells
+        self.best_log_prob = None
+        self.pruned_items = 0
+        context = self._context_filter(words)
+
+        # Paso 1: la diagonal con los pesos del léxico (la categoría de respaldo vale 1.0)
+        for i in range(n):
+            word = words[i]
+            scores = compiled.lexicon_scores.get(word)
+            if not scores and self.unknown_symbol is not None:
+                scores = {self.unknown_symbol: 0.0}
+            if context is not None and scores:
+                scores = self._filter_symbols(scores, context[0][i] & context[1][i + 1])
+            if not scores:
+                continue
+
+            cell = self._prune_cell(dict(scores))
+            cells[i] = cell
+            terminal = TerminalPointer(word)
+            pointer_cells[i] = {lhs: terminal for lhs in cell}
+
+        # Paso 2: subcadenas más largas, quedándose con la mejor derivación de cada símbolo
+        kind = self._cache_kind('viterbi')
+        for length in range(2, n + 1):
+            j = length - 1
+            cache = self.span_cache if self.span_cache is not None and length >= self.span_cache.min_length else None
+
+            for i in range(n - length + 1):
+                if cache is not None:
+                    key = tuple(words[i:i + length])
+                    cached = cache.get_span(kind, key)
+                    if cached is not None:
+                        cell, pointers = cached
+                        if cell:
+                            cells[rows[j] + i] = cell
+                            pointer_cells[rows[j] + i] = pointers
+                        continue
+
+                cell = {}
+                pointers = {}
+
+                for k in range(j):
+                    left_symbols = cells[rows[k] + i]
+                    if not left_symbols:
+                        continue
+                    right_symbols = cells[rows[j - k - 1] + i + k + 1]
+                    if not right_symbols:
+                        continue
+
+                    for B, left_score in left_symbols.items():
+                        for C, lhs, rule_score in left_scores.get(B, ()):
+                            right_score = right_symbols.get(C)
+                            if right_score is None:
+                                continue
+                            score = left_score + right_score + rule_score
+                            if score > cell.get(lhs, -math.inf):
+                                cell[lhs] = score
+                                pointers[lhs] = BackPointer(k, B, C)
+
+                if context is not None and cell:
+                    cell = self._filter_symbols(cell, context[0][i] & context[1][i + length])
+                if cell:
+                    cell = self._prune_cell(cell)
+                    pointers = {lhs: pointers[lhs] for lhs in cell}
+                if cache is not None:
+                    size = sys.getsizeof(key) + sys.getsizeof(cell) + sys.getsizeof(pointers) + 64 * len(pointers)
+                    # La tabla y la caché comparten la celda: se guarda de solo lectura
+                    cell, pointers = MappingProxyType(cell), MappingProxyType(pointers)
+                    cache.put_span(kind, key, (cell or EMPTY_CELL, pointers), size)
+                if cell:
+                    cells[rows[j] + i] = cell
+                    pointer_cells[rows[j] + i] = pointers
+
+        root = table.get(0, n - 1)
+        start_symbol = self.grammar.start_symbol
+        if start_symbol not in root:
+            return False
+        self.best_log_prob = root[start_symbol]
+        return True
+
+    # Poda por haz de una celda de Viterbi: primero el umbral relativo a la mejor
+    # log-probabilidad y luego el máximo de símbolos
+    def _prune_cell(self, cell: Dict[str, float]) -> Dict[str, float]:
+        size = len(cell)
+        if self.beam_threshold is not None:
+            floor = max(cell.values()) + math.log(self.beam_threshold)
+            cell = {symbol: score for symbol, score in cell.items() if score >= floor}
+        if self.beam_width is not None and len(cell) > self.beam_width:
+            best = heapq.nlargest(self.beam_width, cell.items(), key=lambda item: item[1])
+            cell = dict(best)
+        self.pruned_items += size - len(cell)
+        return cell
+
+    # Llena la tabla con máscaras de bits: cada no-terminal es un bit de un entero.
+    # Además de las celdas se mantienen, por símbolo, las posiciones donde terminan sus
+    # subcadenas que empiezan en i (ends_from[i]) y donde empiezan las que terminan en e
+    # (starts_to[e]). Así la celda (i, e) prueba cada par B C con un único AND de enteros
+    # en lugar de recorrer todos los puntos de corte: el coste por celda depende de los
+    # pares candidatos y no de la longitud. Con 1.txt es ~3.5x más rápido que el motor
+    # 'set' a 81 tokens y ~15x a 401; con la gramática sintética de 300 símbolos, donde
+    # casi todos los pares son candidatos, queda a la par (~1.1x)
+    def _fill_bitset(self, words: List[str], stop_early: bool = False) -> bool:
+        n = len(words)
+        compiled = self.compiled
+        right_masks = compiled.right_masks
+        pair_masks = compiled.pair_masks
+
+        # Cada celda es un entero; el bit k indica que compiled.symbols[k] genera la subcadena
+        self.table = table = TriangularChart(n, 0)
+        cells = table.cells
+        rows = table.row_offsets
+        self.back_pointer = None
+
+        # ends_from[i][b]: bit e si symbols[b] genera words[i:e]; starts_to[e][c]: bit i
+        # si symbols[c] genera words[i:e]. from_mask/to_mask son la unión de símbolos
+        ends_from: List[Dict[int, int]] = [{} for _ in range(n + 1)]
+        starts_to: List[Dict[int, int]] = [{} for _ in range(n + 1)]
+        from_mask = [0] * (n + 1)
+        to_mask = [0] * (n + 1)
+
+        def record(i: int, end: int, mask: int) -> None:
+            row_from = ends_from[i]
+            row_to = starts_to[end]
+            end_bit = 1 << end
+            start_bit = 1 << i
+            from_mask[i] |= mask
+            to_mask[end] |= mask
+            while mask:
+                low = mask & -mask
+                a = low.bit_length() - 1
+                mask ^= low
+                row_from[a] = row_from.get(a, 0) | end_bit
+                row_to[a] = row_to.get(a, 0) | start_bit
+
+        unknown_mask = 0
+        if self.unknown_symbol is not None:
+            unknown_mask = 1 << compiled.symbol_ids[self.unknown_symbol]
+
+        context = self._context_filter(words)
+
+        # Paso 1: la diagonal sale directamente del léxico
+        for i in range(n):
+            cells[i] = compiled.lexicon_masks.get(words[i], unknown_mask)
+            if context is not None:
+                cells[i] = self._filter_mask(cells[i], context[0][i] & context[1][i + 1])
+            if stop_early and not cells[i]:
+                return False
+            record(i, i + 1, cells[i])
+
+        # Paso 2: combinar celdas con AND/OR sobre las máscaras precalculadas
+        first_empty = None
+        kind = self._cache_kind('bitset')
+        for length in range(2, n + 1):
+            length_mask = 0
+            j = length - 1
+            cache = self.span_cache if self.span_cache is not None and length >= self.span_cache.min_length else None
+
+            for i in range(n - length + 1):
+                if cache is not None:
+                    key = tuple(words[i:i + length])
+                    cell = cache.get_span(kind, key)
+                    if cell is not None:
+                        cells[rows[j] + i] = cell
+                        length_mask |= cell
+                        if cell:
+                            record(i, i + length, cell)
+                        continue
+
+                cell = 0
+                row_from = ends_from[i]
+                row_to = starts_to[i + length]
+                right = to_mask[i + length]
+
+                # Cada B que empieza en i se combina con cada C que termina en i + length;
+                # hay un punto de corte común si algún fin de B coincide con un inicio de C.
+                # Solo están registradas las subcadenas más cortas, así que el corte cae
+                # siempre dentro de (i, i + length)
+                left = from_mask[i]
+                while left:
+                    low = left & -left
+                    b = low.bit_length() - 1
+                    left ^= low
+
+                    hits = right_masks[b] & right
+                    if hits:
+                        ends = row_from[b]
+                        pairs = pair_masks[b]
+                        while hits:
+                            low_c = hits & -hits
+                            c = low_c.bit_length() - 1
+                            hits ^= low_c
+                            if ends & row_to[c]:
+                                cell |= pairs[c]
+
+                if context is not None and cell:
+                    cell = self._filter_mask(cell, context[0][i] & context[1][i + length])
+                if cache is not None:
+                    cache.put_span(kind, key, cell, sys.getsizeof(key) + sys.getsizeof(cell))
+                cells[rows[j] + i] = cell
+                length_mask |= cell
+                if cell:
+                    record(i, i + length, cell)
+
+            if stop_early:
+                if length_mask:
+                    first_empty = None
+                elif first_empty is None:
+                    first_empty = length
+                if self._no_longer_spans(first_empty, length):
+                    return False
+
+        # El símbolo inicial siempre es el bit 0
+        return bool(table.get(0, n - 1) & 1)
+
+    # Llena la tabla de bits por frentes de onda: todas las celdas de una misma longitud
+    # dependen solo de longitudes menores, así que cada longitud se reparte entre los
+    # procesos del pool. Las celdas viven en memoria compartida como palabras de 64 bits,
+    # por lo que ningún proceso recibe ni devuelve celdas serializadas
+    def _fill_bitset_parallel(self, words: List[str]) -> bool:
+        n = len(words)
+        compiled = self.compiled
+        cell_bytes = 8 * max(1, (len(compiled.symbols) + 63) // 64)
+
+        if self._pool is None:
+            # El rastreador de recursos se inicia antes del pool para que los procesos lo
+            # hereden y registren la memoria compartida en el mismo (ver _fill_wave_block)
+            resource_tracker.ensure_running()
+            self._pool = multiprocessing.Pool(self.parallel_workers, initializer=_init_wave_worker,
+                                              initargs=(compiled,))
+
+        self.table = table = TriangularChart(n, 0)
+        self.back_pointer = None
+        segment = shared_memory.SharedMemory(create=True, size=len(table.cells) * cell_bytes)
+        try:
+            buffer = segment.buf
+            unknown_mask = 0
+            if self.unknown_symbol is not None:
+                unknown_mask = 1 << compiled.symbol_ids[self.unknown_symbol]
+
+            # Paso 1: la diagonal la escribe el proceso principal
+            for i in range(n):
+                mask = compiled.lexicon_masks.get(words[i], unknown_mask)
+                buffer[i * cell_bytes:(i + 1) * cell_bytes] = mask.to_bytes(cell_bytes, 'little')
+
+            # Paso 2: frentes de onda de varias longitudes, repartidos en bloques de inicios.
+            # Cada bloque recalcula (height - 1) * height / 2 celdas del vecino: con height
+            # de un cuarto del bloque eso es a lo sumo un 12% más de celdas, a cambio de
+            # height veces menos rondas del pool
+            length = 2
+            while length <= n:
+                starts = n - length + 1
+                block = max(1, -(-starts // self.parallel_workers))
+                height = max(1, block // 4)
+                tasks = [(segment.name, n, cell_bytes, length, height, first, min(starts, first + block))
+                         for first in range(0, starts, block)]
+                self._pool.map(_fill_wave_block, tasks)
+                length += height
+
+            # Copiar la tabla compartida a la tabla local para reconstruir el árbol
+            for index in range(len(table.cells)):
+                table.cells[index] = int.from_bytes(
+                    buffer[index * cell_bytes:(index + 1) * cell_bytes], 'little')
+            del buffer
+        finally:
+            segment.close()
+            segment.unlink()
+
+        return bool(table.get(0, n - 1) & 1)
+
+    # Llena la tabla como un arreglo booleano [i, j, A], una longitud a la vez:
+    # todas las posiciones de inicio y divisiones se contraen juntas con NumPy
+    def _fill_numpy(self, words: List[str], stop_early: bool = False) -> bool:
+        n = len(words)
+        compiled = self.compiled
+        pair_left, pair_right, pair_to_lhs, lexicon_vectors = compiled.numpy_tables()
+        N = len(compiled.symbols)
+        P = len(pair_left)
+
+        self.table = table = np.zeros((n, n, N), dtype=bool)
+        self.back_pointer = None
+
+        # La misma tabla indexada por la posición final: by_end[e, j] = table[e - j, j]. Así,
+        # para una longitud fija, los hijos derechos de todas las divisiones son una rebanada.
+        # Solo se proyecta al espacio de pares (B, C) el bloque que se está combinando, para
+        # que la memoria extra sea O(n² · N) y no O(n² · P)
+        by_end = np.zeros((n, n, N), dtype=bool)
+
+        unknown_vector = np.zeros(N, dtype=bool)
+        if self.unknown_symbol is not None:
+            unknown_vector[compiled.symbol_ids[self.unknown_symbol]] = True
+
+        # Filtro de contexto como matrices booleanas: start_ok[i, A] y end_ok[e, A]
+        context = self._context_filter(words)
+        if context is not None:
+            bits = np.arange(N)
+            start_ok = np.array([(mask >> bits) & 1 for mask in context[0]], dtype=bool)
+            end_ok = np.array([(mask >> bits) & 1 for mask in context[1]], dtype=bool)
+        produced = 0
+
+        # Paso 1: la diagonal sale directamente del léxico
+        for i in range(n):
+            table[i, 0] = lexicon_vectors.get(words[i], unknown_vector)
+        if context is not None:
+            produced += int(table[:, 0].sum())
+            table[:, 0] &= start_ok & end_ok[1:]
+        by_end[:, 0] = table[:, 0]
+
+        # starts_with[i, A]: A genera alguna subcadena que empieza en i; ends_with[e, A]: alguna
+        # que termina en e (con las longitudes ya llenadas)
+        starts_with = table[:, 0].copy()
+        ends_with = np.zeros((n + 1, N), dtype=bool)
+        ends_with[1:] = table[:, 0]
+
+        if stop_early and not table[:, 0].any(axis=1).all():
+            return False
+
+        if P == 0:
+            return bool(table[0, n - 1, 0])
+
+        # Paso 2: para cada longitud, combinar todas las divisiones de todos los inicios
+        first_empty = None
+        for length in range(2, n + 1):
+            starts = n - length + 1
+            splits = length - 1
+
+            # left_all[s, k]: celda (s, k); right_all[s, k]: celda (s + k + 1, length - k - 2),
+            # que termina siempre en s + length - 1
+            left_all = table[:starts, :splits]
+            right_all = by_end[length - 1:, splits - 1::-1]
+
+            # Procesar los inicios por bloques para acotar la memoria del tensor intermedio
+            block = max(1, self.NUMPY_BLOCK_SIZE // (splits * P))
+            for first in range(0, starts, block):
+                last = min(starts, first + block)
+
+                # Solo se proyectan los pares cuyo hijo izquierdo empieza en algún inicio del
+                # bloque y cuyo hijo derecho termina en algún final del bloque
+                active = np.flatnonzero(starts_with[first:last].any(axis=0)[pair_left]
+                                        & ends_with[first + length:last + length].any(axis=0)[pair_right])
+                if not len(active):
+                    continue
+
+                # Un par sirve si aparece en alguna división; luego se proyecta a los LHS
+                left = left_all[first:last][:, :, pair_left[active]]
+                right = right_all[first:last][:, :, pair_right[active]]
+                cells = ((left & right).any(axis=1).astype(np.float32) @ pair_to_lhs[active]) > 0
+                if context is not None:
+                    produced += int(cells.sum())
+                    cells &= start_ok[first:last] & end_ok[first + length:last + length]
+
+                table[first:last, length - 1] = cells
+                by_end[first + length - 1:last + length - 1, length - 1] = cells
+                starts_with[first:last] |= cells
+                ends_with[first + length:last + length] |= cells
+
+            if stop_early:
+                if table[:starts, length - 1].any():
+                    first_empty = None
+                elif first_empty is None:
+                    first_empty = length
+                if self._no_longer_spans(first_empty, length):
+                    break
+
+        if context is not None:
+            self.filter_kept = int(table.sum())
+            self.filter_pruned = produced - self.filter_kept
+        return bool(table[0, n - 1, 0])
+
+    # Filtro de contexto para una frase: máscaras start_ok y end_ok (por posición) tales
+    # que el símbolo A puede cubrir [i, e) en un análisis completo solo si su bit está en
+    # start_ok[i] & end_ok[e]. En un árbol completo, la hoja de la palabra i - 1 queda
+    # justo a la izquierda de A y la de la palabra e justo a la derecha, así que A debe
+    # poder seguir a algún pre-terminal de la palabra anterior (o empezar la frase si
+    # i = 0) y preceder a alguno de la siguiente (o terminarla). El filtro nunca descarta
+    # un símbolo que participe en un análisis completo: no cambia la aceptación ni el bosque
+    # (con el motor 'set', en frases ambiguas puede elegirse otro árbol igualmente válido)
+    def _context_filter(self, words: List[str]) -> Optional[Tuple[List[int], List[int]]]:
+        if not self.context_filter:
+            return None
+        compiled = self.compiled
+        begin, end, follow, precede = compiled.context_masks()
+        n = len(words)
+
+        unknown_mask = 0
+        if self.unknown_symbol is not None:
+            unknown_mask = 1 << compiled.symbol_ids[self.unknown_symbol]
+        lexical = [compiled.lexicon_masks.get(word, unknown_mask) for word in words]
+
+        def union(table, mask):
+            result = 0
+            while mask:
+                low = mask & -mask
+                result |= table[low.bit_length() - 1]
+                mask ^= low
+            return result
+
+        start_ok = [begin] + [union(follow, lexical[i - 1]) for i in range(1, n)]
+        end_ok = [0] + [union(precede, lexical[e]) for e in range(1, n)] + [end]
+        self.filter_kept = 0
+        self.filter_pruned = 0
+        return start_ok, end_ok
+
+    # Aplica el filtro de contexto a una celda de símbolos (conjunto o diccionario)
+    def _filter_symbols(self, cell, allowed: int):
+        symbol_ids = self.compiled.symbol_ids
+        kept = [symbol for symbol in cell if (allowed >> symbol_ids[symbol]) & 1]
+        self.filter_kept += len(kept)
+        self.filter_pruned += len(cell) - len(kept)
+        if isinstance(cell, dict):
+            return {symbol: cell[symbol] for symbol in kept}
+        return set(kept)
+
+    # Aplica el filtro de contexto a la máscara de una celda y actualiza los contadores
+    def _filter_mask(self, mask: int, allowed: int) -> int:
+        kept = mask & allowed
+        kept_count = bin(kept).count('1')
+        self.filter_kept += kept_count
+        self.filter_pruned += bin(mask).count('1') - kept_count
+        return kept
+
+    # Devuelve los pre-terminales de una palabra (o la categoría para desconocidas)
+    def _preterminals(self, word: str) -> Set[str]:
+        preterminals = self.compiled.lexicon.get(word)
+        if preterminals:
+            return preterminals
+        if self.unknown_symbol is not None:
+            return {self.unknown_symbol}
+        return set()
+
+    # Construye el árbol recursivamente
+    # (con una pila explícita: los árboles profundos no agotan el límite de recursión)
+    def _build_parse_tree(self, i: int, j: int, symbol: str, words: List[str]) -> ParseTreeNode:
+        root = ParseTreeNode(symbol)
+        back_pointer = self.back_pointer
+        stack = [(i, j, root)]
+        while stack:
+            i, j, node = stack.pop()
+            pointer = (back_pointer.get(i, j) or {}).get(node.symbol)
+
+            # Caso base: llegamos a una palabra
+            if j == 0:
+                if isinstance(pointer, TerminalPointer):
+                    node.children.append(ParseTreeNode(pointer.word))
+            elif pointer is not None:
+                # Subárboles de la división guardada
+                k, B, C = pointer.split, pointer.left, pointer.right
+                left_child = ParseTreeNode(B)
+                right_child = ParseTreeNode(C)
+                node.children.extend((left_child, right_child))
+                stack.append((i + k + 1, j - k - 1, right_child))
+                stack.append((i, k, left_child))
+        
+        return root
+
+    # Construye el árbol a partir de una tabla sin back pointers, buscando una regla que encaje
+    # contains(i, j, s) indica si el símbolo con id s genera la subcadena (i, j)
+    def _build_parse_tree_from_chart(self, i: int, j: int, symbol_id: int, words: List[str],
+                                     contains) -> ParseTreeNode:
+        symbols = self.compiled.symbols
+        rules_by_lhs = self.compiled.rules_by_lhs
+        root = ParseTreeNode(symbols[symbol_id])
+        stack = [(i, j, symbol_id, root)]
+        while stack:
+            i, j, symbol_id, node = stack.pop()
+
+            # Caso base: llegamos a una palabra
+            if j == 0:
+                node.children.append(ParseTreeNode(words[i]))
+                continue
+
+            # Primera división y regla cuyos hijos están en la tabla
+            found = False
+            for k in range(j):
+                for b, c in rules_by_lhs[symbol_id]:
+                    if contains(i, k, b) and contains(i + k + 1, j - k - 1, c):
+                        left_child = ParseTreeNode(symbols[b])
+                        right_child = ParseTreeNode(symbols[c])
+                        node.children.extend((left_child, right_child))
+                        stack.append((i + k + 1, j - k - 1, c, right_child))
+                        stack.append((i, k, b, left_child))
+                        found = True
+                        break
+                if found:
+                    break
+
+        return root
+
+
+# Sesión de análisis incremental: conserva la tabla entre ediciones de la frase.
+# La tabla se guarda por filas: rows[i][j] es la máscara de bits (como en el motor
+# 'bitset') de la subcadena de longitud j + 1 que empieza en i. Una celda solo depende
+# de las palabras que cubre, así que al editar las posiciones [p, p + quitadas):
+#   - las filas que empiezan después de la edición no cambian (solo se desplazan);
+#   - en las filas anteriores se conservan las celdas que terminan antes de p;
+#   - se recalculan solo las celdas que cubren la edición, de derecha a izquierda.
+# Agregar una palabra al final recalcula una celda por fila: O(n) celdas, O(n²) trabajo
+class ParseSession:
+    def __init__(self, parser: CYKParser, sentence: str = ''):
+        self.parser = parser
+        self.compiled = parser.compiled
+        self.unknown_mask = 0
+        if parser.unknown_symbol is not None:
+            self.unknown_mask = 1 << self.compiled.symbol_ids[parser.unknown_symbol]
+
+        self.tokens: List[str] = []
+        self.rows: List[List[int]] = []
+
+        # Celdas recalculadas y tiempo de la última edición
+        self.cells_computed = 0
+        self.last_edit_time = 0.0
+
+        if sentence:
+            self.append(sentence)
+
+    # Inserta palabras antes de la posición indicada (position = len(tokens) agrega al final)
+    def insert(self, position: int, words) -> bool:
+        return self._edit(position, 0, self._split(words))
+
+    # Elimina count palabras desde la posición indicada
+    def delete(self, position: int, count: int = 1) -> bool:
+        return self._edit(position, count, [])
+
+    # Reemplaza las palabras desde la posición indicada por las nuevas (misma cantidad)
+    def replace(self, position: int, words) -> bool:
+        new_tokens = self._split(words)
+        return self._edit(position, len(new_tokens), new_tokens)
+
+    # Agrega palabras al final de la frase
+    def append(self, words) -> bool:
+        return self._edit(len(self.tokens), 0, self._split(words))
+
+    # Indica si la frase actual pertenece al lenguaje
+    def accepted(self) -> bool:
+        return bool(self.tokens) and bool(self.rows[0][-1] & 1)
+
+    # Árbol de la frase actual (el mismo que daría CYKParser con el motor 'bitset')
+    def parse_tree(self) -> Optional[ParseTreeNode]:
+        if not self.accepted():
+            return None
+        rows = self.rows
+        return self.parser._build_parse_tree_from_chart(
+            0, len(self.tokens) - 1, 0, self.tokens, lambda i, j, s: (rows[i][j] >> s) & 1)
+
+    # Consultas por subcadena sobre la frase actual (una copia: no cambia con las ediciones)
+    def chart(self) -> 'SpanChart':
+        return SpanChart(self.parser, list(self.tokens), [list(row) for row in self.rows])
+
+    # Misma interfaz que CYKParser.parse sobre la frase actual (el tiempo es el de la última edición)
+    def result(self, build_tree: bool = True) -> Tuple[bool, Optional[ParseTreeNode], float]:
+        return self.accepted(), self.parse_tree() if build_tree else None, self.last_edit_time
+
+    # Un texto se separa con el tokenizador del parser; una lista ya son las palabras
+    def _split(self, words) -> List[str]:
+        if isinstance(words, str):
+            return self.parser.tokenizer.tokenize(words)
+        if self.parser.tokenizer.lowercase:
+            return [word.lower() for word in words]
+        return list(words)
+
+    # Aplica una edición: quita removed palabras en position e inserta new_tokens ahí
+    def _edit(self, position: int, removed: int, new_tokens: List[str]) -> bool:
+        if not 0 <= position <= len(self.tokens) or position + removed > len(self.tokens):
+            raise IndexError(f"Edición fuera de la frase: posición {position}, {removed} palabras")
+
+        start_time = time.perf_counter()
+        inserted = len(new_tokens)
+        self.tokens[position:position + removed] = new_tokens
+        n = len(self.tokens)
+
+        # Filas anteriores: solo sobreviven las celdas que terminan antes de la edición
+        for i in range(position):
+            del self.rows[i][position - i:]
+        self.rows[position:position + removed] = [[] for _ in range(inserted)]
+
+        # Recalcular de derecha a izquierda: cada celda usa filas que empiezan más adelante
+        self.cells_computed = 0
+        for i in range(position + inserted - 1, -1, -1):
+            self._extend_row(i, n)
+
+        self.last_edit_time = time.perf_counter() - start_time
+        return self.accepted()
+
+    # Completa la fila i hasta cubrir la frase (longitudes que le faltan)
+    def _extend_row(self, i: int, n: int):
+        compiled = self.compiled
+        right_masks = compiled.right_masks
+        pair_masks = compiled.pair_masks
+        rows = self.rows
+        row = rows[i]
+
+        if not row:
+            row.append(compiled.lexicon_masks.get(self.tokens[i], self.unknown_mask))
+            self.cells_computed += 1
+
+        for length in range(len(row) + 1, n - i + 1):
+            cell = 0
+            for k in range(1, length):
+                left = row[k - 1]
+                if not left:
+                    continue
+                right = rows[i + k][length - k - 1]
+                if not right:
+                    continue
+
+                while left:
+                    low = left & -left
+                    b = low.bit_length() - 1
+                    left ^= low
+
+                    hits = right_masks[b] & right
+                    if hits:
+                        pairs = pair_masks[b]
+                        while hits:
+                            low_c = hits & -hits
+                            cell |= pairs[low_c.bit_length() - 1]
+                            hits ^= low_c
+
+            row.append(cell)
+            self.cells_computed += 1
+
+
+# Consultas sobre una tabla CYK completa, acepte o no la frase: qué símbolos cubren cada
+# subcadena, dónde aparece una categoría y qué constituyentes cubren la frase (chunking y
+# ubicación de errores sin volver a analizar subcadenas). Las subcadenas se indican como
+# (inicio, fin) con fin exclusivo, como en los slices de Python. La tabla tiene el formato
+# de ParseSession: rows[i][j] es la máscara de la subcadena de longitud j + 1 que empieza en i
+class SpanChart:
+    def __init__(self, parser: CYKParser, words: List[str], rows: List[List[int]]):
+        self.parser = parser
+        self.compiled = parser.compiled
+        self.words = words
+        self.rows = rows
+
+    # Indica si la frase completa pertenece al lenguaje
+    def accepted(self) -> bool:
+        return bool(self.words) and bool(self.rows[0][-1] & 1)
+
+    # Símbolos que generan las palabras [start, end)
+    def labels(self, start: int, end: int) -> Set[str]:
+        symbols = self.compiled.symbols
+        mask = self._mask(start, end)
+        result = set()
+        while mask:
+            low = mask & -mask
+            result.add(symbols[low.bit_length() - 1])
+            mask ^= low
+        return result
+
+    # Indica si label genera las palabras [start, end)
+    def covers(self, label: str, start: int, end: int) -> bool:
+        symbol_id = self.compiled.symbol_ids.get(label)
+        return symbol_id is not None and bool((self._mask(start, end) >> symbol_id) & 1)
+
+    # Todas las subcadenas que genera label, ordenadas por inicio y luego por longitud.
+    # Con maximal=True solo las que no están contenidas en otra subcadena del mismo label
+    def find_all(self, label: str, maximal: bool = False) -> List[Tuple[int, int]]:
+        symbol_id = self.compiled.symbol_ids.get(label)
+        if symbol_id is None:
+            return []
+        bit = 1 << symbol_id
+        spans = [(i, i + j + 1) for i, row in enumerate(self.rows) for j, mask in enumerate(row) if mask & bit]
+        if not maximal:
+            return spans
+
+        # Recorriendo por inicio y de la más larga a la más corta, una subcadena está
+        # contenida en otra si no termina más allá del mayor fin visto hasta ahora
+        result = []
+        furthest = 0
+        for start, end in sorted(spans, key=lambda span: (span[0], -span[1])):
+            if end > furthest:
+                result.append((start, end))
+                furthest = end
+        return result
+
+    # Cubre la frase de izquierda a derecha con la menor cantidad de constituyentes
+    # (inicio, fin, label) usando solo los labels indicados. Si labels es None se usan los
+    # no-terminales de la gramática original (sin los auxiliares que agregó CNFConverter).
+    # Las palabras que ningún constituyente puede cubrir quedan como (i, i + 1, None): primero
+    # se minimizan esos huecos y luego la cantidad de piezas. Si varios labels cubren una
+    # pieza se elige el primero de labels (o el de menor id, el símbolo inicial primero)
+    def minimal_cover(self, labels: Optional[Iterable[str]] = None) -> List[Tuple[int, int, Optional[str]]]:
+        compiled = self.compiled
+        if labels is None:
+            generated = self.parser.grammar.generated_non_terminals
+            order = [symbol_id for symbol_id, symbol in enumerate(compiled.symbols) if symbol not in generated]
+        else:
+            order = [compiled.symbol_ids[label] for label in labels if label in compiled.symbol_ids]
+        allowed = 0
+        for symbol_id in order:
+            allowed |= 1 << symbol_id
+
+        # best[e] = (huecos, piezas, inicio de la última pieza) para cubrir las palabras [0, e)
+        n = len(self.words)
+        rows = self.rows
+        best: List[Optional[Tuple[int, int, int]]] = [(0, 0, 0)] + [None] * n
+        for end in range(1, n + 1):
+            gaps, pieces, _ = best[end - 1]
+            candidate = (gaps + 1, pieces + 1, end - 1)
+            for start in range(end):
+                if rows[start][end - start - 1] & allowed:
+                    gaps, pieces, _ = best[start]
+                    candidate = min(candidate, (gaps, pieces + 1, start))
+            best[end] = candidate
+
+        cover = []
+        end = n
+        while end > 0:
+            start = best[end][2]
+            mask = rows[start][end - start - 1] & allowed
+            label = next((compiled.symbols[s] for s in order if (mask >> s) & 1), None)
+            cover.append((start, end, label))
+            end = start
+        cover.reverse()
+        return cover
+
+    # Árbol de label sobre las palabras [start, end), o None si label no las genera
+    def tree(self, label: str, start: int, end: int) -> Optional[ParseTreeNode]:
+        if not self.covers(label, start, end):
+            return None
+        rows = self.rows
+        return self.parser._build_parse_tree_from_chart(
+            start, end - start - 1, self.compiled.symbol_ids[label], self.words,
+            lambda i, j, s: (rows[i][j] >> s) & 1)
+
+    def _mask(self, start: int, end: int) -> int:
+        if not 0 <= start < end <= len(self.words):
+            raise IndexError(f"Subcadena fuera de la frase: [{start}, {end})")
+        return self.rows[start][end - start - 1]
+
+
+# Parser de Earley sobre la gramática original (sin convertir a CNF)
+# Los ítems son tuplas (regla, punto, origen). Las producciones epsilon se manejan
+# con la técnica de Aycock y Horspool: al predecir un no-terminal anulable el punto
+# avanza de inmediato, así que los ítems completos de longitud cero se pueden ignorar.
+# Con la optimización de Leo, las cadenas de completados deterministas (recursión por
+# la derecha) se resuelven con un solo ítem, y el reconocimiento es lineal en gramáticas
+# LR. Armar el árbol también es lineal en ellas: cada símbolo busca sus divisiones en un
+# índice de posiciones por ítem (ver _match_rule) en vez de recorrer la tabla
+class EarleyParser:
+    # unknown_symbol: no-terminal que se asigna a las palabras que no aparecen en la gramática
+    # tokenizer: cómo se separa la frase en palabras (ver Tokenizer)
+    def __init__(self, grammar: Grammar, unknown_symbol: Optional[str] = None,
+                 tokenizer: Optional[Tokenizer] = None):
+        if unknown_symbol is not None and unknown_symbol not in grammar.productions:
+            raise ValueError(f"La categoría para palabras desconocidas '{unknown_symbol}' no existe en la gramática")
+
+        self.grammar = grammar
+        self.unknown_symbol = unknown_symbol
+        self.tokenizer = tokenizer if tokenizer is not None else Tokenizer.for_grammar(grammar)
+        self.non_terminals = set(grammar.non_terminals) | set(grammar.productions.keys())
+
+        # Símbolo inicial aumentado (S' -> S): nunca aparece a la derecha de una regla,
+        # así que su ítem completo siempre queda en la tabla aunque se use Leo
+        augmented = grammar.start_symbol + "'"
+        while augmented in self.non_terminals:
+            augmented += "'"
+        self.augmented_symbol = augmented
+
+        # Reglas como (lhs, rhs) con rhs en tupla; las producciones epsilon quedan vacías
+        self.rules: List[Tuple[str, Tuple[str, ...]]] = [(augmented, (grammar.start_symbol,))]
+        self.rules_by_lhs: Dict[str, List[int]] = defaultdict(list)
+        self.terminals: Set[str] = set()
+        for lhs, productions in grammar.productions.items():
+            for rhs in productions:
+                if CNFConverter._is_epsilon_production(rhs):
+                    rhs = ()
+                rhs = tuple(rhs)
+                self.rules_by_lhs[lhs].append(len(self.rules))
+                self.rules.append((lhs, rhs))
+                self.terminals.update(symbol for symbol in rhs if symbol not in self.non_terminals)
+        self.rules_by_lhs = dict(self.rules_by_lhs)
+
+        self.nullable = self._nullable_symbols()
+        self.sets = None
+        self.words = None
+        self._derivations = None
+        self._in_progress = None
+        self._item_positions = None
+        self._cycle_hit = False
+
+    # No-terminales que derivan la cadena vacía (punto fijo sobre las reglas)
+    def _nullable_symbols(self) -> Set[str]:
+        nullable = set()
+        changed = True
+        while changed:
+            changed = False
+            for lhs, rhs in self.rules:
+                if lhs not in nullable and all(symbol in nullable for symbol in rhs):
+                    nullable.add(lhs)
+                    changed = True
+        return nullable
+
+    # Misma interfaz que CYKParser.parse: (aceptada, árbol, tiempo)
+    # El árbol usa los no-terminales de la gramática original
+    def parse(self, sentence: str, build_tree: bool = True) -> Tuple[bool, Optional[ParseTreeNode], float]:
+        start_time = time.perf_counter()
+        words = self.tokenizer.tokenize(sentence)
+
+        # Si no hay palabras, no hay nada que analizar
+        if not words:
+            return False, None, 0.0
+
+        accepted = self._fill_sets(words)
+        execution_time = time.perf_counter() - start_time
+
+        parse_tree = None
+        if accepted and build_tree:
+            self._derivations = {}
+            self._in_progress = set()
+            self._item_positions = self._index_item_positions()
+            self._cycle_hit = False
+            parse_tree = self._derive(self.grammar.start_symbol, 0, len(words))
+            self._derivations = None
+            self._in_progress = None
+            self._item_positions = None
+
+        return accepted, parse_tree, execution_time
+
+    # Solo responde si la frase pertenece al lenguaje, sin construir el árbol
+    def recognize(self, sentence: str) -> Tuple[bool, float]:
+        accepted, _, execution_time = self.parse(sentence, build_tree=False)
+        return accepted, execution_time
+
+    # Ítem -> posiciones (en orden creciente) de los conjuntos que lo contienen
+    def _index_item_positions(self) -> Dict[Tuple[int, int, int], List[int]]:
+        positions = defaultdict(list)
+        for i, items in enumerate(self.sets):
+            for item in items:
+                positions[item].append(i)
+        return positions
+
+    # Indica si la palabra debe tratarse con la categoría para palabras desconocidas
+    def _is_unknown(self, word: str) -> bool:
+        return self.unknown_symbol is not None and word not in self.terminals
+
+    # Llena los conjuntos de Earley: sets[i] contiene los ítems que terminan en la posición i
+    def _fill_sets(self, words: List[str]) -> bool:
+        n = len(words)
+        rules = self.rules
+        rules_by_lhs = self.rules_by_lhs
+        non_terminals = self.non_terminals
+        nullable = self.nullable
+        unknown_symbol = self.unknown_symbol
+
+        sets: List[List[Tuple[int, int, int]]] = [[] for _ in range(n + 1)]
+        seen: List[Set[Tuple[int, int, int]]] = [set() for _ in range(n + 1)]
+
+        # waiting[i][X]: ítems de sets[i] con el punto justo antes del no-terminal X
+        waiting: List[Dict[str, List[Tuple[int, int, int]]]] = [dict() for _ in range(n + 1)]
+        leo: Dict[Tuple[int, str], Optional[Tuple[int, int, int]]] = {}
+
+        def add(position, item):
+            if item not in seen[position]:
+                seen[position].add(item)
+                sets[position].append(item)
+
+        add(0, (0, 0, 0))
+
+        for i in range(n + 1):
+            items = sets[i]
+            word = words[i] if i < n else None
+            unknown = word is not None and self._is_unknown(word)
+            k = 0
+
+            while k < len(items):
+                item = items[k]
+                k += 1
+                r, dot, origin = item
+                lhs, rhs = rules[r]
+
+                if dot < len(rhs):
+                    symbol = rhs[dot]
+                    if symbol in non_terminals:
+                        # Predicción: solo la primera vez que se espera el símbolo en i
+                        pending = waiting[i].get(symbol)
+                        if pending is None:
+                            waiting[i][symbol] = [item]
+                            for rule in rules_by_lhs.get(symbol, ()):
+                                add(i, (rule, 0, i))
+                        else:
+                            pending.append(item)
+
+                        # Aycock-Horspool: un símbolo anulable se puede saltar
+                        if symbol in nullable:
+                            add(i, (r, dot + 1, origin))
+
+                        # La palabra desconocida completa directamente su categoría de respaldo
+                        if unknown and symbol == unknown_symbol:
+                            add(i + 1, (r, dot + 1, origin))
+
+                    elif symbol == word:
+                        # Lectura del terminal
+                        add(i + 1, (r, dot + 1, origin))
+
+                elif origin < i:
+                    # Completado: con Leo se agrega directamente el ítem superior de la cadena
+                    top = self._leo_item(waiting, leo, origin, lhs)
+                    if top is not None:
+                        add(i, top)
+                    else:
+                        for r2, dot2, origin2 in waiting[origin].get(lhs, ()):
+                            add(i, (r2, dot2 + 1, origin2))
+
+        self.sets = seen
+        self.words = words
+        return (0, 1, 0) in seen[n]
+
+    # Ítem de Leo para completar el símbolo `symbol` que empezó en `position`: si en ese
+    # conjunto un único ítem espera el símbolo y este es el último de su regla, completarlo
+    # solo puede avanzar esa regla, y así sucesivamente hacia arriba. Se devuelve el ítem
+    # completo más alto de esa cadena (o None si no hay cadena) y se memoriza cada paso
+    def _leo_item(self, waiting, leo, position: int, symbol: str) -> Optional[Tuple[int, int, int]]:
+        first = (position, symbol)
+        chain = []
+        top = None
+
+        key = first
+        while True:
+            if key in leo:
+                top = leo[key]
+                break
+
+            # Se marca antes de seguir para cortar ciclos de reglas unitarias
+            leo[key] = None
+            pending = waiting[key[0]].get(key[1])
+            if pending is None or len(pending) != 1:
+                break
+            r, dot, origin = pending[0]
+            if dot + 1 != len(self.rules[r][1]):
+                break
+
+            chain.append((key, (r, dot + 1, origin)))
+            key = (origin, self.rules[r][0])
+
+        for key, candidate in reversed(chain):
+            if top is None:
+                top = candidate
+            leo[key] = top
+
+        return leo[first]
+
+    # Construye el árbol de `symbol` sobre las palabras [start, end) a partir de los ítems
+    # incompletos de la tabla (Leo omite algunos completos, así que no se usan). Se memoriza
+    # por (símbolo, inicio, fin); las llamadas que vuelven a una en curso (ciclos de reglas
+    # unitarias o epsilon) fallan sin memorizar el fallo.
+    # Se ejecuta con _trampoline para no depender de la pila de Python en árboles profundos
+    def _derive(self, symbol: str, start: int, end: int) -> Optional[ParseTreeNode]:
+        return _trampoline(self._derive_steps(symbol, start, end), self._derive_steps)
+
+    # _derive como generador: pide los subárboles con yield (símbolo, inicio, fin)
+    def _derive_steps(self, symbol: str, start: int, end: int):
+        words = self.words
+
+        if symbol not in self.non_terminals:
+            if end == start + 1 and words[start] == symbol:
+                return ParseTreeNode(symbol)
+            return None
+
+        key = (symbol, start, end)
+        if key in self._derivations:
+            return self._derivations[key]
+        if key in self._in_progress:
+            self._cycle_hit = True
+            return None
+
+        self._in_progress.add(key)
+        outer_cycle_hit = self._cycle_hit
+        self._cycle_hit = False
+
+        node = None
+        if symbol == self.unknown_symbol and end == start + 1 and self._is_unknown(words[start]):
+            node = ParseTreeNode(symbol, [ParseTreeNode(words[start])])
+
+        for rule in self.rules_by_lhs.get(symbol, ()):
+            if node is not None:
+                break
+            children = yield from self._match_rule(rule, start, end)
+            if children is not None:
+                node = ParseTreeNode(symbol, children or [ParseTreeNode('ε')])
+
+        self._in_progress.discard(key)
+        if node is not None or not self._cycle_hit:
+            self._derivations[key] = node
+        self._cycle_hit = self._cycle_hit or outer_cycle_hit
+        return node
+
+    # Hijos de la regla sobre [start, end): de derecha a izquierda, cada símbolo termina
+    # donde empieza el siguiente y empieza en una posición donde la tabla tiene el ítem
+    # (regla, punto, start), es decir, donde el prefijo anterior sí deriva hasta ahí.
+    # Si un prefijo falla (por un ciclo) se retrocede y se prueba la siguiente división.
+    # Las divisiones candidatas salen del índice de posiciones del ítem, de la mayor a la
+    # menor, sin recorrer las posiciones donde el ítem no está.
+    # Es un generador que pide los subárboles con yield (ver _derive_steps)
+    def _match_rule(self, rule: int, start: int, end: int):
+        rhs = self.rules[rule][1]
+        if not rhs:
+            return [] if start == end else None
+
+        # Pila de elecciones: (punto, fin del símbolo, inicio elegido, hijo)
+        choices = []
+        dot, position, split = len(rhs), end, end
+
+        while True:
+            positions = self._item_positions.get((rule, dot - 1, start), ())
+            index = bisect_right(positions, split) - 1
+            child = None
+            while index >= 0 and positions[index] >= start:
+                split = positions[index]
+                child = yield rhs[dot - 1], split, position
+                if child is not None:
+                    break
+                index -= 1
+
+            if child is None:
+                if not choices:
+                    return None
+                dot, position, split, _ = choices.pop()
+                split -= 1
+                continue
+
+            choices.append((dot, position, split, child))
+
+            # El ítem (regla, 0, start) solo está en sets[start]: la regla está completa
+            if dot == 1:
+                return [choice[3] for choice in reversed(choices)]
+            dot, position = dot - 1, split
+
+
+# Lee una gramática desde un archivo de texto
+# Con verbose=False no se imprime el resumen y los avisos van a stderr
+# El archivo se procesa línea por línea sin cargarlo entero, y add_production interna los
+# símbolos, así que un léxico de millones de reglas ocupa una tupla por regla
+def load_grammar_from_file(filename: str, verbose: bool = True) -> Grammar:
+
+    g = Grammar()
+    first_non_terminal = None
+    messages = sys.stdout if verbose else sys.stderr
+    
+    try:
+        with open(filename, 'r', encoding='utf-8') as file:
+            for line_num, line in enumerate(file, 1):
+                line = line.strip()
+                
+                # Ignorar comentarios y líneas vacías
+                if not line or line.startswith('#'):
+                    continue
+
+                # Declaración explícita de terminales: %terminals id + * ( )
+                if line.startswith('%terminals'):
+                    g.declare_terminals(line[len('%terminals'):].split())
+                    continue
+                
+                # Debe tener formato: LHS -> RHS
+                if '->' not in line:
+                    print(f"⚠ Línea {line_num} ignorada (formato inválido): {line}", file=messages)
+                    continue
+                
+                lhs, _, rhs_full = line.partition('->')
+                if '->' in rhs_full:
+                    print(f"⚠ Línea {line_num} ignorada (formato inválido): {line}", file=messages)
+                    continue
+                
+                lhs = lhs.strip()
+                rhs_full = rhs_full.strip()
+                
+                # Guardar el primer no-terminal como símbolo inicial
+                if first_non_terminal is None:
+                    first_non_terminal = lhs
+                
+                # Separar alternativas (|)
+                alternatives = [alt.strip() for alt in rhs_full.split('|')]
+                
+                for alt in alternatives:
+                    # Peso opcional al final de la alternativa: VP -> V NP [0.7]
+                    weight = None
+                    if alt.endswith(']') and '[' in alt:
+                        alt, _, weight_text = alt[:-1].rpartition('[')
+                        alt = alt.strip()
+                        try:
+                            weight = float(weight_text)
+                        except ValueError:
+                            weight = -1.0
+                        if not weight >= 0:
+                            print(f"⚠ Línea {line_num}: peso inválido '[{weight_text}]' ignorado", file=messages)
+                            weight = None
+
+                    if alt and alt not in ['e', 'ε', 'EPSILON']:  # Ignorar epsilon explícito
+                        symbols = alt.split()
+                        g.add_production(lhs, symbols, weight)
+                    elif alt in ['e', 'ε', 'EPSILON']:
+                        # Producción epsilon
+                        g.add_production(lhs, [alt], weight)
+        
+        # Establecer el símbolo inicial
+        if first_non_terminal:
+            g.start_symbol = first_non_terminal
+        
+        if verbose:
+            print(f"✓ Gramática cargada desde '{filename}'")
+            print(f"  Símbolo inicial: {g.start_symbol}")
+            print(f"  No-terminales: {len(g.non_terminals)}")
+            print(f"  Terminales: {len(g.terminals)}")
+            print(f"  Producciones: {sum(len(prods) for prods in g.productions.values())}")
+        
+        return g
+        
+    except FileNotFoundError:
+        print(f"Error: No se encontró el archivo '{filename}'", file=messages)
+        sys.exit(1)
+    
+    except Exception as e:
+        print(f"Error al leer el archivo: {e}", file=messages)
+        sys.exit(1)
+
+# Versión del formato de la gramática compilada en caché; cambiarla invalida los archivos previos
+CACHE_FORMAT_VERSION = 10
+CACHE_MAGIC = b'CYKCNF'
+CACHE_HEADER_SIZE = len(CACHE_MAGIC) + 4 + 32
+
+
+# Hash del archivo de gramática junto con la versión del formato de caché
+def grammar_source_hash(filename: str) -> bytes:
+    digest = hashlib.sha256()
+    digest.update(CACHE_FORMAT_VERSION.to_bytes(4, 'little'))
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.digest()
+
+
+# Ruta del archivo compilado para una gramática: <cache_dir>/<nombre>.<hash>.cnfc
+def compiled_grammar_path(filename: str, source_hash: bytes, cache_dir: Optional[str] = None) -> str:
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(filename)), '.cyk_cache')
+    name = os.path.basename(filename)
+    return os.path.join(cache_dir, f"{name}.{source_hash.hex()[:16]}.cnfc")
+
+
+# Guarda la gramática CNF y sus índices en un archivo versionado: cabecera (magia,
+# versión, hash de la fuente) seguida de JSON en UTF-8. Solo se guardan datos, nunca
+# objetos serializados con pickle: leer la caché no puede ejecutar código aunque alguien
+# haya escrito el archivo. El hash solo detecta una caché vieja, no la autentica
+def save_compiled_grammar(path: str, source_hash: bytes, cnf_grammar: Grammar, compiled: CompiledGrammar):
+    data = {'grammar': cnf_grammar.to_dict(), 'compiled': compiled.to_dict()}
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as file:
+        file.write(CACHE_MAGIC)
+        file.write(CACHE_FORMAT_VERSION.to_bytes(4, 'little'))
+        file.write(source_hash)
+        file.write(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    # Reemplazo atómico para que otros procesos nunca lean un archivo a medias
+    os.replace(temporary, path)
+
+
+# Carga una gramática compilada.
+# Devuelve None si no existe, si la versión o el hash no coinciden o si el contenido no
+# tiene la forma esperada
+def load_compiled_grammar(path: str, source_hash: bytes) -> Optional[Tuple[Grammar, CompiledGrammar]]:
+    try:
+        with open(path, 'rb') as file:
+            header = file.read(CACHE_HEADER_SIZE)
+            expected = CACHE_MAGIC + CACHE_FORMAT_VERSION.to_bytes(4, 'little') + source_hash
+            if header != expected:
+                return None
+            data = json.loads(file.read())
+        return Grammar.from_dict(data['grammar']), CompiledGrammar.from_dict(data['compiled'])
+    except (OSError, ValueError, TypeError, KeyError, AttributeError):
+        # Archivo ilegible, dañado o de otra versión del código: se vuelve a compilar
+        return None
+
+
+# Devuelve la gramática CNF y sus índices usando la caché compilada si es válida;
+# si no, carga y convierte la gramática y guarda el resultado para la próxima vez
+def load_cnf_grammar(filename: str, cache_dir: Optional[str] = None,
+                     verbose: bool = True) -> Tuple[Grammar, CompiledGrammar]:
+    try:
+        source_hash = grammar_source_hash(filename)
+    except OSError:
+        print(f"Error: No se encontró el archivo '{filename}'", file=sys.stdout if verbose else sys.stderr)
+        sys.exit(1)
+
+    path = compiled_grammar_path(filename, source_hash, cache_dir)
+    cached = load_compiled_grammar(path, source_hash)
+    if cached is not None:
+        if verbose:
+            print(f"✓ Gramática CNF cargada desde la caché '{path}'")
+        return cached
+
+    original_grammar = load_grammar_from_file(filename, verbose=verbose)
+    cnf_grammar = CNFConverter(original_grammar).convert_to_cnf(verbose=verbose)
+    compiled = CompiledGrammar(cnf_grammar)
+
+    try:
+        save_compiled_grammar(path, source_hash, cnf_grammar, compiled)
+        if verbose:
+            print(f"\n✓ Gramática compilada guardada en '{path}'")
+    except OSError as e:
+        print(f"⚠ No se pudo guardar la gramática compilada: {e}", file=sys.stdout if verbose else sys.stderr)
+
+    return cnf_grammar, compiled
+
+
+# Gramática compilada y memoria compartida de cada proceso del llenado por frentes de onda
+_wave_compiled: Optional[CompiledGrammar] = None
+_wave_segment: Optional[shared_memory.SharedMemory] = None
+
+# Celdas ya decodificadas de la tabla compartida (índice plano -> máscara, None si falta).
+# Una celda no cambia después de escrita, así que cada proceso la decodifica una sola vez
+# por frase en lugar de una vez por cada división que la usa
+_wave_cells: Optional[List[Optional[int]]] = None
+
+
+# Inicializa un proceso del llenado en paralelo: recibe la gramática compilada una sola vez
+def _init_wave_worker(compiled: CompiledGrammar):
+    global _wave_compiled
+    _wave_compiled = compiled
+
+
+# Llena un bloque de varias longitudes seguidas: las celdas con inicio en [first, last) y
+# longitudes [length, length + height). Las celdas de longitud length + t también dependen
+# de celdas del mismo grupo con inicio hasta last + t, que pertenecen al bloque vecino; en
+# vez de esperarlo, el bloque las calcula él mismo (un trapecio con height - 1 - t celdas
+# extra por nivel) y solo escribe en la tabla compartida las suyas. Así cada grupo de
+# height longitudes necesita una sola ronda del pool
+def _fill_wave_block(task: Tuple[str, int, int, int, int, int, int]):
+    global _wave_segment, _wave_cells
+    name, n, cell_bytes, length, height, first, last = task
+
+    # Se mantiene abierta la tabla de la frase actual entre frentes de onda
+    if _wave_segment is None or _wave_segment.name != name:
+        if _wave_segment is not None:
+            _wave_segment.close()
+        # Abrir el segmento lo vuelve a registrar en el rastreador de recursos que comparten
+        # todos los procesos; el registro es un conjunto, así que no hay que deshacerlo aquí:
+        # lo borra una sola vez el unlink del proceso principal
+        _wave_segment = shared_memory.SharedMemory(name=name)
+        _wave_cells = [None] * (n * (n + 1) // 2)
+
+    buffer = _wave_segment.buf
+    cells = _wave_cells
+    right_masks = _wave_compiled.right_masks
+    pair_masks = _wave_compiled.pair_masks
+    rows = [j * n - j * (j - 1) // 2 for j in range(n)]
+
+    # Solo se decodifican celdas de longitudes anteriores al grupo (ya terminadas) o
+    # calculadas por este mismo bloque, así que el valor guardado nunca queda viejo
+    def read(index):
+        cell = cells[index] = int.from_bytes(buffer[index * cell_bytes:(index + 1) * cell_bytes], 'little')
+        return cell
+
+    for t in range(min(height, n - length + 1)):
+        j = length + t - 1
+        starts = n - j
+        for i in range(first, min(last + height - 1 - t, starts)):
+            cell = 0
+            for k in range(j):
+                left = cells[rows[k] + i]
+                if left is None:
+                    left = read(rows[k] + i)
+                if not left:
+                    continue
+                right = cells[rows[j - k - 1] + i + k + 1]
+                if right is None:
+                    right = read(rows[j - k - 1] + i + k + 1)
+                if not right:
+                    continue
+
+                while left:
+                    low = left & -left
+                    b = low.bit_length() - 1
+                    left ^= low
+
+                    hits = right_masks[b] & right
+                    if hits:
+                        pairs = pair_masks[b]
+                        while hits:
+                            low_c = hits & -hits
+                            cell |= pairs[low_c.bit_length() - 1]
+                            hits ^= low_c
+
+            index = rows[j] + i
+            cells[index] = cell
+            if cell and i < last:
+                buffer[index * cell_bytes:(index + 1) * cell_bytes] = cell.to_bytes(cell_bytes, 'little')
+
+
+# Parser de cada proceso del pool de lotes (se crea una vez por proceso)
+_worker_parser = None
+_worker_build_tree = False
+
+
+# Inicializa un proceso del pool: recibe la gramática compilada una sola vez
+def _init_batch_worker(grammar: Grammar, compiled: CompiledGrammar, engine: str,
+                       unknown_symbol: Optional[str], build_tree: bool, tokenizer: Optional[Tokenizer] = None):
+    global _worker_parser, _worker_build_tree
+    if engine == 'earley':
+        _worker_parser = EarleyParser(grammar, unknown_symbol=unknown_symbol, tokenizer=tokenizer)
+    else:
+        _worker_parser = CYKParser(grammar, unknown_symbol=unknown_symbol, engine=engine, compiled=compiled,
+                                   tokenizer=tokenizer)
+    _worker_build_tree = build_tree
+
+
+# Analiza una frase y devuelve si fue aceptada, el tiempo y (opcionalmente) el árbol
+def _parse_record(parser, sentence: str, build_tree: bool) -> dict:
+    if build_tree:
+        accepted, parse_tree, exec_time = parser.parse(sentence)
+    else:
+        accepted, exec_time = parser.recognize(sentence)
+        parse_tree = None
+
+    result = {'accepted': accepted, 'time': exec_time}
+    if parse_tree is not None:
+        result['tree'] = parse_tree
+    return result
+
+
+# Escribe un registro de resultado como una línea JSON. El árbol (siempre la última
+# clave) se escribe con write_json, que no tiene límite de profundidad
+def _write_record(target, record: dict):
+    tree = record.get('tree')
+    if tree is None:
+        target.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return
+    head = {key: value for key, value in record.items() if key != 'tree'}
+    target.write(json.dumps(head, ensure_ascii=False)[:-1] + ', "tree": ')
+    tree.write_json(target)
+    target.write('}\n')
+
+
+# Analiza una frase numerada y devuelve el registro de resultado
+def _parse_batch_item(item: Tuple[int, str]) -> dict:
+    line_number, sentence = item
+    result = {'line': line_number, 'sentence': sentence}
+    result.update(_parse_record(_worker_parser, sentence, _worker_build_tree))
+    return result
+
+
+# Analiza un corpus de frases (una por línea) y devuelve los resultados en orden.
+# Con workers > 1 las frases se reparten en un pool de procesos; la gramática
+# compilada se envía a cada proceso una sola vez. Las líneas vacías se omiten.
+# Con engine='earley', grammar es la gramática original (sin convertir a CNF)
+def parse_corpus(grammar: Grammar, lines: Iterable[str], workers: int = 1, build_tree: bool = False,
+                 engine: str = 'set', unknown_symbol: Optional[str] = None,
+                 chunk_size: int = 64, compiled: Optional[CompiledGrammar] = None,
+                 tokenizer: Optional[Tokenizer] = None) -> Iterator[dict]:
+    if engine == 'earley':
+        init_args = (grammar, None, engine, unknown_symbol, build_tree, tokenizer)
+    else:
+        parser = CYKParser(grammar, unknown_symbol=unknown_symbol, engine=engine, compiled=compiled)
+        init_args = (grammar, parser.compiled, parser.engine, unknown_symbol, build_tree, tokenizer)
+    items = ((number, line.strip()) for number, line in enumerate(lines, 1) if line.strip())
+
+    if workers <= 1:
+        _init_batch_worker(*init_args)
+        for item in items:
+            yield _parse_batch_item(item)
+        return
+
+    # Se leen bloques acotados para no cargar todo el corpus en memoria
+    block_size = workers * chunk_size * 4
+    with multiprocessing.Pool(workers, initializer=_init_batch_worker, initargs=init_args) as pool:
+        while True:
+            block = list(islice(items, block_size))
+            if not block:
+                break
+            yield from pool.imap(_parse_batch_item, block, chunksize=chunk_size)
+
+
+# Modo por lotes: lee frases de un archivo (o stdin con '-') y escribe JSON Lines
+def batch_mode(grammar: Grammar, input_path: str, output_path: Optional[str], workers: int,
+               build_tree: bool, engine: str, unknown_symbol: Optional[str],
+               compiled: Optional[CompiledGrammar] = None, tokenizer: Optional[Tokenizer] = None):
+    source = sys.stdin if input_path == '-' else open(input_path, 'r', encoding='utf-8')
+    target = sys.stdout if output_path in (None, '-') else open(output_path, 'w', encoding='utf-8')
+
+    start_time = time.time()
+    total = 0
+    accepted = 0
+    try:
+        for result in parse_corpus(grammar, source, workers=workers, build_tree=build_tree,
+                                   engine=engine, unknown_symbol=unknown_symbol, compiled=compiled,
+                                   tokenizer=tokenizer):
+            _write_record(target, result)
+            total += 1
+            accepted += result['accepted']
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+    elapsed = time.time() - start_time
+    print(f"✓ {total} frases procesadas ({accepted} aceptadas) en {elapsed:.3f} segundos",
+          file=sys.stderr)
+
+
+# Parsers de cada proceso del servidor: uno por gramática (se crean una vez por proceso)
+_server_parsers: Dict[str, object] = {}
+
+
+# Inicializa un proceso del servidor: recibe todas las gramáticas compiladas una sola vez
+def _init_server_worker(grammars: Dict[str, tuple]):
+    global _server_parsers
+    _server_parsers = {}
+    for name, (grammar, compiled, engine, unknown_symbol, tokenizer) in grammars.items():
+        if engine == 'earley':
+            _server_parsers[name] = EarleyParser(grammar, unknown_symbol=unknown_symbol, tokenizer=tokenizer)
+        else:
+            _server_parsers[name] = CYKParser(grammar, unknown_symbol=unknown_symbol, engine=engine,
+                                              compiled=compiled, tokenizer=tokenizer)
+
+
+# Analiza una frase con la gramática indicada dentro de un proceso del servidor
+def _server_parse(name: str, sentence: str, build_tree: bool) -> dict:
+    return _parse_record(_server_parsers[name], sentence, build_tree)
+
+
+# Servidor de análisis: carga y compila las gramáticas una vez y responde peticiones
+# JSON Lines por TCP o socket Unix. Las conexiones se atienden con asyncio y el llenado
+# de las tablas se reparte en un pool de procesos. Cada petición es una línea como
+#   {"id": 7, "sentence": "she eats a cake", "grammar": "ingles", "tree": true, "timeout": 2}
+# y recibe una línea con el mismo id; un cliente puede enviar varias peticiones sin
+# esperar (pipelining) y las respuestas llegan a medida que terminan, no en orden.
+# {"command": "grammars"} lista las gramáticas cargadas
+class ParseServer:
+    # Longitud máxima de una línea de petición
+    LINE_LIMIT = 1 << 20
+
+    # tokenizers: tokenizador de cada gramática (por defecto, por espacios)
+    def __init__(self, grammars: Dict[str, Grammar], workers: int = 1, engine: str = 'set',
+                 unknown_symbol: Optional[str] = None, timeout: Optional[float] = 30.0,
+                 compiled: Optional[Dict[str, CompiledGrammar]] = None, max_pending: int = 64,
+                 tokenizers: Optional[Dict[str, Tokenizer]] = None):
+        if not grammars:
+            raise ValueError("El servidor necesita al menos una gramática")
+
+        # Se compila en el proceso principal para enviar a cada proceso solo los índices
+        worker_grammars = {}
+        for name, grammar in grammars.items():
+            tokenizer = (tokenizers or {}).get(name)
+            if engine == 'earley':
+                worker_grammars[name] = (grammar, None, engine, unknown_symbol, tokenizer)
+            else:
+                parser = CYKParser(grammar, unknown_symbol=unknown_symbol, engine=engine,
+                                   compiled=(compiled or {}).get(name))
+                worker_grammars[name] = (grammar, parser.compiled, parser.engine, unknown_symbol, tokenizer)
+
+        self.names = list(grammars)
+        self.default_grammar = self.names[0]
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.pool = ProcessPoolExecutor(max(1, workers), initializer=_init_server_worker,
+                                        initargs=(worker_grammars,))
+        self.server = None
+
+        # Estadísticas
+        self.requests = 0
+        self.timeouts = 0
+
+    # Abre el socket: 'host:puerto' para TCP o 'unix:/ruta' para un socket Unix
+    async def start(self, address: str):
+        if address.startswith('unix:'):
+            self.server = await asyncio.start_unix_server(self._handle_client, path=address[5:],
+                                                          limit=self.LINE_LIMIT)
+        else:
+            host, _, port = address.rpartition(':')
+            self.server = await asyncio.start_server(self._handle_client, host or '127.0.0.1', int(port),
+                                                     limit=self.LINE_LIMIT)
+        return self.server
+
+    # Atiende conexiones hasta que se cancele
+    async def serve_forever(self, address: str):
+        server = await self.start(address)
+        async with server:
+            await server.serve_forever()
+
+    # Libera el pool de procesos
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        self.pool.shutdown()
+
+    # Responde una petición (línea JSON) y devuelve la respuesta como diccionario
+    async def handle_request(self, line) -> dict:
+        try:
+            request = json.loads(line)
+        except (ValueError, UnicodeDecodeError):
+            return {'id': None, 'error': "JSON inválido"}
+        if not isinstance(request, dict):
+            return {'id': None, 'error': "La petición debe ser un objeto JSON"}
+
+        request_id = request.get('id')
+        command = request.get('command', 'parse')
+        if command == 'grammars':
+            return {'id': request_id, 'grammars': self.names}
+        if command != 'parse':
+            return {'id': request_id, 'error': f"Comando desconocido: {command}"}
+
+        name = request.get('grammar', self.default_grammar)
+        if name not in self.names:
+            return {'id': request_id, 'error': f"Gramática desconocida: {name}"}
+        sentence = request.get('sentence')
+        if not isinstance(sentence, str):
+            return {'id': request_id, 'error': "Falta la frase ('sentence')"}
+        timeout = request.get('timeout', self.timeout)
+        if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float))
+                                    or timeout <= 0):
+            return {'id': request_id, 'error': "El tiempo límite debe ser un número positivo"}
+
+        self.requests += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.pool, _server_parse, name, sentence, bool(request.get('tree')))
+        try:
+            result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            # La respuesta se libera de inmediato; si el análisis ya había empezado,
+            # su proceso lo termina antes de tomar la siguiente frase
+            self.timeouts += 1
+            return {'id': request_id, 'grammar': name, 'error': f"Tiempo agotado ({timeout} s)"}
+        except Exception as error:
+            return {'id': request_id, 'grammar': name, 'error': str(error)}
+
+        response = {'id': request_id, 'grammar': name}
+        response.update(result)
+        return response
+
+    # Lee peticiones de una conexión y responde cada una en cuanto termina
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        write_lock = asyncio.Lock()
+        # Limita las peticiones en curso por conexión (deja de leer hasta que terminen)
+        pending = asyncio.Semaphore(self.max_pending)
+        tasks = set()
+
+        async def answer(line: bytes):
+            try:
+                response = await self.handle_request(line)
+                await self._send(writer, write_lock, response)
+            finally:
+                pending.release()
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await self._send(writer, write_lock, {'id': None, 'error': "Línea demasiado larga"})
+                    continue
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                await pending.acquire()
+                task = asyncio.ensure_future(answer(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            for task in tasks:
+                task.cancel()
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, lock: asyncio.Lock, response: dict):
+        buffer = io.StringIO()
+        _write_record(buffer, response)
+        async with lock:
+            writer.write(buffer.getvalue().encode('utf-8'))
+            await writer.drain()
+
+
+# Carga una gramática sin imprimir la conversión: la original para Earley o la CNF
+# (desde la caché si se pide) para los motores CYK
+def _load_quietly(grammar_file: str, engine: str, cache: bool = False,
+                  cache_dir: Optional[str] = None) -> Tuple[Grammar, Optional[CompiledGrammar]]:
+    if engine == 'earley':
+        return load_grammar_from_file(grammar_file, verbose=False), None
+    if cache:
+        return load_cnf_grammar(grammar_file, cache_dir, verbose=False)
+    original_grammar = load_grammar_from_file(grammar_file, verbose=False)
+    return CNFConverter(original_grammar).convert_to_cnf(verbose=False), None
+
+
+# Modo servidor: carga las gramáticas ('nombre' -> archivo) y atiende peticiones hasta Ctrl+C
+def serve_mode(grammar_files: Dict[str, str], address: str, workers: int, engine: str,
+               unknown_symbol: Optional[str], timeout: Optional[float], cache: bool = False,
+               cache_dir: Optional[str] = None, strategy: str = 'whitespace',
+               token_pattern: Optional[str] = None):
+    grammars = {}
+    compiled = {}
+    tokenizers = {}
+    for name, grammar_file in grammar_files.items():
+        grammars[name], compiled[name] = _load_quietly(grammar_file, engine, cache, cache_dir)
+        tokenizers[name] = Tokenizer.for_grammar(grammars[name], strategy, token_pattern)
+
+    server = ParseServer(grammars, workers=workers, engine=engine, unknown_symbol=unknown_symbol,
+                         timeout=timeout, compiled=compiled, tokenizers=tokenizers)
+    print(f"✓ Servidor escuchando en {address} con {len(grammars)} gramática(s): "
+          f"{', '.join(grammars)}", file=sys.stderr)
+    try:
+        asyncio.run(server.serve_forever(address))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if address.startswith('unix:') and os.path.exists(address[5:]):
+            os.remove(address[5:])
+    print(f"✓ Servidor detenido: {server.requests} peticiones ({server.timeouts} con tiempo agotado)",
+          file=sys.stderr)
+
+
+# Modo interactivo para ingresar frases
+def interactive_mode(parser: CYKParser):
+    print("\n" + "=" * 70)
+    print("MODO INTERACTIVO - INGRESO DE FRASES")
+    print("=" * 70)
+    print("\nInstrucciones:")
+    print("  • Ingrese frases para analizar")
+    print("  • Escriba 'salir' para terminar")
+    print("  • Escriba 'ayuda' para ver comandos")
+
+    while True:
+        print("\n" + "-" * 70)
+        user_input = input("Ingrese una frase: ").strip()
+
+        if user_input.lower() in ['salir', 'exit', 'quit', 'q']:
+            print("\n¡Gracias por usar el parser CYK!")
+            break
+
+        if user_input.lower() in ['ayuda', 'help', 'h']:
+            print("\nCOMANDOS DISPONIBLES:")
+            print("-" * 70)
+            print("  salir   - Terminar el programa")
+            print("  ayuda   - Mostrar esta ayuda")
+            continue
 
         if not user_input:
             print("⚠ Por favor ingrese una frase válida")
@@ -625,40 +3713,119 @@ def interactive_mode(parser: CYKParser):
             print(f"\n⏱  TIEMPO: {exec_time:.6f} segundos")
 
 
+# Opciones de línea de comandos
+def build_arg_parser() -> argparse.ArgumentParser:
+    arg_parser = argparse.ArgumentParser(description="Parser CYK para gramáticas libres de contexto")
+    arg_parser.add_argument('grammar', help="archivo de gramática (.txt)")
+    arg_parser.add_argument('--batch', metavar='ARCHIVO',
+                            help="analiza las frases del archivo (una por línea, '-' para stdin) "
+                                 "y escribe los resultados como JSON Lines")
+    arg_parser.add_argument('--output', metavar='ARCHIVO',
+                            help="archivo de salida del modo por lotes (por defecto stdout)")
+    arg_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="procesos para el modo por lotes (por defecto, uno por CPU)")
+    arg_parser.add_argument('--tree', action='store_true',
+                            help="incluye el árbol de parsing en los resultados del modo por lotes")
+    arg_parser.add_argument('--engine', choices=CYKParser.ENGINES + ('earley',), default='set',
+                            help="motor de llenado de la tabla CYK, o 'earley' para analizar "
+                                 "con la gramática original sin convertirla a CNF")
+    arg_parser.add_argument('--unknown', metavar='CATEGORÍA',
+                            help="categoría que se asigna a las palabras desconocidas")
+    arg_parser.add_argument('--tokenizer', choices=Tokenizer.STRATEGIES, default='whitespace',
+                            help="cómo se separan las frases en palabras: por espacios, con una "
+                                 "expresión regular (--token-pattern), por caracteres o tomando el "
+                                 "terminal más largo (para entradas sin espacios como id+id*id)")
+    arg_parser.add_argument('--token-pattern', metavar='REGEX',
+                            help="expresión regular de cada token para --tokenizer regex")
+    arg_parser.add_argument('--serve', metavar='DIRECCIÓN',
+                            help="inicia el servidor de análisis en 'host:puerto' o 'unix:/ruta' "
+                                 "(peticiones y respuestas JSON Lines)")
+    arg_parser.add_argument('--add-grammar', metavar='NOMBRE=ARCHIVO', action='append', default=[],
+                            help="gramática adicional para el servidor (se puede repetir)")
+    arg_parser.add_argument('--timeout', type=float, default=30.0,
+                            help="tiempo límite por petición del servidor en segundos (por defecto 30)")
+    arg_parser.add_argument('--cache', action='store_true',
+                            help="reutiliza la gramática CNF compilada en caché (y la crea si no existe)")
+    arg_parser.add_argument('--cache-dir', metavar='DIRECTORIO',
+                            help="directorio de la caché (por defecto .cyk_cache junto a la gramática)")
+    return arg_parser
+
+
 # Función principal
 def main():
-    print("=" * 70)
-    print("  PROYECTO 2: ALGORITMO CYK - PARSER DE GRAMÁTICAS CFG")
-    print("  Teoría de la Computación 2025")
-    print("=" * 70)
-
     # Verificar argumentos de línea de comandos
     if len(sys.argv) < 2:
         print("\nError: Debe especificar un archivo de gramática")
         print("\nUso:")
         print(f"  python {sys.argv[0]} <archivo_gramatica.txt>")
+        print(f"  python {sys.argv[0]} <archivo_gramatica.txt> --batch <frases.txt> [--workers N] [--tree]")
+        print(f"  python {sys.argv[0]} <archivo_gramatica.txt> --serve 127.0.0.1:8765 [--add-grammar NOMBRE=ARCHIVO]")
         print("\nEjemplo:")
         print(f"  python {sys.argv[0]} grammar.txt")
         sys.exit(1)
-    
-    grammar_file = sys.argv[1]
+
+    args = build_arg_parser().parse_args()
+    grammar_file = args.grammar
+
+    # Modo servidor: la gramática principal se llama como su archivo (sin extensión)
+    if args.serve:
+        grammar_files = {os.path.splitext(os.path.basename(grammar_file))[0]: grammar_file}
+        for entry in args.add_grammar:
+            name, separator, path = entry.partition('=')
+            if not separator or not name or not path:
+                print(f"\nError: --add-grammar espera NOMBRE=ARCHIVO, se recibió '{entry}'")
+                sys.exit(1)
+            grammar_files[name] = path
+        serve_mode(grammar_files, args.serve, args.workers, args.engine, args.unknown,
+                   args.timeout, args.cache, args.cache_dir, args.tokenizer, args.token_pattern)
+        return
+
+    # Modo por lotes: sin menús ni impresión de la conversión
+    if args.batch:
+        cnf_grammar, compiled = _load_quietly(grammar_file, args.engine, args.cache, args.cache_dir)
+        tokenizer = Tokenizer.for_grammar(cnf_grammar, args.tokenizer, args.token_pattern)
+        batch_mode(cnf_grammar, args.batch, args.output, args.workers, args.tree,
+                   args.engine, args.unknown, compiled, tokenizer)
+        return
+
+    print("=" * 70)
+    print("  PROYECTO 2: ALGORITMO CYK - PARSER DE GRAMÁTICAS CFG")
+    print("  Teoría de la Computación 2025")
+    print("=" * 70)
 
     # Cargar gramática desde archivo
     print(f"\n1. CARGANDO GRAMÁTICA DESDE: {grammar_file}")
     print("-" * 70)
-    original_grammar = load_grammar_from_file(grammar_file)
-    print("\nGramática original:")
-    original_grammar.print_grammar()
-
-    # Convertir a CNF
-    converter = CNFConverter(original_grammar)
-    cnf_grammar = converter.convert_to_cnf()
-    print("\n2. GRAMÁTICA EN CNF:")
-    print("-" * 70)
-    cnf_grammar.print_grammar()
+    compiled = None
+    if args.engine == 'earley':
+        # Earley trabaja directamente sobre la gramática original
+        original_grammar = load_grammar_from_file(grammar_file)
+        print("\nGramática original:")
+        original_grammar.print_grammar()
+    elif args.cache:
+        # Con caché válida se omite la conversión completa
+        cnf_grammar, compiled = load_cnf_grammar(grammar_file, args.cache_dir)
+    else:
+        original_grammar = load_grammar_from_file(grammar_file)
+        print("\nGramática original:")
+        original_grammar.print_grammar()
+
+        # Convertir a CNF
+        converter = CNFConverter(original_grammar)
+        cnf_grammar = converter.convert_to_cnf()
+
+    if args.engine == 'earley':
+        tokenizer = Tokenizer.for_grammar(original_grammar, args.tokenizer, args.token_pattern)
+        parser = EarleyParser(original_grammar, unknown_symbol=args.unknown, tokenizer=tokenizer)
+    else:
+        print("\n2. GRAMÁTICA EN CNF:")
+        print("-" * 70)
+        cnf_grammar.print_grammar()
 
-    # Crear parser CYK
-    parser = CYKParser(cnf_grammar)
+        # Crear parser CYK
+        tokenizer = Tokenizer.for_grammar(cnf_grammar, args.tokenizer, args.token_pattern)
+        parser = CYKParser(cnf_grammar, unknown_symbol=args.unknown, engine=args.engine, compiled=compiled,
+                           tokenizer=tokenizer)
 
     # Menú principal
     while True:
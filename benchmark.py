@@ -0,0 +1,806 @@
+###############################################################################
+# Benchmarks del parser CYK                                                 #
+# Sin argumentos ejecuta todas las comparaciones (run_*_benchmark): índice  #
+# de reglas, motores, conversión a CNF, epsilon, bosque, Viterbi, filtro de #
+# contexto, caché, llenado en paralelo, sesiones y léxicos grandes.         #
+# Con --suite ARCHIVO ejecuta la suite de regresión (run_suite) y guarda    #
+# tiempos, ítems y memoria por gramática, motor y longitud en JSON; con     #
+# --compare ANTERIOR compara ese resultado con uno previo (compare_suites)  #
+# y termina con código 1 si algo empeoró más que --tolerance:               #
+#   python benchmark.py --suite base.json                                   #
+#   python benchmark.py --suite nuevo.json --compare base.json              #
+###############################################################################
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+from CYK import CYKParser, CNFConverter, EarleyParser, Grammar, SpanCache, load_grammar_from_file, np
+
+
+# Versión original del llenado: recorre todas las producciones en cada división
+def scan_parse(grammar: Grammar, words: List[str]) -> bool:
+    n = len(words)
+    table = [[set() for _ in range(n)] for _ in range(n)]
+    back_pointer = [[defaultdict(list) for _ in range(n)] for _ in range(n)]
+
+    for i in range(n):
+        for lhs, productions in grammar.productions.items():
+            for rhs in productions:
+                if len(rhs) == 1 and rhs[0] == words[i]:
+                    table[i][0].add(lhs)
+                    back_pointer[i][0][lhs].append(('terminal', words[i], None))
+
+    for length in range(2, n + 1):
+        for i in range(n - length + 1):
+            j = length - 1
+            for k in range(length - 1):
+                left_symbols = table[i][k]
+                right_symbols = table[i + k + 1][j - k - 1]
+                for lhs, productions in grammar.productions.items():
+                    for rhs in productions:
+                        if len(rhs) == 2:
+                            B, C = rhs
+                            if B in left_symbols and C in right_symbols:
+                                table[i][j].add(lhs)
+                                back_pointer[i][j][lhs].append((k, B, C))
+
+    return grammar.start_symbol in table[0][n - 1]
+
+
+# Carga y convierte una gramática sin imprimir el detalle de la conversión
+def load_cnf_quietly(filename: str) -> Grammar:
+    with contextlib.redirect_stdout(io.StringIO()):
+        grammar = load_grammar_from_file(filename)
+        return CNFConverter(grammar).convert_to_cnf()
+
+
+# Genera una gramática CNF aleatoria con muchas reglas binarias y un léxico.
+# Con weighted=True cada producción recibe un peso aleatorio en (0, 1]
+def synthetic_cnf_grammar(non_terminals: int, binary_rules: int, words: int,
+                          seed: int = 0, weighted: bool = False) -> Grammar:
+    rng = random.Random(seed)
+    symbols = ['S'] + [f"N{i}" for i in range(1, non_terminals)]
+    grammar = Grammar()
+
+    seen: Set[tuple] = set()
+    while len(seen) < binary_rules:
+        rule = (rng.choice(symbols), rng.choice(symbols), rng.choice(symbols))
+        if rule not in seen:
+            seen.add(rule)
+            grammar.add_production(rule[0], [rule[1], rule[2]],
+                                   1.0 - rng.random() if weighted else None)
+
+    for w in range(words):
+        word = f"w{w}"
+        for lhs in rng.sample(symbols, 3):
+            grammar.add_production(lhs, [word], 1.0 - rng.random() if weighted else None)
+
+    return grammar
+
+
+# Genera una gramática libre de contexto aleatoria (no CNF) con producciones largas,
+# unitarias y epsilon, para medir cómo escala la conversión a CNF. Las producciones
+# unitarias solo apuntan a unos pocos no-terminales cercanos, para que el tamaño de
+# la gramática resultante crezca linealmente y se mida el algoritmo, no la salida
+def synthetic_cfg(productions: int, seed: int = 0) -> Grammar:
+    rng = random.Random(seed)
+    count = max(2, productions // 10)
+    non_terminals = ['S'] + [f"N{i}" for i in range(1, count)]
+    terminals = [f"t{i}" for i in range(50)]
+    grammar = Grammar()
+    total = 0
+
+    # Cadena S -> t N1, N1 -> t N2, ...: todo es alcanzable desde S, pero solo el último
+    # no-terminal genera terminales directamente, así que la productividad (y la
+    # alcanzabilidad) se propaga a lo largo de toda la cadena. Es el peor caso para
+    # los puntos fijos que vuelven a recorrer la gramática completa en cada vuelta
+    for i, lhs in enumerate(non_terminals):
+        if i + 1 < count:
+            grammar.add_production(lhs, [rng.choice(terminals), non_terminals[i + 1]])
+        else:
+            grammar.add_production(lhs, [rng.choice(terminals)])
+        total += 1
+
+    while total < productions:
+        i = rng.randrange(count)
+        lhs = non_terminals[i]
+        kind = rng.random()
+        if kind < 0.02:
+            grammar.add_production(lhs, ['e'])
+        elif kind < 0.15:
+            grammar.add_production(lhs, [non_terminals[min(count - 1, i + rng.randint(1, 5))]])
+        else:
+            length = rng.randint(2, 4)
+            rhs = [rng.choice(terminals)] + [rng.choice(non_terminals) for _ in range(length - 1)]
+            rng.shuffle(rhs)
+            grammar.add_production(lhs, rhs)
+        total += 1
+
+    return grammar
+
+
+# Mide el tiempo promedio de una función sobre varias frases
+def time_it(function, sentences: List[List[str]]) -> float:
+    start = time.perf_counter()
+    for words in sentences:
+        function(words)
+    return (time.perf_counter() - start) / len(sentences)
+
+
+# Ejecuta la comparación entre el recorrido completo y el índice de reglas
+def run_index_benchmark():
+    print("=" * 70)
+    print("  ÍNDICE DE REGLAS BINARIAS vs RECORRIDO COMPLETO")
+    print("=" * 70)
+
+    rng = random.Random(1)
+    cases = [
+        ("grammar.txt", load_cnf_quietly("grammar.txt"),
+         [s.split() for s in ["she eats a cake with a fork in the oven with a spoon",
+                              "the dog eats the soup in the oven with a knife"]]),
+        ("1.txt", load_cnf_quietly("1.txt"),
+         [("( id + id ) * id + " * 4 + "id").split()]),
+    ]
+    for rules in (500, 2000, 5000):
+        grammar = synthetic_cnf_grammar(300, rules, 200, seed=rules)
+        sentences = [[f"w{rng.randrange(200)}" for _ in range(15)] for _ in range(3)]
+        cases.append((f"sintética ({rules} reglas)", grammar, sentences))
+
+    print(f"\n{'Gramática':<28}{'Recorrido (s)':>15}{'Índice (s)':>15}{'Aceleración':>13}")
+    print("-" * 70)
+    for name, grammar, sentences in cases:
+        parser = CYKParser(grammar)
+
+        for words in sentences:
+            expected = scan_parse(grammar, words)
+            accepted, _, _ = parser.parse(' '.join(words))
+            assert expected == accepted, f"Resultado distinto para: {' '.join(words)}"
+
+        scan_time = time_it(lambda words: scan_parse(grammar, words), sentences)
+        index_time = time_it(lambda words: parser.parse(' '.join(words)), sentences)
+        print(f"{name:<28}{scan_time:>15.6f}{index_time:>15.6f}{scan_time / index_time:>12.1f}x")
+
+
+# Mide el pico de memoria (en bytes) de llenar la tabla para una frase
+def peak_memory(function, words: List[str]) -> int:
+    tracemalloc.start()
+    function(words)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+# Compara el motor de conjuntos contra el motor de máscaras de bits
+def run_engine_benchmark():
+    print("\n" + "=" * 70)
+    print("  MOTOR DE CONJUNTOS vs MOTOR DE BITS")
+    print("=" * 70)
+
+    rng = random.Random(2)
+    expression = load_cnf_quietly("1.txt")
+    english = load_cnf_quietly("grammar.txt")
+    synthetic = synthetic_cnf_grammar(300, 2000, 200, seed=7)
+    cases = [
+        ("1.txt (61 tokens)", expression, [("( id + id ) * id + " * 10 + "id").split()]),
+        ("grammar.txt (44 tokens)", english,
+         [("she eats a cake" + " with a fork in the oven" * 5).split()]),
+        ("sintética (40 tokens)", synthetic,
+         [[f"w{rng.randrange(200)}" for _ in range(40)]]),
+    ]
+
+    print(f"\n{'Gramática':<26}{'Conjuntos (s)':>14}{'Bits (s)':>11}{'NumPy (s)':>11}"
+          f"{'Memoria conj.':>15}{'Memoria bits':>14}")
+    print("-" * 91)
+    for name, grammar, sentences in cases:
+        set_parser = CYKParser(grammar, engine='set')
+        bit_parser = CYKParser(grammar, engine='bitset')
+        numpy_parser = CYKParser(grammar, engine='numpy') if np is not None else None
+
+        for words in sentences:
+            sentence = ' '.join(words)
+            assert set_parser.parse(sentence)[0] == bit_parser.parse(sentence)[0]
+            if numpy_parser is not None:
+                assert set_parser.parse(sentence)[0] == numpy_parser.parse(sentence)[0]
+
+        set_time = time_it(lambda words: set_parser.parse(' '.join(words)), sentences)
+        bit_time = time_it(lambda words: bit_parser.parse(' '.join(words)), sentences)
+        numpy_time = '-'
+        if numpy_parser is not None:
+            numpy_time = f"{time_it(lambda words: numpy_parser.parse(' '.join(words)), sentences):.4f}"
+        set_memory = peak_memory(lambda words: set_parser.parse(' '.join(words)), sentences[0])
+        bit_memory = peak_memory(lambda words: bit_parser.parse(' '.join(words)), sentences[0])
+        print(f"{name:<26}{set_time:>14.4f}{bit_time:>11.4f}{numpy_time:>11}"
+              f"{set_memory / 1024:>12.0f} KB{bit_memory / 1024:>11.0f} KB")
+
+
+# Mide cómo escala la conversión a CNF con el tamaño de la gramática. Se reporta aparte
+# el tiempo de los pasos de punto fijo (inútiles, epsilon y unitarias), porque los
+# pasos 4 y 5 son lineales en el tamaño de la gramática resultante
+def run_conversion_benchmark():
+    print("\n" + "=" * 70)
+    print("  CONVERSIÓN A CNF EN GRAMÁTICAS SINTÉTICAS")
+    print("=" * 70)
+
+    print(f"\n{'Producciones':>14}{'CNF':>10}{'Pasos 1-3 (s)':>16}{'Total (s)':>12}{'µs / producción':>18}")
+    print("-" * 70)
+    for productions in (10_000, 30_000, 100_000):
+        grammar = synthetic_cfg(productions, seed=productions)
+
+        converter = CNFConverter(grammar)
+        start = time.perf_counter()
+        converter._eliminate_useless_symbols()
+        converter._eliminate_epsilon_productions()
+        converter._eliminate_unit_productions()
+        fixed_point_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cnf = CNFConverter(grammar).convert_to_cnf(verbose=False)
+        elapsed = time.perf_counter() - start
+        cnf_size = sum(len(prods) for prods in cnf.productions.values())
+        print(f"{productions:>14}{cnf_size:>10}{fixed_point_time:>16.3f}{elapsed:>12.3f}"
+              f"{elapsed / productions * 1e6:>18.1f}")
+
+
+# Gramática con una regla larga de k símbolos anulables: S -> A1 ... Ak, Ai -> ai | e,
+# más una regla recursiva para poder analizar frases largas
+def nullable_rich_grammar(k: int) -> Grammar:
+    grammar = Grammar()
+    grammar.add_production('S', [f"A{i}" for i in range(1, k + 1)])
+    grammar.add_production('S', ['S', 'S'])
+    for i in range(1, k + 1):
+        grammar.add_production(f"A{i}", [f"a{i}"])
+        grammar.add_production(f"A{i}", ['e'])
+    return grammar
+
+
+# Compara eliminar epsilon antes de binarizar (2^k variantes) contra binarizar primero
+def run_epsilon_benchmark():
+    print("\n" + "=" * 70)
+    print("  ELIMINACIÓN DE EPSILON: DEL→BIN vs BIN→DEL")
+    print("=" * 70)
+
+    print(f"\n{'k':>4}{'Reglas DEL→BIN':>16}{'Reglas BIN→DEL':>16}"
+          f"{'Conv. DEL→BIN':>15}{'Conv. BIN→DEL':>15}{'Parse DEL→BIN':>15}{'Parse BIN→DEL':>15}")
+    print("-" * 96)
+    for k in (4, 8, 12, 14):
+        grammar = nullable_rich_grammar(k)
+        words = [f"a{i}" for i in range(1, k + 1, 2)] * 3
+        row = []
+        for binarize_first in (False, True):
+            start = time.perf_counter()
+            cnf = CNFConverter(grammar).convert_to_cnf(verbose=False, binarize_first=binarize_first)
+            conversion_time = time.perf_counter() - start
+            parser = CYKParser(cnf)
+            assert parser.parse(' '.join(words))[0]
+            parse_time = time_it(lambda w: parser.parse(' '.join(w)), [words] * 3)
+            rules = sum(len(prods) for prods in cnf.productions.values())
+            row.append((rules, conversion_time, parse_time))
+
+        (old_rules, old_conversion, old_parse), (new_rules, new_conversion, new_parse) = row
+        print(f"{k:>4}{old_rules:>16}{new_rules:>16}{old_conversion:>15.4f}{new_conversion:>15.4f}"
+              f"{old_parse:>15.4f}{new_parse:>15.4f}")
+
+
+# Ambigüedad de adjunción de frases preposicionales: grammar.txt solo adjunta PP al
+# verbo, así que se le agrega NP -> NP PP. La cantidad de árboles crece como los números
+# de Catalan, pero el bosque compartido es polinomial. Se compara con la memoria de las
+# listas completas de back pointers de la versión original
+def run_forest_benchmark():
+    print("\n" + "=" * 70)
+    print("  BOSQUE COMPARTIDO (SPPF) EN FRASES AMBIGUAS")
+    print("=" * 70)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        grammar = load_grammar_from_file("grammar.txt")
+    grammar.add_production('NP', ['NP', 'PP'])
+    english = CNFConverter(grammar).convert_to_cnf(verbose=False)
+    parser = CYKParser(english)
+
+    print(f"\n{'PPs':>4}{'Árboles':>22}{'Nodos':>8}{'Alternativas':>14}{'Bosque (s)':>12}"
+          f"{'Memoria bosque':>16}{'Memoria listas':>16}")
+    print("-" * 92)
+    for pps in (2, 5, 10, 20):
+        words = ("he eats the cake" + " with a fork" * pps).split()
+        sentence = ' '.join(words)
+
+        start = time.perf_counter()
+        forest = parser.parse_forest(sentence)
+        trees = forest.count()
+        forest_time = time.perf_counter() - start
+
+        forest_memory = peak_memory(lambda w: parser.parse_forest(' '.join(w)).count(), words)
+        list_memory = peak_memory(lambda w: scan_parse(english, w), words)
+        print(f"{pps:>4}{trees:>22}{len(forest.nodes):>8}{forest.packed_count():>14}{forest_time:>12.4f}"
+              f"{forest_memory / 1024:>13.0f} KB{list_memory / 1024:>13.0f} KB")
+
+
+# CKY probabilístico sobre una gramática sintética ponderada: cuánto se achican las
+# celdas con la poda por haz y si el mejor árbol sobrevive a la poda
+def run_viterbi_benchmark():
+    print("\n" + "=" * 70)
+    print("  VITERBI CON PODA POR HAZ")
+    print("=" * 70)
+
+    rng = random.Random(3)
+    grammar = synthetic_cnf_grammar(60, 1500, 200, seed=11, weighted=True)
+    sentences = [[f"w{rng.randrange(200)}" for _ in range(30)] for _ in range(3)]
+    exact = CYKParser(grammar, engine='viterbi')
+    best_scores = []
+    for words in sentences:
+        exact.parse(' '.join(words))
+        best_scores.append(exact.best_log_prob)
+
+    print(f"\n{'Poda':<26}{'Tiempo (s)':>12}{'Descartados':>14}{'Mismo mejor árbol':>20}")
+    print("-" * 72)
+    for name, options in (("sin poda", {}), ("beam_threshold=1e-3", {'beam_threshold': 1e-3}),
+                          ("beam_width=20", {'beam_width': 20}), ("beam_width=5", {'beam_width': 5})):
+        parser = CYKParser(grammar, engine='viterbi', **options)
+        elapsed = time_it(lambda words: parser.parse(' '.join(words)), sentences)
+        pruned = 0
+        same = 0
+        for words, best in zip(sentences, best_scores):
+            parser.parse(' '.join(words))
+            pruned += parser.pruned_items
+            same += parser.best_log_prob == best
+        print(f"{name:<26}{elapsed:>12.4f}{pruned:>14}{same:>17}/{len(sentences)}")
+
+
+# Filtro de contexto: cuántos símbolos descarta de la tabla y cuánto acelera el llenado
+def run_filter_benchmark():
+    print("\n" + "=" * 70)
+    print("  FILTRO DE CONTEXTO (PRECEDE / SIGUE)")
+    print("=" * 70)
+
+    rng = random.Random(5)
+    cases = [
+        ("1.txt (61 tokens)", load_cnf_quietly("1.txt"), ("( id + id ) * id + " * 10 + "id").split()),
+        ("grammar.txt (44 tokens)", load_cnf_quietly("grammar.txt"),
+         ("she eats a cake" + " with a fork in the oven" * 5).split()),
+        ("sintética (40 tokens)", synthetic_cnf_grammar(300, 2000, 200, seed=7),
+         [f"w{rng.randrange(200)}" for _ in range(40)]),
+    ]
+
+    print(f"\n{'Gramática':<26}{'Sin filtro (s)':>15}{'Con filtro (s)':>15}{'Conservados':>13}{'Descartados':>13}")
+    print("-" * 82)
+    for name, grammar, words in cases:
+        sentence = ' '.join(words)
+        plain = CYKParser(grammar, engine='bitset')
+        filtered = CYKParser(grammar, engine='bitset', compiled=plain.compiled, context_filter=True)
+        assert plain.parse(sentence)[0] == filtered.parse(sentence)[0]
+
+        plain_time = time_it(lambda w: plain.parse(' '.join(w)), [words] * 3)
+        filtered_time = time_it(lambda w: filtered.parse(' '.join(w)), [words] * 3)
+        print(f"{name:<26}{plain_time:>15.4f}{filtered_time:>15.4f}"
+              f"{filtered.filter_kept:>13}{filtered.filter_pruned:>13}")
+
+
+# Tráfico con sub-expresiones y frases repetidas: 300 frases de 1.txt tomadas de 120
+# distintas, armadas con unos pocos términos frecuentes. Se compara sin caché, con caché
+# solo de frases completas y con caché de celdas y frases
+def run_cache_benchmark():
+    print("\n" + "=" * 70)
+    print("  CACHÉ DE CELDAS Y FRASES ENTRE ANÁLISIS")
+    print("=" * 70)
+
+    rng = random.Random(9)
+    expression = load_cnf_quietly("1.txt")
+    terms = ["id", "( id + id )", "id * id", "( id * ( id + id ) )", "( id + id * id )"]
+    distinct = [" + ".join(rng.choice(terms) for _ in range(rng.randint(3, 8))) for _ in range(120)]
+    sentences = [rng.choice(distinct) for _ in range(300)]
+
+    print(f"\n{'Motor':<10}{'Caché':<18}{'Tiempo (s)':>12}{'Aciertos celdas':>17}"
+          f"{'Aciertos frases':>17}{'Entradas':>10}")
+    print("-" * 84)
+    for engine in ('set', 'bitset'):
+        plain = CYKParser(expression, engine=engine)
+        for name, cache in (("ninguna", None), ("solo frases", SpanCache(spans=False)),
+                            ("celdas y frases", SpanCache(max_bytes=16 << 20))):
+            parser = CYKParser(expression, engine=engine, compiled=plain.compiled, span_cache=cache)
+            start = time.perf_counter()
+            for sentence in sentences:
+                parser.parse(sentence)
+            elapsed = time.perf_counter() - start
+
+            if cache is None:
+                print(f"{engine:<10}{name:<18}{elapsed:>12.4f}{'-':>17}{'-':>17}{'-':>10}")
+                continue
+            stats = cache.stats()
+            print(f"{engine:<10}{name:<18}{elapsed:>12.4f}{stats['span_hit_rate']:>16.0%}"
+                  f"{stats['sentence_hit_rate']:>16.0%}{stats['entries']:>11}")
+
+
+# Llenado en paralelo por frentes de onda contra el llenado secuencial del motor de bits,
+# con frases largas de 1.txt. La primera frase de cada pool solo lo pone en marcha. Con
+# menos núcleos que procesos no hay aceleración posible: la columna de trabajo relativo
+# (tiempo x procesos activos / tiempo secuencial) muestra entonces el costo extra del
+# reparto, que debe quedar cerca de 1
+def run_parallel_benchmark():
+    print("\n" + "=" * 70)
+    print("  LLENADO EN PARALELO POR FRENTES DE ONDA")
+    print("=" * 70)
+
+    expression = load_cnf_quietly("1.txt")
+    sequential = CYKParser(expression, engine='bitset')
+    cores = os.cpu_count() or 1
+    print(f"\nNúcleos disponibles: {cores}")
+    print(f"\n{'Palabras':>10}{'Procesos':>10}{'Tiempo (s)':>12}{'Aceleración':>13}{'Trabajo rel.':>14}")
+    print("-" * 59)
+    for terms in (50, 100):
+        sentence = " + ".join(["( id * id )"] * terms) + " + id"
+        n = len(sentence.split())
+        start = time.perf_counter()
+        sequential.parse(sentence)
+        base = time.perf_counter() - start
+        print(f"{n:>10}{'-':>10}{base:>12.4f}{1:>12.2f}x{1:>14.2f}")
+
+        for workers in (2, 4):
+            parser = CYKParser(expression, engine='bitset', compiled=sequential.compiled,
+                               parallel_workers=workers, parallel_threshold=1)
+            try:
+                parser.parse("id + id")
+                start = time.perf_counter()
+                accepted, _, _ = parser.parse(sentence)
+                elapsed = time.perf_counter() - start
+            finally:
+                parser.close()
+            assert accepted and parser.table.cells == sequential.table.cells
+            work = elapsed * min(workers, cores) / base
+            print(f"{n:>10}{workers:>10}{elapsed:>12.4f}{base / elapsed:>12.2f}x{work:>14.2f}")
+
+
+# Sesión incremental sobre frases largas de 1.txt: analizar la frase completa contra
+# agregar una palabra al final o reemplazar una del medio en una sesión abierta. Las
+# columnas de celdas cuentan las celdas recalculadas por cada edición
+def run_session_benchmark():
+    print("\n" + "=" * 70)
+    print("  SESIÓN INCREMENTAL: ANÁLISIS COMPLETO VS EDICIÓN")
+    print("=" * 70)
+
+    expression = load_cnf_quietly("1.txt")
+    parser = CYKParser(expression, engine='bitset')
+    words = ("( id + id ) * " * 70 + "id").split()
+
+    print(f"\n{'Palabras':>10}{'Completo (s)':>15}{'Agregar (s)':>14}{'Celdas':>10}"
+          f"{'Reemplazar (s)':>17}{'Celdas':>10}")
+    print("-" * 76)
+    for n in (50, 100, 200, 400):
+        start = time.perf_counter()
+        parser.parse(" ".join(words[:n]))
+        full = time.perf_counter() - start
+
+        session = parser.session(words[:n - 1])
+        start = time.perf_counter()
+        session.append(words[n - 1])
+        appended = time.perf_counter() - start
+        appended_cells = session.cells_computed
+
+        start = time.perf_counter()
+        session.replace(n // 2, words[n // 2])
+        replaced = time.perf_counter() - start
+
+        print(f"{n:>10}{full:>15.4f}{appended:>14.4f}{appended_cells:>10}"
+              f"{replaced:>17.4f}{session.cells_computed:>10}")
+
+
+# Léxicos grandes (50000 y 200000 reglas terminales): tiempo de carga, tiempo de la
+# conversión a CNF y pico de memoria. La columna de compartidas cuenta las reglas de la
+# CNF que reutilizan la misma tupla de la gramática original en lugar de copiarla
+def run_lexicon_benchmark():
+    print("\n" + "=" * 70)
+    print("  CARGA Y CONVERSIÓN DE LÉXICOS GRANDES")
+    print("=" * 70)
+
+    rng = random.Random(13)
+    print(f"\n{'Reglas':>10}{'Carga (s)':>12}{'CNF (s)':>10}{'Pico (MB)':>12}{'Compartidas':>14}")
+    print("-" * 58)
+    for size in (50000, 200000):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as file:
+            file.write("S -> NP VP\nNP -> D N | N\nVP -> V NP | V\n")
+            for i in range(size):
+                file.write(f"{rng.choice('DNV')} -> w{i % (size // 2)}\n")
+        try:
+            tracemalloc.start()
+            start = time.perf_counter()
+            grammar = load_grammar_from_file(file.name, verbose=False)
+            loaded = time.perf_counter()
+            cnf = CNFConverter(grammar).convert_to_cnf(verbose=False)
+            converted = time.perf_counter()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            os.unlink(file.name)
+
+        # Reglas de la CNF que son la misma tupla que en la gramática original (no copiadas)
+        original = {id(rhs) for productions in grammar.productions.values() for rhs in productions}
+        shared = sum(id(rhs) in original for productions in cnf.productions.values() for rhs in productions)
+        print(f"{size:>10}{loaded - start:>12.3f}{converted - loaded:>10.3f}"
+              f"{peak / (1 << 20):>12.1f}{shared:>14}")
+
+
+# Gramática sintética con ambigüedad controlada. Cada regla estructural empieza con un
+# terminal marcador propio y cada no-terminal tiene su propio terminal léxico, así que con
+# ambiguity=0 la gramática es LL(1) y por lo tanto no ambigua. ambiguity es la fracción de
+# no-terminales que reciben además X -> X X, cuya cantidad de árboles crece como los
+# números de Catalan con la cantidad de X seguidas
+def synthetic_ambiguous_cfg(non_terminals: int, rules: int, ambiguity: float, seed: int = 0) -> Grammar:
+    rng = random.Random(seed)
+    symbols = ['S'] + [f"N{i}" for i in range(1, non_terminals)]
+    grammar = Grammar()
+
+    for i, lhs in enumerate(symbols):
+        grammar.add_production(lhs, [f"t{i}"])
+    for lhs in rng.sample(symbols, round(ambiguity * non_terminals)):
+        grammar.add_production(lhs, [lhs, lhs])
+
+    for marker in range(max(0, rules - sum(len(prods) for prods in grammar.productions.values()))):
+        rhs = [f"m{marker}"] + [rng.choice(symbols) for _ in range(rng.randint(1, 2))]
+        grammar.add_production(rng.choice(symbols), rhs)
+
+    return grammar
+
+
+# Genera frases de una longitud exacta a partir de una gramática CNF: lengths[n] guarda
+# los símbolos que generan alguna cadena de n palabras, y el muestreo solo elige reglas
+# y divisiones que pueden completar la longitud pedida
+class SentenceSampler:
+    def __init__(self, grammar: Grammar, max_length: int, seed: int = 0):
+        self.grammar = grammar
+        self.rng = random.Random(seed)
+        self.lexical = defaultdict(list)
+        self.binary = defaultdict(list)
+        for lhs, productions in grammar.productions.items():
+            for rhs in productions:
+                if len(rhs) == 1 and rhs[0] in grammar.terminals:
+                    self.lexical[lhs].append(rhs[0])
+                elif len(rhs) == 2:
+                    self.binary[lhs].append((rhs[0], rhs[1]))
+        self.vocabulary = sorted(grammar.terminals)
+
+        self.lengths: List[Set[str]] = [set(), set(self.lexical)]
+        for n in range(2, max_length + 1):
+            self.lengths.append({lhs for lhs, rules in self.binary.items()
+                                 if any(B in self.lengths[k] and C in self.lengths[n - k]
+                                        for B, C in rules for k in range(1, n))})
+
+    def _expand(self, symbol: str, n: int, words: List[str]):
+        if n == 1:
+            words.append(self.rng.choice(self.lexical[symbol]))
+            return
+        options = [(B, C, k) for B, C in self.binary[symbol] for k in range(1, n)
+                   if B in self.lengths[k] and C in self.lengths[n - k]]
+        B, C, k = self.rng.choice(options)
+        self._expand(B, k, words)
+        self._expand(C, n - k, words)
+
+    # Longitud generable más cercana a n (por ejemplo, 1.txt solo genera longitudes impares)
+    def nearest_length(self, n: int) -> Optional[int]:
+        start = self.grammar.start_symbol
+        for delta in range(len(self.lengths)):
+            for candidate in (n - delta, n + delta):
+                if 0 < candidate < len(self.lengths) and start in self.lengths[candidate]:
+                    return candidate
+        return None
+
+    # Frases aceptadas de n palabras (lista vacía si la gramática no genera esa longitud)
+    def accepted(self, n: int, count: int) -> List[str]:
+        if self.grammar.start_symbol not in self.lengths[n]:
+            return []
+        sentences = []
+        for _ in range(count):
+            words: List[str] = []
+            self._expand(self.grammar.start_symbol, n, words)
+            sentences.append(' '.join(words))
+        return sentences
+
+    # Frases rechazadas de n palabras: se altera una palabra de una frase aceptada (o se
+    # eligen palabras al azar) hasta que el parser la rechace
+    def rejected(self, n: int, count: int, parser: CYKParser, attempts: int = 200) -> List[str]:
+        base = self.accepted(n, count)
+        sentences = []
+        for index in range(count):
+            for _ in range(attempts):
+                if base:
+                    words = base[index].split()
+                    words[self.rng.randrange(n)] = self.rng.choice(self.vocabulary)
+                else:
+                    words = [self.rng.choice(self.vocabulary) for _ in range(n)]
+                sentence = ' '.join(words)
+                if not parser.recognize(sentence)[0]:
+                    sentences.append(sentence)
+                    break
+        return sentences
+
+
+# Cantidad de ítems (símbolo, subcadena) que dejó el último análisis en la tabla
+def chart_items(parser) -> int:
+    if isinstance(parser, EarleyParser):
+        return sum(len(items) for items in parser.sets)
+    table = parser.table
+    if parser.engine == 'numpy':
+        return int(table.sum())
+    if parser.engine == 'bitset':
+        return sum(bin(cell).count('1') for cell in table.cells)
+    return sum(len(cell) for cell in table.cells)
+
+
+# Gramáticas de la suite: las de referencia del proyecto y dos sintéticas del mismo
+# tamaño, una no ambigua y otra ambigua
+def suite_grammars() -> Dict[str, Grammar]:
+    grammars = {}
+    for filename in ("grammar.txt", "1.txt"):
+        with contextlib.redirect_stdout(io.StringIO()):
+            grammars[filename] = load_grammar_from_file(filename, verbose=False)
+    grammars["sintética-no-ambigua"] = synthetic_ambiguous_cfg(30, 150, 0.0, seed=1)
+    grammars["sintética-ambigua"] = synthetic_ambiguous_cfg(30, 150, 0.5, seed=1)
+    return grammars
+
+
+# Suite de regresión: para cada gramática mide la conversión a CNF y, para cada motor y
+# longitud, el tiempo de análisis, los ítems de la tabla y el pico de memoria con frases
+# aceptadas y rechazadas. Los resultados se guardan en JSON para comparar versiones
+def run_suite(output_path: str, lengths: List[int], sentences: int = 5, seed: int = 0,
+              repeat: int = 3) -> dict:
+    print("=" * 70)
+    print("  SUITE DE REGRESIÓN")
+    print("=" * 70)
+
+    engines = ['set', 'bitset'] + (['numpy'] if np is not None else []) + ['viterbi', 'earley']
+    report = {'format': 1, 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(), 'numpy': np is not None,
+              'lengths': lengths, 'sentences': sentences, 'seed': seed, 'repeat': repeat,
+              'grammars': [], 'results': []}
+
+    print(f"\n{'Gramática':<22}{'Motor':<9}{'n':>5}{'Tipo':>11}{'Tiempo (ms)':>13}{'Ítems':>10}{'Memoria':>12}")
+    print("-" * 82)
+    for name, original in suite_grammars().items():
+        conversion_times = []
+        for _ in range(3):
+            start = time.perf_counter()
+            cnf = CNFConverter(original).convert_to_cnf(verbose=False)
+            conversion_times.append(time.perf_counter() - start)
+
+        sampler = SentenceSampler(cnf, max(lengths) + 2, seed=seed)
+        checker = CYKParser(cnf, engine='bitset')
+        grammar_entry = {'name': name,
+                         'productions': sum(len(prods) for prods in original.productions.values()),
+                         'cnf_productions': sum(len(prods) for prods in cnf.productions.values()),
+                         'conversion_s': min(conversion_times), 'lengths': []}
+        report['grammars'].append(grammar_entry)
+
+        cases = []
+        for n in lengths:
+            # Si la gramática no genera frases de n palabras se usa la longitud más cercana
+            actual = sampler.nearest_length(n) or n
+            accepted = sampler.accepted(actual, sentences)
+            rejected = sampler.rejected(actual, sentences, checker)
+            trees = [checker.parse_forest(sentence).count() for sentence in accepted]
+            grammar_entry['lengths'].append({
+                'length': n, 'sentence_length': actual, 'accepted': len(accepted), 'rejected': len(rejected),
+                'trees_log10_mean': sum(math.log10(t) for t in trees) / len(trees) if trees else None})
+            cases.append((n, accepted, rejected))
+
+        for engine in engines:
+            if engine == 'earley':
+                parser = EarleyParser(original)
+            else:
+                parser = CYKParser(cnf, engine=engine, compiled=checker.compiled if engine != 'viterbi' else None)
+
+            for n, accepted, rejected in cases:
+                for kind, batch in (('accepted', accepted), ('rejected', rejected)):
+                    if not batch:
+                        continue
+                    times = []
+                    items = []
+                    for sentence in batch:
+                        # Mejor de varias repeticiones, para que la comparación no dependa del ruido
+                        best = math.inf
+                        for _ in range(repeat):
+                            start = time.perf_counter()
+                            result = parser.parse(sentence)
+                            best = min(best, time.perf_counter() - start)
+                        times.append(best)
+                        assert result[0] == (kind == 'accepted'), (name, engine, sentence)
+                        items.append(chart_items(parser))
+                    memory = peak_memory(lambda words: parser.parse(' '.join(words)), batch[0].split())
+
+                    record = {'grammar': name, 'engine': engine, 'length': n, 'kind': kind,
+                              'sentences': len(batch), 'parse_s_mean': sum(times) / len(times),
+                              'parse_s_max': max(times), 'items_mean': sum(items) / len(items),
+                              'peak_bytes': memory}
+                    report['results'].append(record)
+                    print(f"{name:<22}{engine:<9}{n:>5}{kind:>11}{record['parse_s_mean'] * 1000:>13.3f}"
+                          f"{record['items_mean']:>10.0f}{memory / 1024:>9.0f} KB")
+
+    with open(output_path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+    print(f"\n✓ Resultados guardados en {output_path}")
+    return report
+
+
+# Compara dos resultados de la suite y lista las mediciones que empeoraron más que
+# tolerance (proporción). Los cambios en la cantidad de ítems indican que cambió el
+# comportamiento del motor, no solo su velocidad
+def compare_suites(baseline_path: str, current_path: str, tolerance: float = 0.5,
+                   min_seconds: float = 2e-4) -> List[str]:
+    with open(baseline_path, 'r', encoding='utf-8') as file:
+        baseline = json.load(file)
+    with open(current_path, 'r', encoding='utf-8') as file:
+        current = json.load(file)
+
+    problems = []
+    old_grammars = {entry['name']: entry for entry in baseline['grammars']}
+    for entry in current['grammars']:
+        old = old_grammars.get(entry['name'])
+        if old and entry['conversion_s'] > max(old['conversion_s'] * (1 + tolerance),
+                                               old['conversion_s'] + min_seconds):
+            problems.append(f"{entry['name']}: conversión {old['conversion_s'] * 1000:.2f} ms -> "
+                            f"{entry['conversion_s'] * 1000:.2f} ms")
+
+    key = lambda record: (record['grammar'], record['engine'], record['length'], record['kind'])
+    old_results = {key(record): record for record in baseline['results']}
+    for record in current['results']:
+        old = old_results.get(key(record))
+        if old is None:
+            continue
+        label = f"{record['grammar']} / {record['engine']} / n={record['length']} / {record['kind']}"
+        if record['parse_s_mean'] > max(old['parse_s_mean'] * (1 + tolerance),
+                                        old['parse_s_mean'] + min_seconds):
+            problems.append(f"{label}: análisis {old['parse_s_mean'] * 1000:.3f} ms -> "
+                            f"{record['parse_s_mean'] * 1000:.3f} ms")
+        if record['items_mean'] != old['items_mean']:
+            problems.append(f"{label}: ítems {old['items_mean']:.0f} -> {record['items_mean']:.0f}")
+
+    print(f"\nComparación con {baseline_path}:")
+    for problem in problems:
+        print(f"  ⚠ {problem}")
+    if not problems:
+        print("  ✓ Sin regresiones")
+    return problems
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmarks del parser CYK")
+    arg_parser.add_argument('--suite', metavar='ARCHIVO',
+                            help="ejecuta la suite de regresión y guarda los resultados en JSON")
+    arg_parser.add_argument('--compare', metavar='ARCHIVO',
+                            help="resultados anteriores de la suite contra los que comparar")
+    arg_parser.add_argument('--tolerance', type=float, default=0.5,
+                            help="aumento de tiempo tolerado al comparar (0.5 = 50%%)")
+    arg_parser.add_argument('--lengths', type=int, nargs='+', default=[5, 10, 20, 40],
+                            help="longitudes de frase de la suite")
+    arg_parser.add_argument('--sentences', type=int, default=5,
+                            help="frases aceptadas y rechazadas por longitud")
+    arg_parser.add_argument('--repeat', type=int, default=3,
+                            help="repeticiones por frase (se guarda el mejor tiempo)")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    if args.suite:
+        run_suite(args.suite, args.lengths, args.sentences, args.seed, args.repeat)
+        if args.compare and compare_suites(args.compare, args.suite, args.tolerance):
+            sys.exit(1)
+        sys.exit(0)
+
+    run_index_benchmark()
+    run_engine_benchmark()
+    run_conversion_benchmark()
+    run_epsilon_benchmark()
+    run_forest_benchmark()
+    run_viterbi_benchmark()
+    run_filter_benchmark()
+    run_cache_benchmark()
+    run_parallel_benchmark()
+    run_session_benchmark()
+    run_lexicon_benchmark()
@@ -0,0 +1,544 @@
+import asyncio
+import json
+import math
+import os
+import pickle
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from CYK import (CACHE_FORMAT_VERSION, CACHE_MAGIC, CNFConverter, CompiledGrammar, CYKParser, EarleyParser,
+                 Grammar, ParseServer, SpanCache, Tokenizer, compiled_grammar_path, grammar_source_hash,
+                 load_cnf_grammar, load_compiled_grammar, load_grammar_from_file)
+
+
+# Gramática de expresiones de 1.txt convertida a CNF
+def expression_grammar():
+    return CNFConverter(load_grammar_from_file('1.txt', verbose=False)).convert_to_cnf(verbose=False)
+
+
+# Gramática a partir de reglas 'A -> b C' separadas por ';'
+def grammar_from_rules(rules: str) -> Grammar:
+    grammar = Grammar()
+    for rule in rules.split(';'):
+        lhs, rhs = rule.split('->')
+        grammar.add_production(lhs.strip(), rhs.split())
+    return grammar
+
+
+# Hojas del árbol en orden, sin las marcas de epsilon
+def tree_yield(tree) -> list:
+    return [node.symbol for node, _, _ in tree._preorder() if not node.children and node.symbol != 'ε']
+
+
+# Gramática ponderada con adjunción ambigua de PP, una regla unitaria (NP -> Pron), una
+# regla larga (VP -> V NP PP) y palabras con más de una categoría
+WEIGHTED_RULES = """
+S -> NP VP 1.0
+VP -> V NP 0.5
+VP -> VP PP 0.3
+VP -> V NP PP 0.2
+NP -> NP PP 0.3
+NP -> D N 0.5
+NP -> Pron 0.2
+Pron -> she 1.0
+PP -> P NP 1.0
+V -> eats 0.98
+V -> fork 0.02
+D -> a 1.0
+N -> cake 0.7
+N -> fork 0.25
+N -> eats 0.05
+P -> with 1.0
+"""
+
+
+def weighted_grammar() -> Grammar:
+    grammar = Grammar()
+    for line in WEIGHTED_RULES.strip().splitlines():
+        lhs, _, *rhs, weight = line.split()
+        grammar.add_production(lhs, rhs, float(weight))
+    return grammar
+
+
+# Log-probabilidades de todas las derivaciones de `symbol` sobre words[start:end],
+# enumeradas por fuerza bruta sobre la gramática original (sin ciclos ni epsilon)
+def brute_force_scores(grammar, symbol, words, start, end) -> list:
+    if symbol not in grammar.productions:
+        return [0.0] if end == start + 1 and words[start] == symbol else []
+    scores = []
+    for rhs in grammar.productions[symbol]:
+        for rest in split_scores(grammar, rhs, words, start, end):
+            scores.append(math.log(grammar.weight(symbol, rhs)) + rest)
+    return scores
+
+
+def split_scores(grammar, rhs, words, start, end) -> list:
+    if len(rhs) == 1:
+        return brute_force_scores(grammar, rhs[0], words, start, end)
+    scores = []
+    for split in range(start + 1, end - len(rhs) + 2):
+        for first in brute_force_scores(grammar, rhs[0], words, start, split):
+            for rest in split_scores(grammar, rhs[1:], words, split, end):
+                scores.append(first + rest)
+    return scores
+
+
+class GrammarCopyTest(unittest.TestCase):
+    # La copia comparte listas y pesos hasta la primera escritura de cualquiera de las dos
+    def test_copy_is_independent(self):
+        grammar = Grammar()
+        grammar.add_production('E', ['id'], 0.5)
+        copy = grammar.copy()
+
+        copy.add_production('E', ['id', 'id'])
+        copy.add_production('E', ['(', 'id', ')'], 0.25)
+        self.assertEqual(grammar.productions['E'], [('id',)])
+        self.assertEqual(grammar.weights, {('E', ('id',)): 0.5})
+
+        grammar.add_production('E', ['id', '+', 'id'], 0.75)
+        self.assertEqual(copy.productions['E'], [('id',), ('id', 'id'), ('(', 'id', ')')])
+        self.assertNotIn(('E', ('id', '+', 'id')), copy.weights)
+        self.assertEqual(copy.weight('E', ['(', 'id', ')']), 0.25)
+
+
+class TokenizerTest(unittest.TestCase):
+    # Comparaciones con terminales de varios caracteres, declarados al final del archivo:
+    # sin %terminals la heurística trataría '12' y '<=' como no-terminales
+    GRAMMAR = "S -> Num Op Num\nNum -> 12 | 1 | 2\nOp -> <= | < | Cmp\nCmp -> ==\n%terminals 12 1 2 <= < == Cmp\n"
+
+    def setUp(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as file:
+            file.write(self.GRAMMAR)
+        self.addCleanup(os.unlink, file.name)
+        self.grammar = load_grammar_from_file(file.name, verbose=False)
+
+    # Los símbolos ya leídos se reclasifican; uno con producciones sigue siendo no-terminal
+    def test_terminals_declared_after_productions(self):
+        self.assertEqual(self.grammar.terminals, {'12', '1', '2', '<=', '<', '=='})
+        self.assertEqual(self.grammar.non_terminals, {'S', 'Num', 'Op', 'Cmp'})
+
+        grammar = Grammar()
+        grammar.add_production('S', ['x', 'Y'])
+        grammar.declare_terminals(['Y'])
+        grammar.add_production('S', ['Z'])
+        self.assertEqual(grammar.terminals, {'Y'})
+        self.assertEqual(grammar.non_terminals, {'S', 'x', 'Z'})
+
+    def test_longest_match(self):
+        tokenizer = Tokenizer.for_grammar(self.grammar, 'longest')
+        self.assertEqual(tokenizer.tokenize('12<=1'), ['12', '<=', '1'])
+        self.assertEqual(tokenizer.tokenize('1<2'), ['1', '<', '2'])
+        self.assertEqual(tokenizer.tokenize('121'), ['12', '1'])
+        self.assertEqual(tokenizer.tokenize('1 == 2'), ['1', '==', '2'])
+        self.assertEqual(tokenizer.tokenize('1<x2'), ['1', '<', 'x', '2'])
+        self.assertEqual(tokenizer.encode('1<x2')[2], -1)
+
+        parser = CYKParser(CNFConverter(self.grammar).convert_to_cnf(verbose=False), tokenizer=tokenizer)
+        self.assertTrue(parser.parse('12<=1')[0])
+        self.assertTrue(parser.parse('2==12')[0])
+        self.assertFalse(parser.parse('12')[0])
+
+    def test_other_strategies(self):
+        self.assertEqual(Tokenizer.for_grammar(self.grammar).tokenize(' 12  <= 1 '), ['12', '<=', '1'])
+        self.assertEqual(Tokenizer.for_grammar(self.grammar, 'regex', pattern=r'\d+|[<=]+').tokenize('12<=1'),
+                         ['12', '<=', '1'])
+        self.assertEqual(Tokenizer.for_grammar(self.grammar, 'chars').tokenize('1 < 2'), ['1', '<', '2'])
+        self.assertEqual(Tokenizer(lowercase=True).tokenize('ID + Id'), ['id', '+', 'id'])
+        self.assertEqual(Tokenizer(lowercase=False).tokenize('ID + Id'), ['ID', '+', 'Id'])
+
+        with self.assertRaises(ValueError):
+            Tokenizer('longest')
+        with self.assertRaises(ValueError):
+            Tokenizer('regex')
+        with self.assertRaises(ValueError):
+            Tokenizer('words')
+
+
+# Objeto que al deserializarse con pickle crea un archivo
+class CreateFileOnLoad:
+    def __init__(self, path):
+        self.path = path
+
+    def __reduce__(self):
+        return open, (self.path, 'w')
+
+
+class CompiledCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    # La segunda carga sale del JSON y debe dar los mismos índices, pesos y árboles
+    def test_round_trip(self):
+        weighted = os.path.join(self.directory, 'weighted.txt')
+        with open(weighted, 'w', encoding='utf-8') as file:
+            for line in WEIGHTED_RULES.strip().splitlines():
+                lhs, arrow, *rhs, weight = line.split()
+                file.write(f"{lhs} {arrow} {' '.join(rhs)} [{weight}]\n")
+
+        for filename, sentence in (('1.txt', '( id + id ) * id'), (weighted, 'she eats a cake with a fork')):
+            with self.subTest(grammar=filename):
+                grammar, compiled = load_cnf_grammar(filename, self.directory, verbose=False)
+                cached = load_compiled_grammar(compiled_grammar_path(filename, grammar_source_hash(filename), self.directory),
+                                               grammar_source_hash(filename))
+                self.assertIsNotNone(cached)
+                cached_grammar, cached_compiled = cached
+                self.assertEqual(cached_grammar.to_dict(), grammar.to_dict())
+                self.assertEqual(cached_compiled.to_dict(), compiled.to_dict())
+                self.assertEqual(cached_compiled.pair_masks, compiled.pair_masks)
+                self.assertEqual(cached_compiled.rules_by_lhs, compiled.rules_by_lhs)
+
+                for engine in ('set', 'bitset', 'viterbi'):
+                    fresh = CYKParser(grammar, engine=engine, compiled=compiled).parse(sentence)[1]
+                    loaded = CYKParser(cached_grammar, engine=engine, compiled=cached_compiled).parse(sentence)[1]
+                    self.assertEqual(loaded.to_dict(), fresh.to_dict())
+
+    # Un archivo con la cabecera correcta pero con un pickle no se ejecuta: se recompila
+    def test_pickle_payload_is_not_loaded(self):
+        source_hash = grammar_source_hash('1.txt')
+        path = compiled_grammar_path('1.txt', source_hash, self.directory)
+        marker = os.path.join(self.directory, 'marker')
+        with open(path, 'wb') as file:
+            file.write(CACHE_MAGIC + CACHE_FORMAT_VERSION.to_bytes(4, 'little') + source_hash)
+            file.write(pickle.dumps(CreateFileOnLoad(marker)))
+
+        self.assertIsNone(load_compiled_grammar(path, source_hash))
+        grammar, compiled = load_cnf_grammar('1.txt', self.directory, verbose=False)
+        self.assertIsInstance(compiled, CompiledGrammar)
+        self.assertTrue(CYKParser(grammar, compiled=compiled).recognize('id + id')[0])
+        self.assertFalse(os.path.exists(marker))
+
+
+class CNFConverterTest(unittest.TestCase):
+    # Det -> the tiene la forma de un envoltorio de terminal, pero es una categoría del
+    # usuario: S -> the N debe usar un auxiliar (que tampoco se fusiona con Det)
+    def test_terminal_wrappers_do_not_reuse_original_categories(self):
+        grammar = grammar_from_rules('S -> the N ; S -> Det N N ; Det -> the ; N -> cake')
+        for minimize in (True, False):
+            with self.subTest(minimize=minimize):
+                cnf = CNFConverter(grammar).convert_to_cnf(verbose=False, minimize=minimize)
+                tree = CYKParser(cnf).parse('the cake')[1]
+                self.assertIn(tree.children[0].symbol, cnf.generated_non_terminals)
+                self.assertEqual(CYKParser(cnf).parse('the cake cake')[1].children[0].symbol, 'Det')
+                self.assertEqual(cnf.productions['Det'], [('the',)])
+
+
+class SpanCacheTest(unittest.TestCase):
+    # k_best usa el llenado de Viterbi: no debe leer las celdas que guardó otro motor
+    def test_k_best_after_parse_with_shared_cache(self):
+        grammar = expression_grammar()
+        sentence = 'id + id * ( id + id )'
+        for engine in ('set', 'bitset'):
+            with self.subTest(engine=engine):
+                parser = CYKParser(grammar, engine=engine, span_cache=SpanCache())
+                accepted, tree, _ = parser.parse(sentence)
+                self.assertTrue(accepted)
+
+                best = parser.k_best(sentence, 2)
+                self.assertEqual(len(best), 1)
+                self.assertEqual(best[0][1].to_dict(), CYKParser(grammar, engine='viterbi').k_best(sentence, 1)[0][1].to_dict())
+
+                # Y al revés: parse después de k_best sigue usando las celdas de su motor
+                self.assertTrue(parser.parse(sentence)[0])
+                self.assertFalse(parser.parse('id + * id')[0])
+
+    # Lo que sale de la caché no se comparte: modificar un árbol o una celda recibidos
+    # no debe cambiar los análisis siguientes
+    def test_results_are_not_shared(self):
+        grammar = expression_grammar()
+        sentence = 'id + id * ( id + id )'
+        for engine in ('set', 'viterbi'):
+            with self.subTest(engine=engine):
+                expected = CYKParser(grammar, engine=engine).parse(sentence)[1].to_dict()
+                parser = CYKParser(grammar, engine=engine, span_cache=SpanCache(min_length=2))
+                for _ in range(2):
+                    tree = parser.parse(sentence)[1]
+                    self.assertEqual(tree.to_dict(), expected)
+                    tree.children.clear()
+
+                # Las celdas de la tabla son las de la caché y no se pueden modificar
+                cell = parser.table.get(0, 2)
+                self.assertTrue(cell)
+                with self.assertRaises((AttributeError, TypeError)):
+                    if engine == 'set':
+                        cell.add('X')
+                    else:
+                        cell['X'] = 0.0
+                self.assertEqual(parser.parse(sentence + ' + id')[1].to_dict(),
+                                 CYKParser(grammar, engine=engine).parse(sentence + ' + id')[1].to_dict())
+
+
+class RecognizeTest(unittest.TestCase):
+    # Registra cuándo el llenado decide cortar: recognize usa la misma condición
+    def recognize_with_stops(self, parser, sentence):
+        stops = []
+        original = CYKParser._no_longer_spans
+
+        def record(first_empty, length):
+            stop = original(first_empty, length)
+            stops.append(stop)
+            return stop
+
+        with mock.patch.object(CYKParser, '_no_longer_spans', staticmethod(record)):
+            accepted = parser.recognize(sentence)[0]
+        return accepted, any(stops)
+
+    # b^8 como T T, T -> A A, A -> B B: las longitudes 3 y 5 a 7 quedan vacías pero el
+    # corte (longitud >= 2 * primera vacía - 1) no debe llegar antes de la 8. Con 'id id ...'
+    # las longitudes 2 y 3 quedan vacías y el llenado corta en la 3 y rechaza
+    def test_early_stop_agrees_with_parse(self):
+        powers = CNFConverter(grammar_from_rules('S -> T T ; T -> A A ; A -> B B ; B -> b')).convert_to_cnf(verbose=False)
+        expression = expression_grammar()
+        for engine in ('set', 'bitset', 'numpy'):
+            with self.subTest(engine=engine):
+                parser = CYKParser(powers, engine=engine)
+                sentence = ' '.join(['b'] * 8)
+                self.assertEqual(self.recognize_with_stops(parser, sentence), (True, False))
+                self.assertTrue(parser.parse(sentence)[0])
+                # Con 7 palabras la primera longitud vacía es 5 y el corte llegaría en la 9
+                self.assertEqual(self.recognize_with_stops(parser, ' '.join(['b'] * 7)), (False, False))
+
+                parser = CYKParser(expression, engine=engine)
+                sentence = ' '.join(['id'] * 12)
+                self.assertEqual(self.recognize_with_stops(parser, sentence), (False, True))
+                self.assertFalse(parser.parse(sentence)[0])
+                self.assertEqual(self.recognize_with_stops(parser, '( id + id ) * id'), (True, False))
+
+
+class ParseSessionTest(unittest.TestCase):
+    # Cada celda de la sesión debe ser igual a la del motor 'bitset' sobre la frase editada
+    def assert_matches_fresh_parse(self, session, fresh):
+        sentence = ' '.join(session.tokens)
+        accepted, tree, _ = fresh.parse(sentence)
+        self.assertEqual(session.accepted(), accepted)
+        n = len(session.tokens)
+        for i in range(n):
+            self.assertEqual(session.rows[i], [fresh.table.get(i, j) for j in range(n - i)], (sentence, i))
+        if accepted:
+            self.assertEqual(session.parse_tree().to_dict(), tree.to_dict())
+
+    def test_insert_delete_replace(self):
+        grammar = expression_grammar()
+        parser = CYKParser(grammar, engine='bitset')
+        session = parser.session('id + id')
+        self.assertTrue(session.accepted())
+
+        # Agregar una palabra al final recalcula una celda por fila
+        for word in ('*', 'id'):
+            session.append(word)
+            self.assertEqual(session.cells_computed, len(session.tokens))
+            self.assert_matches_fresh_parse(session, parser)
+
+        self.assertTrue(session.insert(0, '( id ) *'))
+        self.assert_matches_fresh_parse(session, parser)
+
+        # ( id ) * id + id * id -> ( id ) * id + + * id -> ( id ) * id * id
+        self.assertFalse(session.replace(6, '+'))
+        self.assert_matches_fresh_parse(session, parser)
+
+        self.assertTrue(session.delete(5, 2))
+        self.assert_matches_fresh_parse(session, parser)
+
+        with self.assertRaises(IndexError):
+            session.delete(len(session.tokens))
+
+    # Ediciones al azar en cualquier posición, incluidas las que dejan la frase vacía
+    def test_random_edits(self):
+        parser = CYKParser(expression_grammar(), engine='bitset')
+        fresh = CYKParser(parser.grammar, engine='bitset')
+        rng = random.Random(3)
+        vocabulary = ['id', '+', '*', '(', ')']
+        session = parser.session()
+        for _ in range(200):
+            n = len(session.tokens)
+            operation = rng.choice(['insert', 'delete', 'replace'] if n else ['insert'])
+            position = rng.randrange(n + 1 if operation == 'insert' else n)
+            count = rng.randint(1, min(3, n - position)) if operation != 'insert' else rng.randint(1, 3)
+            words = [rng.choice(vocabulary) for _ in range(count)]
+            if operation == 'insert':
+                session.insert(position, words)
+            elif operation == 'delete':
+                session.delete(position, count)
+            else:
+                session.replace(position, words)
+            if session.tokens:
+                self.assert_matches_fresh_parse(session, fresh)
+            else:
+                self.assertFalse(session.accepted())
+
+
+class SpanChartTest(unittest.TestCase):
+    # Sin labels, la cobertura usa solo categorías de la gramática original
+    def test_default_cover_has_no_cnf_helpers(self):
+        original = load_grammar_from_file('1.txt', verbose=False)
+        grammar = CNFConverter(original).convert_to_cnf(verbose=False)
+        self.assertTrue(grammar.generated_non_terminals)
+
+        parser = CYKParser(grammar)
+        for sentence in ('id + * id', '( id + id', 'id id * ( id )', '+ id + id * id'):
+            with self.subTest(sentence=sentence):
+                chart = parser.chart(sentence)
+                self.assertFalse(chart.accepted())
+                cover = chart.minimal_cover()
+                self.assertEqual(cover[0][0], 0)
+                self.assertEqual(cover[-1][1], len(sentence.split()))
+                for start, end, label in cover:
+                    if label is None:
+                        self.assertEqual(end, start + 1)
+                    else:
+                        self.assertNotIn(label, grammar.generated_non_terminals)
+                        self.assertIn(label, original.non_terminals)
+                        self.assertTrue(chart.covers(label, start, end))
+
+
+class EarleyParserTest(unittest.TestCase):
+    # Cada nodo interno debe usar una regla de la gramática original y las hojas deben
+    # reproducir la frase
+    def assert_tree_from_grammar(self, grammar, tree, sentence):
+        self.assertEqual(tree.symbol, grammar.start_symbol)
+        self.assertEqual(tree_yield(tree), sentence.split())
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if not node.children:
+                continue
+            rhs = tuple(child.symbol for child in node.children)
+            if rhs == ('ε',):
+                self.assertTrue(any(CNFConverter._is_epsilon_production(rule)
+                                    for rule in grammar.productions[node.symbol]), node.symbol)
+            else:
+                self.assertIn(rhs, grammar.productions[node.symbol])
+            stack.extend(node.children)
+
+    # Producciones epsilon (anulables al predecir) y cadenas de reglas unitarias
+    def test_epsilon_and_unit_rules(self):
+        grammar = grammar_from_rules('S -> A B c ; S -> A ; A -> a A ; A -> e ; B -> b ; B -> D ; D -> e')
+        parser = EarleyParser(grammar)
+        for sentence in ('c', 'a', 'a a c', 'b c', 'a a b c'):
+            with self.subTest(sentence=sentence):
+                accepted, tree, _ = parser.parse(sentence)
+                self.assertTrue(accepted)
+                self.assert_tree_from_grammar(grammar, tree, sentence)
+        for sentence in ('b', 'c c', 'a b', 'c a'):
+            with self.subTest(sentence=sentence):
+                self.assertFalse(parser.recognize(sentence)[0])
+
+        # Ciclo de reglas unitarias: S -> T -> S no debe colgar la construcción del árbol
+        grammar = grammar_from_rules('S -> T ; T -> S ; T -> a ; S -> S a')
+        parser = EarleyParser(grammar)
+        accepted, tree, _ = parser.parse('a a a')
+        self.assertTrue(accepted)
+        self.assert_tree_from_grammar(grammar, tree, 'a a a')
+
+    # Recursión por la derecha: con Leo cada conjunto tiene una cantidad constante de ítems
+    # y el árbol profundo se arma sin agotar la pila de Python
+    def test_right_recursion_uses_leo_items(self):
+        grammar = grammar_from_rules('S -> a S ; S -> a')
+        parser = EarleyParser(grammar)
+        sentence = ' '.join(['a'] * 3000)
+        accepted, tree, _ = parser.parse(sentence)
+        self.assertTrue(accepted)
+        self.assertLess(sum(len(items) for items in parser.sets), 10 * 3000)
+        self.assert_tree_from_grammar(grammar, tree, sentence)
+        self.assertFalse(parser.recognize(sentence + ' S')[0])
+
+    # Gramática de expresiones original (sin CNF): mismo lenguaje que CYK
+    def test_agrees_with_cyk_on_expressions(self):
+        original = load_grammar_from_file('1.txt', verbose=False)
+        earley = EarleyParser(original)
+        cyk = CYKParser(expression_grammar())
+        for sentence in ('id', 'id + id * id', '( id + id ) * id', 'id + * id', '( id', 'id id'):
+            with self.subTest(sentence=sentence):
+                accepted, tree, _ = earley.parse(sentence)
+                self.assertEqual(accepted, cyk.recognize(sentence)[0])
+                if accepted:
+                    self.assert_tree_from_grammar(original, tree, sentence)
+
+
+class ViterbiTest(unittest.TestCase):
+    SENTENCES = ('she eats a cake', 'she eats a cake with a fork', 'she eats a cake with a fork with a cake')
+
+    # La mejor probabilidad y el orden de k_best coinciden con la enumeración de todas
+    # las derivaciones de la gramática original (la CNF ponderada no cambia los puntajes)
+    def test_best_and_k_best_match_brute_force(self):
+        original = weighted_grammar()
+        parser = CYKParser(CNFConverter(original).convert_to_cnf(verbose=False), engine='viterbi')
+        for sentence in self.SENTENCES:
+            with self.subTest(sentence=sentence):
+                words = sentence.split()
+                expected = sorted(brute_force_scores(original, 'S', words, 0, len(words)), reverse=True)
+
+                accepted, tree, _ = parser.parse(sentence)
+                self.assertTrue(accepted)
+                self.assertAlmostEqual(parser.best_log_prob, expected[0])
+                self.assertEqual(tree_yield(tree), words)
+
+                best = parser.k_best(sentence, len(expected) + 5)
+                self.assertEqual(len(best), len(expected))
+                for (score, _), wanted in zip(best, expected):
+                    self.assertAlmostEqual(score, wanted)
+                self.assertEqual(len({tree.to_bracketed() for _, tree in best}), len(best))
+                self.assertEqual(best[0][1].to_bracketed(), tree.to_bracketed())
+
+                top = parser.k_best(sentence, 2)
+                self.assertEqual([round(score, 9) for score, _ in top], [round(score, 9) for score in expected[:2]])
+
+    # La poda por umbral descarta las categorías improbables de las palabras ambiguas sin
+    # perder el mejor árbol
+    def test_beam_threshold_keeps_best_parse(self):
+        grammar = CNFConverter(weighted_grammar()).convert_to_cnf(verbose=False)
+        exact = CYKParser(grammar, engine='viterbi')
+        pruned = CYKParser(grammar, engine='viterbi', beam_threshold=0.1)
+        sentence = self.SENTENCES[-1]
+
+        accepted, tree, _ = exact.parse(sentence)
+        pruned_accepted, pruned_tree, _ = pruned.parse(sentence)
+        self.assertTrue(accepted and pruned_accepted)
+        self.assertGreater(pruned.pruned_items, 0)
+        self.assertEqual(pruned.best_log_prob, exact.best_log_prob)
+        self.assertEqual(pruned_tree.to_bracketed(), tree.to_bracketed())
+        self.assertEqual(pruned.k_best(sentence, 1)[0][0], exact.best_log_prob)
+
+
+class ParseServerTest(unittest.TestCase):
+    # Ida y vuelta por TCP: las respuestas pueden llegar en cualquier orden y se asocian por id
+    def test_round_trip(self):
+        server = ParseServer({'expr': expression_grammar()}, workers=1)
+        self.addCleanup(server.close)
+
+        async def exchange(lines):
+            await server.start('127.0.0.1:0')
+            port = server.server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(''.join(line + '\n' for line in lines).encode('utf-8'))
+            await writer.drain()
+            responses = [json.loads(await reader.readline()) for _ in lines]
+            writer.close()
+            await writer.wait_closed()
+            return responses
+
+        requests = [json.dumps({'id': 1, 'sentence': 'id + id * id', 'tree': True}),
+                    '{"id": 2, "sentence": ',
+                    json.dumps({'id': 3, 'sentence': 'id + * id'}),
+                    json.dumps({'id': 4, 'sentence': 'id', 'grammar': 'ingles'}),
+                    json.dumps({'id': 5, 'sentence': 'id + ' * 100 + 'id', 'timeout': 0.05})]
+        responses = asyncio.run(exchange(requests))
+        by_id = {response['id']: response for response in responses}
+        self.assertEqual(set(by_id), {1, None, 3, 4, 5})
+
+        self.assertTrue(by_id[1]['accepted'])
+        self.assertEqual(by_id[1]['grammar'], 'expr')
+        self.assertEqual(by_id[1]['tree']['symbol'], 'E')
+        self.assertIn('error', by_id[None])
+        self.assertFalse(by_id[3]['accepted'])
+        self.assertNotIn('error', by_id[3])
+        self.assertIn('ingles', by_id[4]['error'])
+        self.assertIn('Tiempo agotado', by_id[5]['error'])
+        self.assertEqual(server.timeouts, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()